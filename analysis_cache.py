@@ -0,0 +1,318 @@
+"""
+Cache disque des analyses normalisées, au format colonnes
+Chaque fichier de laboratoire est parsé une fois (en parallèle dans un pool de
+processus si plusieurs fichiers ont changé) puis relu depuis le cache tant que
+l'empreinte du fichier source ne change pas.
+"""
+
+import os
+import glob
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from typing import List, Dict, Any, Optional, Iterator, Iterable, Tuple
+import numpy as np
+from lab_parser import ANALYSIS_FIELDS, PARSER_VERSION, iter_lab_records
+
+class ColumnBuilder:
+    """
+    Accumule les analyses d'un fichier en colonnes compactes au fil de la lecture
+    (octets UTF-8 et tableaux typés, sans garder les dictionnaires des analyses)
+    """
+
+    def __init__(self):
+        self.size = 0
+        self._columns = {}
+        for field, field_type in ANALYSIS_FIELDS.items():
+            if field_type is float:
+                self._columns[field] = array('d')
+            elif field_type is bool:
+                self._columns[field] = array('b')
+            else:
+                self._columns[field] = (bytearray(), array('q', [0]))
+
+    def append(self, record: Dict[str, Any]):
+        """
+        Ajoute une analyse normalisée
+        """
+        for field, field_type in ANALYSIS_FIELDS.items():
+            value = record.get(field)
+            if field_type is float:
+                self._columns[field].append(np.nan if value is None else value)
+            elif field_type is bool:
+                self._columns[field].append(-1 if value is None else int(value))
+            else:
+                data, offsets = self._columns[field]
+                data += ('' if value is None else str(value)).encode('utf-8')
+                offsets.append(len(data))
+        self.size += 1
+
+    def finish(self, complete: bool = True) -> 'LabColumns':
+        """
+        Retourne les colonnes accumulées
+        """
+        arrays = {}
+        for field, field_type in ANALYSIS_FIELDS.items():
+            if field_type is float:
+                arrays[f"{field}.values"] = np.frombuffer(self._columns[field], dtype=np.float64)
+            elif field_type is bool:
+                arrays[f"{field}.values"] = np.frombuffer(self._columns[field], dtype=np.int8)
+            else:
+                data, offsets = self._columns[field]
+                arrays[f"{field}.data"] = np.frombuffer(bytes(data), dtype=np.uint8)
+                arrays[f"{field}.offsets"] = np.frombuffer(offsets, dtype=np.int64)
+        return LabColumns(arrays, complete)
+
+class LabColumns:
+    """
+    Analyses d'un fichier stockées en colonnes (tableaux NumPy, sans pickle) :
+    pour un champ texte, les textes UTF-8 concaténés et leurs positions de début ;
+    pour un champ typé, un tableau de valeurs (NaN ou -1 pour une valeur absente)
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], complete: bool = True):
+        self.arrays = arrays
+        self.size = len(arrays["titre.offsets"]) - 1
+        # False si le fichier source n'a pas pu être lu entièrement
+        self.complete = complete
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> 'LabColumns':
+        """
+        Construit les colonnes à partir d'analyses normalisées
+        """
+        builder = ColumnBuilder()
+        for record in records:
+            builder.append(record)
+        return builder.finish()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Décodage ligne par ligne depuis les positions : aucune colonne n'est convertie en liste
+        columns = []
+        for field, field_type in ANALYSIS_FIELDS.items():
+            if field_type is str:
+                columns.append((field, field_type, self.arrays[f"{field}.data"], self.arrays[f"{field}.offsets"]))
+            else:
+                columns.append((field, field_type, self.arrays[f"{field}.values"], None))
+
+        for i in range(self.size):
+            record = {}
+            for field, field_type, values, offsets in columns:
+                if field_type is float:
+                    value = float(values[i])
+                    record[field] = None if np.isnan(value) else value
+                elif field_type is bool:
+                    value = int(values[i])
+                    record[field] = None if value < 0 else bool(value)
+                else:
+                    record[field] = values[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+            yield record
+
+def file_digest(filepath: str) -> str:
+    """
+    Calcule l'empreinte d'un fichier source (contenu et version du parseur)
+    """
+    digest = hashlib.sha256(f"parser-v{PARSER_VERSION}\n".encode('utf-8'))
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def parse_to_columns(filepath: str) -> Tuple[Dict[str, np.ndarray], bool]:
+    """
+    Parse un fichier de laboratoire (exécutée dans un processus du pool)
+
+    Returns:
+        Couple (colonnes, True si le fichier a été lu entièrement)
+    """
+    builder = ColumnBuilder()
+    try:
+        for record in iter_lab_records(filepath):
+            builder.append(record)
+        complete = True
+    except Exception as e:
+        print(f"Erreur lors du chargement de {filepath}: {e}")
+        complete = False
+    return builder.finish().arrays, complete
+
+class AnalysisCache:
+    def __init__(self, directory: str):
+        """
+        Initialise le cache
+
+        Args:
+            directory: Répertoire des fichiers .npz
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, filepath: str, digest: str) -> str:
+        return os.path.join(self.directory, f"{os.path.basename(filepath)}.{digest[:16]}.npz")
+
+    def contains(self, filepath: str, digest: str) -> bool:
+        """
+        Indique si les colonnes d'un fichier sont en cache pour cette empreinte
+        """
+        return os.path.exists(self._path(filepath, digest))
+
+    def get(self, filepath: str, digest: str) -> Optional[LabColumns]:
+        """
+        Retourne les colonnes en cache d'un fichier, si son empreinte n'a pas changé
+        """
+        try:
+            with np.load(self._path(filepath, digest)) as data:
+                columns = LabColumns({name: data[name] for name in data.files})
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return columns
+
+    def put(self, filepath: str, digest: str, columns: LabColumns):
+        """
+        Enregistre les colonnes d'un fichier et supprime ses versions précédentes
+        """
+        path = self._path(filepath, digest)
+        for stale in glob.glob(os.path.join(self.directory, f"{glob.escape(os.path.basename(filepath))}.*.npz")):
+            if stale != path:
+                os.remove(stale)
+
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, **columns.arrays)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Retourne les statistiques d'utilisation du cache
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+def _pool_context():
+    """
+    Contexte des processus de parsing
+
+    Pas de fork : le serveur est multithreadé (initialisation et synchronisation en
+    arrière-plan, threads du serveur web, connexions SQLite, clients ChromaDB et OpenAI)
+    et un processus forké pourrait attendre indéfiniment un verrou détenu par un autre
+    thread au moment du fork. Les processus partent d'un interpréteur neuf ; ils
+    réimportent le script principal, qui n'y démarre pas l'initialisation (voir app.py).
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        # Le serveur de processus précharge le parseur plutôt que le script principal
+        context.set_forkserver_preload(['analysis_cache'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+def iter_lab_analyses(filepaths: List[str], cache: Optional[AnalysisCache] = None, max_workers: int = 1,
+                      failed_files: Optional[List[str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Lit les analyses de plusieurs fichiers, un fichier à la fois, depuis le cache ou en les parsant
+
+    Seules les colonnes du fichier en cours (et des fichiers parsés d'avance par le pool)
+    sont en mémoire : la mémoire ne dépend pas de la taille du compendium.
+
+    Args:
+        filepaths: Fichiers JSON des laboratoires
+        cache: Cache disque (None pour toujours parser)
+        max_workers: Processus de parsing (1 pour parser dans le processus courant)
+        failed_files: Liste complétée par les fichiers illisibles ou tronqués (optionnel)
+
+    Yields:
+        Couples (chemin du fichier, analyse normalisée), fichier par fichier
+    """
+    digests = {filepath: file_digest(filepath) for filepath in filepaths} if cache is not None else {}
+    to_parse = [filepath for filepath in filepaths if cache is None or not cache.contains(filepath, digests[filepath])]
+
+    executor = None
+    if max_workers > 1 and len(to_parse) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(max_workers, len(to_parse)), mp_context=_pool_context())
+    futures = {}
+    upcoming = iter(to_parse)
+
+    try:
+        for filepath in filepaths:
+            if executor is not None:
+                # Au plus max_workers fichiers parsés d'avance
+                while len(futures) < max_workers:
+                    next_file = next(upcoming, None)
+                    if next_file is None:
+                        break
+                    futures[next_file] = executor.submit(parse_to_columns, next_file)
+
+            columns = cache.get(filepath, digests[filepath]) if cache is not None else None
+            if columns is None and filepath in futures:
+                arrays, complete = futures.pop(filepath).result()
+                columns = LabColumns(arrays, complete)
+                # Un fichier illisible n'est pas mis en cache : il sera reparsé
+                if cache is not None and complete:
+                    cache.put(filepath, digests[filepath], columns)
+
+            if columns is not None:
+                if not columns.complete and failed_files is not None:
+                    failed_files.append(filepath)
+                for record in columns:
+                    yield filepath, record
+            else:
+                for record in _stream_lab_file(filepath, digests.get(filepath), cache, failed_files):
+                    yield filepath, record
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def _stream_lab_file(filepath: str, digest: Optional[str], cache: Optional[AnalysisCache],
+                     failed_files: Optional[List[str]]) -> Iterator[Dict[str, Any]]:
+    """
+    Parse un fichier dans le processus courant en transmettant les analyses au fil de la lecture
+    (colonnes accumulées pour le cache uniquement)
+    """
+    builder = ColumnBuilder() if cache is not None else None
+    try:
+        for record in iter_lab_records(filepath):
+            if builder is not None:
+                builder.append(record)
+            yield record
+    except Exception as e:
+        print(f"Erreur lors du chargement de {filepath}: {e}")
+        if failed_files is not None:
+            failed_files.append(filepath)
+        return
+
+    # Un fichier illisible n'est pas mis en cache : il sera reparsé
+    if builder is not None:
+        cache.put(filepath, digest, builder.finish())
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_analysis_cache() -> Optional[AnalysisCache]:
+    """
+    Retourne le cache des analyses partagé
+
+    Returns:
+        Cache, ou None si désactivé (ANALYSIS_CACHE_ENABLED=false)
+    """
+    global _shared_cache
+
+    if os.getenv('ANALYSIS_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            cache_path = os.getenv('ANALYSIS_CACHE_PATH', './analysis_cache')
+            # Sur Render, utiliser un répertoire temporaire si le chemin par défaut n'est pas accessible
+            if not os.access(os.path.dirname(cache_path) or '.', os.W_OK):
+                cache_path = '/tmp/analysis_cache'
+            _shared_cache = AnalysisCache(cache_path)
+        return _shared_cache
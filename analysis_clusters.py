@@ -0,0 +1,330 @@
+"""
+Regroupement hors ligne des analyses équivalentes entre laboratoires
+Les paires d'analyses de laboratoires différents les plus proches (embeddings) sont
+réunies par similarité décroissante, sans jamais réunir deux groupes qui ont déjà un
+laboratoire en commun. Un code LOINC commun est prioritaire sur la similarité, mais
+seul LHUB-ULB renseigne aujourd'hui ce code : cette étape ne réunira des analyses que
+lorsqu'un autre laboratoire fournira ses codes LOINC.
+Chaque groupe est une entrée canonique avec ses variantes par laboratoire ; il est
+recalculé dans un thread séparé quand la collection en service change.
+
+Usage: python analysis_clusters.py build|report [n]
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import threading
+from typing import List, Dict, Any, Tuple, Callable
+import numpy as np
+from compact_embeddings import read_embeddings, collection_fingerprint
+
+CLUSTER_FORMAT = 1
+
+# Code LOINC valide ("2345-7") ; exclut "-" et les codes multiples concaténés
+LOINC_PATTERN = re.compile(r"^\d{1,7}-\d$")
+
+# Lignes de la matrice de similarité calculées à la fois
+BLOCK_ROWS = 512
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def cluster_analyses(ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+                     threshold: float = 0.9, neighbors: int = 10) -> List[List[str]]:
+    """
+    Regroupe les analyses équivalentes
+
+    Args:
+        ids: Identifiants des analyses
+        embeddings: Matrice (n, dimension), dans l'ordre des ids
+        metadatas: Métadonnées des analyses (laboratoire, loinc)
+        threshold: Similarité cosinus minimale entre deux analyses réunies
+        neighbors: Voisins d'autres laboratoires examinés par analyse
+
+    Returns:
+        Groupes d'au moins deux analyses, l'analyse canonique en premier
+    """
+    n = len(ids)
+    parent = list(range(n))
+    labs = [{(metadata or {}).get('laboratoire', '')} for metadata in metadatas]
+    members = [[i] for i in range(n)]
+
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    lab_names = {}
+    lab_codes = np.asarray([lab_names.setdefault(next(iter(lab)), len(lab_names)) for lab in labs], dtype=np.int32)
+
+    # Paires (priorité, i, j) : un même code LOINC est une équivalence déclarée,
+    # prioritaire sur la similarité des embeddings (priorité 1 + similarité) ;
+    # sans effet tant qu'un seul laboratoire renseigne le code LOINC
+    pairs = set()
+    by_loinc = {}
+    for i, metadata in enumerate(metadatas):
+        loinc = (metadata or {}).get('loinc', '').strip()
+        if LOINC_PATTERN.match(loinc):
+            by_loinc.setdefault(loinc, []).append(i)
+    for same_loinc in by_loinc.values():
+        for a, i in enumerate(same_loinc):
+            for j in same_loinc[a + 1:]:
+                if lab_codes[i] != lab_codes[j]:
+                    pairs.add((1.0 + float(vectors[i] @ vectors[j]), i, j))
+
+    k = min(neighbors, n - 1)
+    for start in range(0, n if k > 0 else 0, BLOCK_ROWS):
+        sims = vectors[start:start + BLOCK_ROWS] @ vectors.T
+        sims[lab_codes[start:start + BLOCK_ROWS, None] == lab_codes[None, :]] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        for row, column in zip(*np.nonzero(top_sims >= threshold)):
+            i, j = start + int(row), int(top[row, column])
+            pairs.add((float(top_sims[row, column]), min(i, j), max(i, j)))
+
+    for priority, i, j in sorted(pairs, reverse=True):
+        root_i, root_j = _find(parent, i), _find(parent, j)
+        # Au plus une variante par laboratoire
+        if root_i == root_j or not labs[root_i].isdisjoint(labs[root_j]):
+            continue
+        # Sans code LOINC commun, toutes les variantes doivent être proches deux à deux
+        # (évite les chaînes A~B~C où A et C diffèrent) ; les groupes sont petits
+        if priority < 1.0 and (vectors[members[root_i]] @ vectors[members[root_j]].T).min() < threshold:
+            continue
+        parent[root_j] = root_i
+        labs[root_i] |= labs[root_j]
+        members[root_i].extend(members[root_j])
+
+    clusters = []
+    for root in range(n):
+        group = members[root]
+        if _find(parent, root) != root or len(group) < 2:
+            continue
+        # Analyse canonique : la plus proche en moyenne des autres variantes
+        block = vectors[group]
+        canonical = group[int(np.argmax((block @ block.T).sum(axis=1)))]
+        clusters.append([ids[canonical]] + sorted(ids[i] for i in group if i != canonical))
+    return sorted(clusters)
+
+class AnalysisClusters:
+    def __init__(self, path: str, threshold: float = 0.9):
+        """
+        Initialise le regroupement
+
+        Args:
+            path: Fichier JSON des groupes
+            threshold: Similarité cosinus minimale entre deux analyses réunies
+        """
+        self.path = path
+        self.threshold = threshold
+        # (groupes, dictionnaire id -> indice du groupe, empreinte)
+        self._data = None
+        self._lock = threading.Lock()
+        # Recalcul en arrière-plan (voir refresh)
+        self._worker = None
+        self._dirty = False
+        self._force = False
+        self._worker_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        data = self._data
+        return len(data[0]) if data else 0
+
+    def load(self, fingerprint: str) -> bool:
+        """
+        Lit les groupes enregistrés s'ils correspondent à la collection
+
+        Args:
+            fingerprint: Empreinte de la collection (voir collection_fingerprint)
+
+        Returns:
+            True si les groupes sont à jour
+        """
+        with self._lock:
+            if self._data and self._data[2] == fingerprint:
+                return True
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    stored = json.load(f)
+                if (stored.get('format') != CLUSTER_FORMAT or stored['fingerprint'] != fingerprint
+                        or stored['threshold'] != self.threshold):
+                    return False
+                clusters = stored['clusters']
+            except (OSError, ValueError, KeyError):
+                return False
+
+            membership = {analysis_id: index for index, members in enumerate(clusters) for analysis_id in members}
+            self._data = (clusters, membership, fingerprint)
+            return True
+
+    def build(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]], fingerprint: str):
+        """
+        Calcule les groupes et les enregistre (remplacement atomique du fichier)
+
+        Args:
+            ids: Identifiants des analyses
+            embeddings: Matrice (n, dimension)
+            metadatas: Métadonnées des analyses, dans l'ordre des ids
+            fingerprint: Empreinte de la collection
+        """
+        clusters = cluster_analyses(ids, embeddings, metadatas, self.threshold)
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'format': CLUSTER_FORMAT, 'fingerprint': fingerprint, 'threshold': self.threshold,
+                       'clusters': clusters}, f)
+        os.replace(tmp_path, self.path)
+
+        with self._lock:
+            self._data = None
+        self.load(fingerprint)
+
+    def refresh(self, get_collection: Callable[[], Any], force: bool = False, wait: bool = False):
+        """
+        Recalcule les groupes dans un thread séparé si la collection a changé
+
+        Les groupes précédents restent utilisés pendant le calcul ; une demande reçue
+        pendant un calcul en relance un autre à la fin de celui-ci.
+
+        Args:
+            get_collection: Retourne la collection en service au moment du calcul
+            force: Recalculer les groupes même s'ils sont à jour
+            wait: Attendre la fin du calcul
+        """
+        with self._worker_lock:
+            self._dirty = True
+            self._force = self._force or force
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, args=(get_collection,),
+                                                name='analysis-clusters', daemon=True)
+                self._worker.start()
+            worker = self._worker
+        if wait:
+            worker.join()
+
+    def _work(self, get_collection: Callable[[], Any]):
+        while True:
+            with self._worker_lock:
+                if not self._dirty:
+                    self._worker = None
+                    return
+                self._dirty = False
+                force, self._force = self._force, False
+
+            try:
+                collection = get_collection()
+                if collection.count() == 0:
+                    continue
+                start = time.time()
+                fingerprint = collection_fingerprint(collection)
+                if force or not self.load(fingerprint):
+                    ids, embeddings, metadatas = load_cluster_inputs(collection)
+                    self.build(ids, embeddings, metadatas, fingerprint)
+                    print(f"{len(self)} groupes d'analyses équivalentes construits en {time.time() - start:.2f}s")
+            except Exception as e:
+                # Les groupes précédents restent en service
+                print(f"Erreur lors du regroupement des analyses: {e}")
+
+    def members(self, analysis_id: str) -> List[str]:
+        """
+        Retourne les analyses équivalentes à une analyse (canonique en premier)
+
+        Args:
+            analysis_id: Identifiant de l'analyse
+
+        Returns:
+            Analyses du groupe, elle comprise ; liste vide si elle n'est regroupée avec aucune autre
+        """
+        data = self._data
+        if not data or analysis_id not in data[1]:
+            return []
+        return data[0][data[1][analysis_id]]
+
+def load_cluster_inputs(collection) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+    """
+    Lit les identifiants, embeddings et métadonnées d'une collection
+    """
+    ids, embeddings = read_embeddings(collection)
+    metadatas = []
+    for start in range(0, len(ids), 1000):
+        stored = collection.get(ids=ids[start:start + 1000], include=['metadatas'])
+        rows = dict(zip(stored['ids'], stored['metadatas']))
+        metadatas.extend(rows[analysis_id] for analysis_id in ids[start:start + 1000])
+    return ids, embeddings, metadatas
+
+def report(compendium_rag, n_examples: int = 10) -> Dict[str, Any]:
+    """
+    Résume les groupes de la collection en service (pour choisir le seuil)
+
+    Args:
+        compendium_rag: Système CompendiumRAG dont les groupes sont construits
+        n_examples: Nombre de groupes donnés en exemple
+
+    Returns:
+        Nombre de groupes, taille, répartition par nombre de laboratoires et exemples
+    """
+    clusters = compendium_rag.clusters
+    data = clusters._data if clusters is not None else None
+    if not data:
+        raise ValueError("Aucun regroupement chargé (COMPENDIUM_DIVERSE_RESULTS=false ou collection vide)")
+
+    stored = compendium_rag.collection.get(ids=[analysis_id for members in data[0] for analysis_id in members],
+                                           include=['metadatas'])
+    metadatas = dict(zip(stored['ids'], stored['metadatas']))
+    by_labs = {}
+    for members in data[0]:
+        n_labs = len({metadatas[analysis_id]['laboratoire'] for analysis_id in members if analysis_id in metadatas})
+        by_labs[n_labs] = by_labs.get(n_labs, 0) + 1
+
+    largest = sorted(data[0], key=len, reverse=True)
+    return {
+        'threshold': clusters.threshold,
+        'clusters': len(data[0]),
+        'grouped_analyses': len(data[1]),
+        'by_lab_count': dict(sorted(by_labs.items())),
+        'examples': [
+            [f"{metadatas[analysis_id]['laboratoire']}: {metadatas[analysis_id]['titre']}"
+             for analysis_id in members if analysis_id in metadatas]
+            for members in largest[:n_examples]
+        ]
+    }
+
+def main():
+    """
+    Point d'entrée en ligne de commande
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in ('build', 'report'):
+        print(__doc__)
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from compendium_rag import CompendiumRAG
+
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        print("❌ Erreur: OPENAI_API_KEY n'est pas défini")
+        sys.exit(1)
+
+    compendium_rag = CompendiumRAG(openai_api_key=openai_api_key)
+    if sys.argv[1] == 'build':
+        start = time.time()
+        compendium_rag.refresh_clusters(force=True, wait=True)
+        print(f"✅ {len(compendium_rag.clusters or [])} groupes d'analyses équivalentes en {time.time() - start:.1f}s")
+        return
+
+    results = report(compendium_rag, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    print(f"📊 Seuil {results['threshold']}: {results['clusters']} groupes, "
+          f"{results['grouped_analyses']} analyses regroupées")
+    for n_labs, count in results['by_lab_count'].items():
+        print(f"  {n_labs} laboratoire(s): {count} groupes")
+    for members in results['examples']:
+        print("  - " + " | ".join(members))
+
+if __name__ == "__main__":
+    main()
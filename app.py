@@ -4,11 +4,17 @@ Application Flask pour l'assistant médical français
 """
 
 import os
-from flask import Flask, render_template, request, jsonify
+import hmac
+import json
+import threading
+import multiprocessing
+from contextlib import contextmanager, ExitStack
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
-from rag_system import RAGSystem
-from compendium_rag import CompendiumRAG
+from response_cache import ResponseCache, SemanticCache
+from embedding_cache import get_embedding_cache, get_query_memo
+from build_progress import BuildInProgress
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -19,17 +25,227 @@ CORS(app)
 # Configuration
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
 
-# Initialiser le système RAG
+# Vérifier la clé API (les systèmes RAG sont initialisés en arrière-plan)
 openai_api_key = os.getenv("OPENAI_API_KEY")
 if not openai_api_key:
     print("❌ Erreur: OPENAI_API_KEY n'est pas défini")
     print("Créez un fichier .env avec votre clé API OpenAI")
     exit(1)
 
-rag_system = RAGSystem(openai_api_key=openai_api_key)
+# Composants initialisés à la demande : {nom: instance}, états et erreurs pour /api/health
+_components = {}
+_component_states = {'rag_system': 'pending', 'compendium_rag': 'pending'}
+_component_errors = {}
+_component_locks = {name: threading.Lock() for name in ('rag_system', 'compendium_rag', 'combined_rag')}
 
-# Initialiser le système Compendium RAG
-compendium_rag = CompendiumRAG(openai_api_key=openai_api_key)
+# Initialisation en arrière-plan au démarrage (sinon au premier appel)
+background_init = os.getenv('BACKGROUND_INIT', 'true').lower() == 'true'
+
+def _get_component(name, factory):
+    """
+    Retourne un composant, en le créant au premier appel
+    
+    Les requêtes arrivées pendant l'initialisation attendent sa fin.
+    
+    Args:
+        name: Nom du composant
+        factory: Fonction de création
+        
+    Returns:
+        Instance du composant
+    """
+    component = _components.get(name)
+    if component is not None:
+        return component
+    
+    with _component_locks[name]:
+        if name not in _components:
+            _component_states[name] = 'initializing'
+            try:
+                _components[name] = factory()
+            except Exception as e:
+                _component_states[name] = 'error'
+                _component_errors[name] = str(e)
+                raise
+            _component_states[name] = 'ready'
+            _component_errors.pop(name, None)
+        return _components[name]
+
+def get_rag_system():
+    """
+    Retourne le système RAG des documents du laboratoire
+    """
+    def create():
+        # Import différé : chromadb et tiktoken ralentissent le démarrage
+        from rag_system import RAGSystem
+        return RAGSystem(openai_api_key=openai_api_key)
+    return _get_component('rag_system', create)
+
+def get_compendium_rag():
+    """
+    Retourne le système RAG du compendium
+    """
+    def create():
+        from compendium_rag import CompendiumRAG
+        return CompendiumRAG(openai_api_key=openai_api_key)
+    return _get_component('compendium_rag', create)
+
+def get_combined_rag():
+    """
+    Retourne l'interrogation conjointe des deux systèmes (un embedding, une génération)
+    """
+    def create():
+        from combined_rag import CombinedRAG
+        return CombinedRAG(get_rag_system(), get_compendium_rag())
+    return _get_component('combined_rag', create)
+
+def retry_after(*names):
+    """
+    Indique si des composants ne peuvent pas encore répondre
+    
+    Un composant en cours d'initialisation ou dont la collection est en construction
+    initiale (vide au départ) fait répondre 503 immédiatement plutôt que d'attendre.
+    
+    Args:
+        names: Noms des composants nécessaires ('rag_system', 'compendium_rag')
+        
+    Returns:
+        Délai conseillé en secondes avant de réessayer, ou None si tout est prêt
+    """
+    delays = []
+    for name in names:
+        state = _component_states[name]
+        if state == 'initializing' or (state == 'pending' and background_init):
+            delays.append(5)
+        elif state == 'ready' and _components[name].build_progress.is_blocking:
+            eta = _components[name].build_progress.eta_seconds()
+            delays.append(int(min(max(eta, 5), 120)) if eta is not None else 10)
+    return max(delays) if delays else None
+
+def unavailable_response(*names):
+    """
+    Réponse 503 avec Retry-After si des composants ne sont pas prêts
+    
+    Returns:
+        Réponse Flask, ou None si tout est prêt
+    """
+    delay = retry_after(*names)
+    if delay is None:
+        return None
+    
+    response = jsonify({
+        'error': "Base de données en cours d'initialisation, réessayez dans quelques instants",
+        'retry_after': delay,
+        'success': False
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(delay)
+    return response
+
+def is_ready():
+    """
+    Indique si les deux systèmes RAG sont prêts à répondre
+    """
+    return (all(_component_states[name] == 'ready' for name in ('rag_system', 'compendium_rag'))
+            and retry_after('rag_system', 'compendium_rag') is None)
+
+def build_status():
+    """
+    Progression des constructions des collections initialisées
+    """
+    return {
+        name: _components[name].build_progress.snapshot()
+        for name in ('rag_system', 'compendium_rag')
+        if _component_states[name] == 'ready'
+    }
+
+@contextmanager
+def reserve_builds(systems):
+    """
+    Réserve les collections de plusieurs systèmes RAG pour une construction
+    
+    Raises:
+        BuildInProgress: Une construction est déjà en cours sur l'une des collections
+    """
+    with ExitStack() as stack:
+        for system in systems:
+            stack.enter_context(system.build_progress.exclusive(wait=False))
+        yield
+
+def build_conflict_response(error):
+    """
+    Réponse 409 avec la progression des constructions en cours
+    """
+    return jsonify({
+        'error': str(error),
+        'builds': build_status(),
+        'progress_url': '/api/build/progress',
+        'success': False
+    }), 409
+
+# Cache des réponses aux questions répétées
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 500)),
+    ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+)
+
+# Cache sémantique pour les questions reformulées
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.95)),
+    max_entries=int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 1000)),
+    ttl_seconds=float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+) if os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true' else None
+
+def question_signature(question):
+    """
+    Signature de la question pour le cache sémantique (voir FacetIndex.query_signature)
+    
+    Args:
+        question: Question de l'utilisateur
+        
+    Returns:
+        Signature, ou None tant que le compendium n'est pas chargé : sans les noms des
+        laboratoires, le cache sémantique n'est pas consulté
+    """
+    compendium_rag = _components.get('compendium_rag')
+    if semantic_cache is None or compendium_rag is None or not compendium_rag.facet_index.lab_aliases:
+        return None
+    return compendium_rag.facet_index.query_signature(question)
+
+def cached_answer(endpoint, question, rag, ask):
+    """
+    Répond à une question en passant par le cache exact puis le cache sémantique
+    
+    Args:
+        endpoint: Nom de l'endpoint ('ask' ou 'compendium')
+        question: Question de l'utilisateur
+        rag: Système RAG interrogé (fournit index_version et embed_query)
+        ask: Fonction de réponse acceptant query_embedding
+        
+    Returns:
+        Réponse complète avec sources
+    """
+    version = rag.index_version
+    result = response_cache.get(endpoint, question, version)
+    if result is not None:
+        return result
+    
+    query_embedding = None
+    signature = question_signature(question)
+    if signature is not None:
+        query_embedding = rag.embed_query(question)
+        if query_embedding is not None:
+            result = semantic_cache.get(endpoint, query_embedding, version, signature)
+            if result is not None:
+                return dict(result, query=question)
+    
+    result = ask(question, query_embedding=query_embedding)
+    if result['sources']:
+        response_cache.put(endpoint, question, version, result)
+        if query_embedding is not None:
+            semantic_cache.put(endpoint, query_embedding, version, signature, result)
+    
+    return result
 
 @app.route('/')
 def index():
@@ -60,8 +276,12 @@ def ask_question():
                 'success': False
             }), 400
         
-        # Traiter la question
-        result = rag_system.ask_question(question)
+        unavailable = unavailable_response('rag_system')
+        if unavailable is not None:
+            return unavailable
+        
+        # Traiter la question (ou réutiliser une réponse récente)
+        result = cached_answer('ask', question, get_rag_system(), get_rag_system().ask_question)
         
         return jsonify({
             'success': True,
@@ -99,8 +319,16 @@ def ask_compendium():
                 'success': False
             }), 400
         
-        # Traiter la question avec le compendium
-        result = compendium_rag.ask_compendium(question)
+        unavailable = unavailable_response('compendium_rag')
+        if unavailable is not None:
+            return unavailable
+        
+        # Un code connu est servi directement, sinon traiter la question avec le compendium
+        # (ou réutiliser une réponse récente)
+        compendium_rag = get_compendium_rag()
+        result = compendium_rag.answer_from_code(question)
+        if result is None:
+            result = cached_answer('compendium', question, compendium_rag, compendium_rag.ask_compendium)
         
         return jsonify({
             'success': True,
@@ -116,28 +344,337 @@ def ask_compendium():
             'success': False
         }), 500
 
-@app.route('/api/health')
-def health_check():
+@app.route('/api/ask_all', methods=['POST'])
+def ask_all():
     """
-    Vérification de l'état de l'application
+    Endpoint pour interroger conjointement les documents et le compendium
     """
     try:
-        # Vérifier la base de données
-        doc_count = rag_system.collection.count()
+        data = request.get_json()
+        
+        if not data or 'question' not in data:
+            return jsonify({
+                'error': 'Question manquante',
+                'success': False
+            }), 400
+        
+        question = data['question'].strip()
+        
+        if not question:
+            return jsonify({
+                'error': 'Question vide',
+                'success': False
+            }), 400
+        
+        unavailable = unavailable_response('rag_system', 'compendium_rag')
+        if unavailable is not None:
+            return unavailable
+        
+        # Un embedding, deux recherches en parallèle, une génération (ou une réponse récente)
+        result = cached_answer('ask_all', question, get_combined_rag(), get_combined_rag().ask_all)
         
         return jsonify({
-            'status': 'healthy',
-            'database_documents': doc_count,
-            'success': True
+            'success': True,
+            'answer': result['answer'],
+            'sources': result['sources'],
+            'query': result['query']
         })
         
     except Exception as e:
+        print(f"Erreur lors du traitement conjoint: {e}")
         return jsonify({
-            'status': 'error',
-            'error': str(e),
+            'error': f'Erreur serveur: {str(e)}',
             'success': False
         }), 500
 
+def sse_response(events):
+    """
+    Transforme un itérateur d'événements en réponse Server-Sent Events
+    """
+    def generate():
+        try:
+            for event in events:
+                yield f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"Erreur lors du streaming: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': f'Erreur serveur: {str(e)}'}, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Désactiver le buffering des proxys
+        }
+    )
+
+def cached_stream(endpoint, question, rag, stream):
+    """
+    Diffuse une réponse en cache, ou diffuse puis met en cache une nouvelle réponse
+    """
+    version = rag.index_version
+    cached = response_cache.get(endpoint, question, version)
+    
+    query_embedding = None
+    signature = question_signature(question) if cached is None else None
+    if signature is not None:
+        query_embedding = rag.embed_query(question)
+        if query_embedding is not None:
+            cached = semantic_cache.get(endpoint, query_embedding, version, signature)
+    
+    if cached is not None:
+        yield {'event': 'sources', 'data': {'sources': cached['sources'], 'query': question}}
+        yield {'event': 'token', 'data': {'text': cached['answer']}}
+        yield {'event': 'done', 'data': {'query': question}}
+        return
+    
+    sources = []
+    tokens = []
+    for event in stream(question, query_embedding=query_embedding):
+        if event['event'] == 'sources':
+            sources = event['data']['sources']
+        elif event['event'] == 'token':
+            tokens.append(event['data']['text'])
+        elif event['event'] == 'done' and sources:
+            result = {
+                'answer': ''.join(tokens),
+                'sources': sources,
+                'query': question
+            }
+            response_cache.put(endpoint, question, version, result)
+            if query_embedding is not None:
+                semantic_cache.put(endpoint, query_embedding, version, signature, result)
+        yield event
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Endpoint pour poser une question avec réponse diffusée en SSE
+    """
+    data = request.get_json(silent=True)
+    question = (data or {}).get('question', '').strip()
+    
+    if not question:
+        return jsonify({
+            'error': 'Question manquante',
+            'success': False
+        }), 400
+    
+    unavailable = unavailable_response('rag_system')
+    if unavailable is not None:
+        return unavailable
+    
+    rag_system = get_rag_system()
+    return sse_response(cached_stream('ask', question, rag_system, rag_system.stream_question))
+
+@app.route('/api/compendium/stream', methods=['POST'])
+def ask_compendium_stream():
+    """
+    Endpoint pour interroger le compendium avec réponse diffusée en SSE
+    """
+    data = request.get_json(silent=True)
+    question = (data or {}).get('question', '').strip()
+    
+    if not question:
+        return jsonify({
+            'error': 'Question manquante',
+            'success': False
+        }), 400
+    
+    unavailable = unavailable_response('compendium_rag')
+    if unavailable is not None:
+        return unavailable
+    
+    # Un code connu est servi directement, sans passer par les caches
+    compendium_rag = get_compendium_rag()
+    if compendium_rag.lookup_code(question):
+        return sse_response(compendium_rag.stream_compendium(question))
+    
+    return sse_response(cached_stream('compendium', question, compendium_rag, compendium_rag.stream_compendium))
+
+@app.route('/api/compendium/lookup')
+def lookup_compendium_code():
+    """
+    Endpoint de recherche exacte par code de laboratoire, LOINC ou INAMI
+    """
+    code = request.args.get('code', '').strip()
+    
+    if not code:
+        return jsonify({
+            'error': 'Code manquant',
+            'success': False
+        }), 400
+    
+    # L'index des codes est en mémoire : seule l'initialisation du composant est attendue
+    if _component_states['compendium_rag'] != 'ready' and retry_after('compendium_rag') is not None:
+        return unavailable_response('compendium_rag')
+    
+    matches = get_compendium_rag().lookup_code(code)
+    
+    if not matches:
+        return jsonify({
+            'error': f'Code inconnu: {code}',
+            'success': False
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'code': code,
+        'count': len(matches),
+        'matches': matches
+    })
+
+@app.route('/api/admin/sync', methods=['POST'])
+def sync_databases():
+    """
+    Synchronise les bases vectorielles avec les fichiers de données modifiés
+    """
+    # Sans ADMIN_TOKEN configuré, la route est fermée : une reconstruction réembarque tout (payant)
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token or not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'),
+                                                   admin_token.encode('utf-8')):
+        return jsonify({
+            'error': 'Accès refusé' if admin_token else 'Accès refusé: ADMIN_TOKEN non configuré',
+            'success': False
+        }), 403
+    
+    # ?full=true : reconstruction complète dans une nouvelle version de chaque collection,
+    # mise en service une fois terminée (les collections actuelles continuent de répondre)
+    full_rebuild = request.args.get('full', 'false').lower() == 'true'
+    
+    systems = (get_rag_system(), get_compendium_rag())
+    
+    def sync_all():
+        if full_rebuild:
+            for rag in systems:
+                rag.build_database(full_rebuild=True)
+            return {
+                'documents': {'collection': systems[0].collection.name},
+                'compendium': {'collection': systems[1].collection.name}
+            }
+        return {
+            'documents': systems[0].sync_database(),
+            'compendium': systems[1].sync_database()
+        }
+    
+    # ?background=true : synchronisation en tâche de fond, suivie via /api/build/progress
+    if request.args.get('background', 'false').lower() == 'true':
+        # Les collections sont réservées par le thread de synchronisation : attendre de savoir s'il y est parvenu
+        reserved = threading.Event()
+        conflicts = []
+        
+        def run_in_background():
+            try:
+                with reserve_builds(systems):
+                    reserved.set()
+                    sync_all()
+            except BuildInProgress as e:
+                conflicts.append(e)
+            except Exception as e:
+                print(f"Erreur lors de la synchronisation: {e}")
+            finally:
+                reserved.set()
+        
+        threading.Thread(target=run_in_background, name='rag-sync', daemon=True).start()
+        reserved.wait()
+        if conflicts:
+            return build_conflict_response(conflicts[0])
+        return jsonify({
+            'success': True,
+            'status': 'started',
+            'progress_url': '/api/build/progress'
+        }), 202
+    
+    try:
+        with reserve_builds(systems):
+            return jsonify(dict(sync_all(), success=True))
+        
+    except BuildInProgress as e:
+        return build_conflict_response(e)
+    except Exception as e:
+        print(f"Erreur lors de la synchronisation: {e}")
+        return jsonify({
+            'error': f'Erreur serveur: {str(e)}',
+            'success': False
+        }), 500
+
+@app.route('/api/health')
+def health_check():
+    """
+    Vérification de l'état de l'application (liveness : toujours 200 si le serveur répond)
+    
+    Le champ 'ready' indique si les systèmes RAG sont initialisés ; voir /api/health/ready.
+    """
+    embedding_cache = get_embedding_cache()
+    status = {
+        'status': 'healthy',
+        'ready': is_ready(),
+        'components': dict(_component_states),
+        'builds': build_status(),
+        'errors': dict(_component_errors),
+        'success': True
+    }
+    
+    if is_ready():
+        try:
+            rag_system = get_rag_system()
+            ingestion_queue = rag_system.ingestion_queue
+            status.update({
+                'database_documents': rag_system.collection.count(),
+                'compendium_analyses': get_compendium_rag().collection.count(),
+                'embedding_cache': embedding_cache.stats() if embedding_cache is not None else None,
+                'ingestion_queue': ingestion_queue.stats() if ingestion_queue is not None else None
+            })
+        except Exception as e:
+            status.update({'status': 'degraded', 'error': str(e)})
+    
+    return jsonify(status)
+
+@app.route('/api/health/ready')
+def readiness_check():
+    """
+    Vérification de la disponibilité (readiness : 503 tant que les systèmes RAG ne sont pas prêts)
+    """
+    ready = is_ready()
+    response = jsonify({
+        'ready': ready,
+        'components': dict(_component_states),
+        'builds': build_status(),
+        'errors': dict(_component_errors),
+        'success': ready
+    })
+    response.status_code = 200 if ready else 503
+    if not ready:
+        response.headers['Retry-After'] = str(retry_after('rag_system', 'compendium_rag') or 5)
+    return response
+
+@app.route('/api/build/progress')
+def build_progress():
+    """
+    Progression des constructions des bases vectorielles (batches écrits / total, temps restant)
+    """
+    return jsonify({
+        'success': True,
+        'ready': is_ready(),
+        'components': dict(_component_states),
+        'builds': build_status()
+    })
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    """
+    Statistiques des caches (réponses et embeddings)
+    """
+    embedding_cache = get_embedding_cache()
+    
+    return jsonify({
+        'success': True,
+        'responses': response_cache.stats(),
+        'semantic': semantic_cache.stats() if semantic_cache is not None else None,
+        'embeddings': embedding_cache.stats() if embedding_cache is not None else None,
+        'query_embeddings': get_query_memo().stats()
+    })
+
 @app.route('/api/sources')
 def get_sources():
     """
@@ -145,7 +682,7 @@ def get_sources():
     """
     try:
         # Récupérer les métadonnées uniques
-        result = rag_system.collection.get()
+        result = get_rag_system().collection.get()
         
         sources = {}
         for metadata in result['metadatas']:
@@ -190,9 +727,26 @@ def internal_error(error):
         'success': False
     }), 500
 
-if __name__ == '__main__':
+def initialize_components():
+    """
+    Initialise les systèmes RAG et construit les bases vides, hors du chemin des requêtes
+    
+    Exécutée dans un thread au chargement du module : le serveur écoute immédiatement
+    et /api/health répond pendant l'initialisation.
+    """
+    # Charger l'instantané des bases s'il existe : pas d'appel à l'API d'embeddings
+    try:
+        from index_snapshot import restore_if_available
+        restore_if_available({
+            "medical_documents": get_rag_system(),
+            "compendium_analyses": get_compendium_rag()
+        })
+    except Exception as e:
+        print(f"❌ Erreur lors du chargement de l'instantané: {e}")
+    
     # Vérifier que la base de données existe
     try:
+        rag_system = get_rag_system()
         doc_count = rag_system.collection.count()
         if doc_count == 0:
             print("⚠️  Base de données vide, construction automatique...")
@@ -217,13 +771,14 @@ if __name__ == '__main__':
         print(f"❌ Erreur de base de données: {e}")
         print("Tentative de construction de la base de données...")
         try:
-            rag_system.build_database()
+            get_rag_system().build_database()
             print("✅ Base de données vectorielle créée avec succès!")
         except Exception as build_error:
             print(f"❌ Erreur lors de la construction: {build_error}")
     
     # Vérifier que la base de données compendium existe
     try:
+        compendium_rag = get_compendium_rag()
         compendium_count = compendium_rag.collection.count()
         if compendium_count == 0:
             print("⚠️  Base de données compendium vide, construction automatique...")
@@ -248,16 +803,22 @@ if __name__ == '__main__':
         print(f"❌ Erreur de base de données compendium: {e}")
         print("Tentative de construction de la base de données compendium...")
         try:
-            compendium_rag.build_database()
+            get_compendium_rag().build_database()
             print("✅ Base de données compendium créée avec succès!")
         except Exception as build_error:
             print(f"❌ Erreur lors de la construction du compendium: {build_error}")
-    
+
+# Les processus de parsing du compendium (multiprocessing) réimportent le script principal
+if background_init and multiprocessing.current_process().name == 'MainProcess':
+    threading.Thread(target=initialize_components, name='rag-init', daemon=True).start()
+
+if __name__ == '__main__':
     # Lancer l'application
     port = int(os.getenv('PORT', os.getenv('FLASK_PORT', 5000)))
-    debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
     print(f"🚀 Démarrage de l'assistant médical français")
     print(f"📍 Accès: http://localhost:{port}")
+    print("ℹ️  Serveur de développement : en production, lancez gunicorn app:app -c gunicorn.conf.py")
     
-    app.run(host='0.0.0.0', port=port, debug=debug) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True) 
\ No newline at end of file
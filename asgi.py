@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Point d'entrée ASGI de l'assistant médical français
+Lancement : uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Les endpoints de questions (/api/ask, /api/compendium) attendent le client
+AsyncOpenAI sur la boucle d'événements : une question en cours n'occupe
+plus de thread. Les autres routes sont servies par l'application Flask.
+"""
+
+import os
+import asyncio
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route, Mount
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from app import (app as flask_app, get_rag_system, get_compendium_rag, retry_after, response_cache, semantic_cache,
+                 question_signature)
+
+async def cached_answer_async(endpoint, question, rag, ask):
+    """
+    Variante asynchrone de app.cached_answer (cache exact puis cache sémantique)
+
+    Args:
+        endpoint: Nom de l'endpoint ('ask' ou 'compendium')
+        question: Question de l'utilisateur
+        rag: Système RAG interrogé (fournit index_version et embed_query_async)
+        ask: Coroutine de réponse acceptant query_embedding
+
+    Returns:
+        Réponse complète avec sources
+    """
+    version = rag.index_version
+    result = response_cache.get(endpoint, question, version)
+    if result is not None:
+        return result
+
+    query_embedding = None
+    signature = question_signature(question)
+    if signature is not None:
+        query_embedding = await rag.embed_query_async(question)
+        if query_embedding is not None:
+            result = semantic_cache.get(endpoint, query_embedding, version, signature)
+            if result is not None:
+                return dict(result, query=question)
+
+    result = await ask(question, query_embedding=query_embedding)
+    if result['sources']:
+        response_cache.put(endpoint, question, version, result)
+        if query_embedding is not None:
+            semantic_cache.put(endpoint, query_embedding, version, signature, result)
+
+    return result
+
+async def read_question(request: Request):
+    """
+    Extrait la question du corps JSON
+
+    Returns:
+        Couple (question, réponse d'erreur ou None)
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or 'question' not in data:
+        return None, JSONResponse({'error': 'Question manquante', 'success': False}, status_code=400)
+
+    question = str(data['question']).strip()
+    if not question:
+        return None, JSONResponse({'error': 'Question vide', 'success': False}, status_code=400)
+
+    return question, None
+
+def unavailable_response(*names):
+    """
+    Réponse 503 avec Retry-After si des composants ne sont pas prêts (voir app.retry_after)
+
+    Returns:
+        Réponse Starlette, ou None si tout est prêt
+    """
+    delay = retry_after(*names)
+    if delay is None:
+        return None
+
+    return JSONResponse({
+        'error': "Base de données en cours d'initialisation, réessayez dans quelques instants",
+        'retry_after': delay,
+        'success': False
+    }, status_code=503, headers={'Retry-After': str(delay)})
+
+async def ask_question(request: Request):
+    """
+    Endpoint pour poser une question
+    """
+    question, error = await read_question(request)
+    if error is not None:
+        return error
+
+    unavailable = unavailable_response('rag_system')
+    if unavailable is not None:
+        return unavailable
+
+    try:
+        # Attendre l'initialisation éventuelle sans bloquer la boucle d'événements
+        rag_system = await asyncio.to_thread(get_rag_system)
+        result = await cached_answer_async('ask', question, rag_system, rag_system.ask_question_async)
+
+        return JSONResponse({
+            'success': True,
+            'answer': result['answer'],
+            'sources': result['sources'],
+            'query': result['query']
+        })
+
+    except Exception as e:
+        print(f"Erreur lors du traitement: {e}")
+        return JSONResponse({'error': f'Erreur serveur: {str(e)}', 'success': False}, status_code=500)
+
+async def ask_compendium(request: Request):
+    """
+    Endpoint pour interroger le compendium belge
+    """
+    question, error = await read_question(request)
+    if error is not None:
+        return error
+
+    unavailable = unavailable_response('compendium_rag')
+    if unavailable is not None:
+        return unavailable
+
+    try:
+        compendium_rag = await asyncio.to_thread(get_compendium_rag)
+        result = compendium_rag.answer_from_code(question)
+        if result is None:
+            result = await cached_answer_async('compendium', question, compendium_rag, compendium_rag.ask_compendium_async)
+
+        return JSONResponse({
+            'success': True,
+            'answer': result['answer'],
+            'sources': result['sources'],
+            'query': result['query']
+        })
+
+    except Exception as e:
+        print(f"Erreur lors du traitement compendium: {e}")
+        return JSONResponse({'error': f'Erreur serveur: {str(e)}', 'success': False}, status_code=500)
+
+app = Starlette(routes=[
+    Route('/api/ask', ask_question, methods=['POST']),
+    Route('/api/compendium', ask_compendium, methods=['POST']),
+    # Toutes les autres routes (page d'accueil, streaming SSE, administration...)
+    Mount('/', app=WSGIMiddleware(flask_app, workers=int(os.getenv('WSGI_THREADS', 32))))
+])
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.getenv('PORT', os.getenv('FLASK_PORT', 5000)))
+    print(f"🚀 Démarrage de l'assistant médical français (ASGI)")
+    print(f"📍 Accès: http://localhost:{port}")
+
+    uvicorn.run(app, host='0.0.0.0', port=port)
@@ -0,0 +1,166 @@
+"""
+Suivi de la construction des bases vectorielles
+Batches écrits / total, temps restant estimé et disponibilité de la collection ;
+une seule construction à la fois par collection
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+class BuildInProgress(Exception):
+    """
+    Une construction de la collection est déjà en cours
+    """
+
+    def __init__(self, progress: Dict[str, Any]):
+        super().__init__(f"Construction de {progress['collection']} déjà en cours")
+        self.progress = progress
+
+class BuildProgress:
+    def __init__(self, collection: str):
+        """
+        Initialise le suivi d'une collection
+
+        Args:
+            collection: Nom de la collection
+        """
+        self.collection = collection
+        self.status = 'idle'
+        self.blocking = False
+        self.total_batches = 0
+        self.done_batches = 0
+        self.failed_batches = 0
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._lock = threading.Lock()
+        # Réservé par la construction en cours (réentrant : build_database → sync_database)
+        self._build_lock = threading.RLock()
+        self._depth = 0
+
+    @contextmanager
+    def exclusive(self, wait: bool = True):
+        """
+        Réserve la collection pour une construction
+
+        Args:
+            wait: Attendre la fin d'une construction en cours (sinon BuildInProgress)
+
+        Raises:
+            BuildInProgress: Construction déjà en cours dans un autre thread et wait=False
+        """
+        if not self._build_lock.acquire(blocking=wait):
+            raise BuildInProgress(self.snapshot())
+        try:
+            yield self
+        finally:
+            self._build_lock.release()
+
+    @contextmanager
+    def job(self, blocking: bool = False):
+        """
+        Encadre une construction ou une synchronisation
+
+        Les appels imbriqués (build_database → sync_database) partagent le même suivi ;
+        une construction lancée depuis un autre thread attend la fin de la précédente.
+
+        Args:
+            blocking: La collection ne peut pas répondre pendant la construction (vide au départ)
+        """
+        with self.exclusive():
+            started = self._depth == 0
+            self._depth += 1
+            if started:
+                with self._lock:
+                    self.status = 'running'
+                    self.blocking = blocking
+                    self.total_batches = 0
+                    self.done_batches = 0
+                    self.failed_batches = 0
+                    self.started_at = time.time()
+                    self.finished_at = None
+                    self.error = None
+
+            try:
+                yield self
+            except Exception as e:
+                if started:
+                    self._finish(str(e))
+                raise
+            finally:
+                self._depth -= 1
+            if started:
+                self._finish(None)
+
+    def _finish(self, error: Optional[str]):
+        with self._lock:
+            self.status = 'failed' if error else 'completed'
+            self.blocking = False
+            self.error = error
+            self.finished_at = time.time()
+
+    def add_total(self, batches: int):
+        """
+        Ajoute des batches à traiter
+        """
+        with self._lock:
+            self.total_batches += batches
+
+    def advance(self, batches: int = 1):
+        """
+        Compte des batches écrits dans la collection
+        """
+        with self._lock:
+            self.done_batches += batches
+
+    def fail(self, batches: int = 1):
+        """
+        Compte des batches en échec
+        """
+        with self._lock:
+            self.failed_batches += batches
+
+    @property
+    def is_blocking(self) -> bool:
+        """
+        Indique si la collection est en cours de construction initiale
+        """
+        return self.status == 'running' and self.blocking
+
+    def eta_seconds(self) -> Optional[float]:
+        """
+        Estime le temps restant d'après le débit observé
+
+        Returns:
+            Secondes restantes, ou None tant qu'aucun batch n'est écrit
+        """
+        if self.status != 'running' or not self.done_batches:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = max(self.total_batches - self.done_batches, 0)
+        return elapsed / self.done_batches * remaining
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Retourne l'état de la construction
+
+        Returns:
+            Dictionnaire sérialisable en JSON
+        """
+        with self._lock:
+            end = self.finished_at or time.time()
+            eta = self.eta_seconds()
+            return {
+                'collection': self.collection,
+                'status': self.status,
+                'blocking': self.is_blocking,
+                'done_batches': self.done_batches,
+                'failed_batches': self.failed_batches,
+                'total_batches': self.total_batches,
+                'percent': round(100 * self.done_batches / self.total_batches, 1) if self.total_batches else None,
+                'elapsed_seconds': round(end - self.started_at, 1) if self.started_at else None,
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'error': self.error
+            }
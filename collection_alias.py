@@ -0,0 +1,135 @@
+"""
+Collections versionnées pour les reconstructions sans interruption (blue/green)
+Une reconstruction complète écrit dans une nouvelle collection <alias>_v<N> pendant que
+la collection en service continue de répondre, puis le pointeur d'alias est basculé
+"""
+
+import os
+import re
+import json
+import threading
+from typing import List, Dict, Optional, Tuple
+
+class CollectionAliases:
+    def __init__(self, path: str):
+        """
+        Initialise le fichier des alias
+
+        Args:
+            path: Chemin du fichier JSON {alias: nom de la collection en service}
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def resolve(self, alias: str) -> str:
+        """
+        Retourne le nom de la collection en service pour un alias
+
+        Args:
+            alias: Nom logique de la collection
+
+        Returns:
+            Nom de la collection physique (l'alias lui-même s'il n'a jamais été basculé)
+        """
+        with self._lock:
+            return self._load().get(alias, alias)
+
+    def swap(self, alias: str, collection_name: str):
+        """
+        Bascule l'alias vers une nouvelle collection (écriture atomique)
+
+        Args:
+            alias: Nom logique de la collection
+            collection_name: Nom de la collection à mettre en service
+        """
+        with self._lock:
+            aliases = self._load()
+            aliases[alias] = collection_name
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(aliases, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+def _versions(chroma_client, alias: str) -> Dict[str, int]:
+    """
+    Retourne les collections d'un alias avec leur numéro de version (0 pour l'alias lui-même)
+    """
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = {}
+    for collection in chroma_client.list_collections():
+        if collection.name == alias:
+            versions[collection.name] = 0
+        else:
+            match = pattern.match(collection.name)
+            if match:
+                versions[collection.name] = int(match.group(1))
+    return versions
+
+def open_shadow_collection(chroma_client, alias: str, live_name: str, queue=None) -> Tuple[object, bool]:
+    """
+    Ouvre la collection dans laquelle écrire une reconstruction complète
+
+    Une nouvelle version interrompue (construction non terminée dans la file
+    d'ingestion) est reprise, sinon une version vide est créée.
+
+    Args:
+        chroma_client: Client ChromaDB
+        alias: Nom logique de la collection
+        live_name: Nom de la collection en service
+        queue: File d'ingestion (optionnelle)
+
+    Returns:
+        Couple (collection, True si une construction interrompue est reprise)
+    """
+    versions = _versions(chroma_client, alias)
+
+    if queue is not None:
+        interrupted = [
+            name for name in sorted(versions, key=versions.get, reverse=True)
+            if name != live_name and queue.unfinished_runs(name)
+        ]
+        if interrupted:
+            return chroma_client.get_collection(interrupted[0]), True
+
+    version = max(versions.values(), default=0) + 1
+    collection = chroma_client.create_collection(
+        name=f"{alias}_v{version}",
+        metadata={"hnsw:space": "cosine"}
+    )
+    return collection, False
+
+def garbage_collect(chroma_client, alias: str, live_name: str, keep: int = 1) -> List[str]:
+    """
+    Supprime les anciennes versions d'une collection
+
+    Args:
+        chroma_client: Client ChromaDB
+        alias: Nom logique de la collection
+        live_name: Nom de la collection en service (jamais supprimée)
+        keep: Nombre de versions précédentes conservées pour un retour arrière
+
+    Returns:
+        Noms des collections supprimées
+    """
+    versions = _versions(chroma_client, alias)
+    previous = sorted(
+        (name for name in versions if name != live_name and versions[name] < versions.get(live_name, 0)),
+        key=versions.get,
+        reverse=True
+    )
+
+    deleted = []
+    for name in previous[keep:]:
+        try:
+            chroma_client.delete_collection(name)
+            deleted.append(name)
+        except Exception as e:
+            print(f"Erreur lors de la suppression de {name}: {e}")
+    return deleted
@@ -0,0 +1,177 @@
+"""
+Interrogation conjointe des documents du laboratoire et du compendium belge
+Un seul embedding de la question, les deux collections interrogées en parallèle
+et une seule génération à partir des contextes fusionnés
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+def server_threads() -> int:
+    """
+    Nombre de requêtes que le serveur en cours d'exécution traite simultanément
+
+    GUNICORN_THREADS sous gunicorn, WSGI_THREADS sous uvicorn (routes Flask de asgi.py),
+    la variable définie pour un autre serveur, 32 si aucune ne l'est.
+    """
+    if 'gunicorn' in sys.modules:
+        names = ('GUNICORN_THREADS',)
+    elif 'uvicorn' in sys.modules:
+        names = ('WSGI_THREADS',)
+    else:
+        names = ('WSGI_THREADS', 'GUNICORN_THREADS')
+    for name in names:
+        if os.getenv(name):
+            return int(os.getenv(name))
+    return 32
+
+class CombinedRAG:
+    def __init__(self, rag_system, compendium_rag):
+        """
+        Initialise l'interrogation conjointe
+
+        Args:
+            rag_system: Système RAG des documents du laboratoire
+            compendium_rag: Système RAG du compendium
+        """
+        self.rag_system = rag_system
+        self.compendium_rag = compendium_rag
+        self.client = rag_system.client
+        # Recherche du compendium en parallèle de celle des documents (thread de la requête) :
+        # un thread d'aide par requête simultanée du serveur
+        self._executor = ThreadPoolExecutor(max_workers=server_threads(), thread_name_prefix='combined-search')
+
+    @property
+    def index_version(self) -> Tuple[int, int]:
+        """
+        Version conjointe des deux collections (invalide les réponses en cache)
+        """
+        return (self.rag_system.index_version, self.compendium_rag.index_version)
+
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Génère l'embedding d'une question (partagé par les deux collections)
+
+        Args:
+            query: Question de l'utilisateur
+
+        Returns:
+            Embedding de la question, ou None en cas d'erreur
+        """
+        return self.rag_system.embed_query(query)
+
+    def _build_messages(self, query: str, documents: List[Dict[str, Any]],
+                        analyses: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Construit les messages envoyés au modèle de génération
+
+        Args:
+            query: Question de l'utilisateur
+            documents: Documents du laboratoire trouvés
+            analyses: Analyses du compendium trouvées
+
+        Returns:
+            Messages système et utilisateur
+        """
+        documents_text = "\n\n".join([
+            f"Document: {doc['title']}\n{doc['content']}"
+            for doc in documents
+        ]) or "Aucun document pertinent."
+
+        # Même présentation des analyses que pour /api/compendium (champs renseignés, équivalents)
+        analyses_text = self.compendium_rag._format_context(analyses) or "Aucune analyse pertinente."
+
+        prompt = f"""Vous êtes un assistant médical spécialisé pour biologiste en laboratoire clinique.
+Répondez UNIQUEMENT en français et basez-vous UNIQUEMENT sur les informations fournies.
+
+Question: {query}
+
+DOCUMENTS DU LABORATOIRE:
+{documents_text}
+
+ANALYSES DES LABORATOIRES BELGES (COMPENDIUM):
+{analyses_text}
+
+Instructions:
+1. Répondez de manière claire et précise en français
+2. Appuyez-vous d'abord sur les documents du laboratoire pour les procédures internes
+3. Utilisez le compendium pour présenter les laboratoires belges qui proposent l'analyse
+4. Si l'information n'est dans aucune des deux sources, dites-le clairement
+5. Citez vos sources (document ou laboratoire)
+6. Utilisez le vocabulaire médical approprié
+
+Réponse:"""
+
+        return [
+            {"role": "system", "content": "Vous êtes un assistant médical français spécialisé en biologie clinique. Répondez uniquement en français et basez-vous uniquement sur les informations fournies."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def ask_all(self, query: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Interroge les deux collections et génère une seule réponse
+
+        Args:
+            query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
+
+        Returns:
+            Réponse complète avec les sources des deux collections
+        """
+        print(f"Question (documents + compendium): {query}")
+
+        # Un seul embedding si les deux collections utilisent le même modèle
+        if query_embedding is None and self.rag_system.embedding_model == self.compendium_rag.embedding_model:
+            query_embedding = self.embed_query(query)
+            if query_embedding is None:
+                return {
+                    'answer': "Erreur lors de la génération de l'embedding de la question.",
+                    'sources': [],
+                    'query': query
+                }
+
+        compendium_embedding = query_embedding
+        if self.rag_system.embedding_model != self.compendium_rag.embedding_model:
+            compendium_embedding = None
+
+        analyses_future = self._executor.submit(
+            self.compendium_rag.search_analyses, query, 10, compendium_embedding
+        )
+        documents = self.rag_system.search_documents(query, 5, query_embedding)
+        analyses = analyses_future.result()
+
+        if not documents and not analyses:
+            return {
+                'answer': "Je n'ai pas trouvé d'informations pertinentes dans les documents ni dans le compendium belge.",
+                'sources': [],
+                'query': query
+            }
+
+        sources = (
+            [dict(source, type='document') for source in self.rag_system._build_sources(documents)]
+            + [dict(source, type='compendium') for source in self.compendium_rag._build_sources(analyses)]
+        )
+
+        try:
+            response = self.client.chat.completions.create(
+                model="gpt-4",
+                messages=self._build_messages(query, documents, analyses),
+                max_tokens=1200,
+                temperature=0.1
+            )
+
+            return {
+                'answer': response.choices[0].message.content,
+                'sources': sources,
+                'query': query
+            }
+
+        except Exception as e:
+            print(f"Erreur lors de la génération: {e}")
+            return {
+                'answer': f"Erreur lors de la génération de la réponse: {str(e)}",
+                'sources': [],
+                'query': query
+            }
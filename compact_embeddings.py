@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Stockage compact des embeddings du compendium (float16 ou int8 quantifié)
+Les vecteurs sont lus en mémoire mappée (np.load mmap_mode='r') : les workers d'une
+même machine partagent les pages via le cache du système au lieu de charger chacun
+l'index HNSW de ChromaDB en float32.
+
+Usage :
+    python compact_embeddings.py report [nombre de requêtes]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Set
+import numpy as np
+
+COMPACT_DTYPES = ('float16', 'int8')
+
+# Lignes converties en float32 à la fois pendant le parcours (mémoire temporaire bornée)
+SCAN_BLOCK_ROWS = 2048
+
+class CompactEmbeddingStore:
+    def __init__(self, directory: str, name: str, dtype: str = 'int8', rescore_factor: int = 4):
+        """
+        Initialise le stockage compact
+
+        Args:
+            directory: Répertoire des fichiers .npy
+            name: Nom de la collection stockée
+            dtype: 'float16' ou 'int8' (quantification par vecteur, rescoring en float16)
+            rescore_factor: Candidats int8 rescorés en float16 par résultat demandé
+        """
+        if dtype not in COMPACT_DTYPES:
+            raise ValueError(f"Type de stockage inconnu: {dtype} (attendu: {', '.join(COMPACT_DTYPES)})")
+
+        self.directory = directory
+        self.name = name
+        self.dtype = dtype
+        self.rescore_factor = rescore_factor
+        # (ids, vecteurs parcourus, échelles int8, vecteurs float16 de rescoring, empreinte)
+        self._data = None
+        # (liste d'ids, dictionnaire id -> ligne) construit à la première recherche filtrée
+        self._positions = None
+        self._lock = threading.Lock()
+
+    def _path(self, suffix: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{suffix}")
+
+    def __len__(self) -> int:
+        data = self._data
+        return len(data[0]) if data else 0
+
+    def load(self, fingerprint: str) -> bool:
+        """
+        Ouvre les fichiers existants s'ils correspondent à la collection
+
+        Args:
+            fingerprint: Empreinte de la collection (voir collection_fingerprint)
+
+        Returns:
+            True si le stockage est à jour
+        """
+        with self._lock:
+            if self._data and self._data[4] == fingerprint:
+                return True
+            try:
+                with open(self._path(f"{self.dtype}.json"), 'r', encoding='utf-8') as f:
+                    meta = json.load(f)
+                if meta['fingerprint'] != fingerprint:
+                    return False
+
+                rescore = np.load(self._path("float16.npy"), mmap_mode='r')
+                if self.dtype == 'int8':
+                    vectors = np.load(self._path("int8.npy"), mmap_mode='r')
+                    scales = np.load(self._path("scales.npy"))
+                else:
+                    vectors, scales = rescore, None
+            except (OSError, ValueError, KeyError):
+                return False
+
+            self._data = (meta['ids'], vectors, scales, rescore, fingerprint)
+            return True
+
+    def build(self, ids: List[str], embeddings: np.ndarray, fingerprint: str):
+        """
+        Écrit les vecteurs normalisés puis les ouvre en mémoire mappée
+
+        Les fichiers sont remplacés atomiquement : les workers qui lisent
+        encore l'ancienne version gardent un mapping valide.
+
+        Args:
+            ids: Identifiants des vecteurs
+            embeddings: Matrice (n, dimension)
+            fingerprint: Empreinte de la collection
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        arrays = {"float16.npy": vectors.astype(np.float16)}
+        if self.dtype == 'int8':
+            # Quantification symétrique par vecteur : x ≈ q * échelle
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            arrays["int8.npy"] = np.round(vectors / scales[:, None]).astype(np.int8)
+            arrays["scales.npy"] = scales.astype(np.float32)
+
+        suffix = f".{os.getpid()}.tmp"
+        for name, array in arrays.items():
+            with open(self._path(name) + suffix, 'wb') as f:
+                np.save(f, array)
+            os.replace(self._path(name) + suffix, self._path(name))
+
+        # Le fichier d'empreinte est écrit en dernier : il valide les vecteurs
+        with open(self._path(f"{self.dtype}.json") + suffix, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'dtype': self.dtype, 'ids': list(ids)}, f)
+        os.replace(self._path(f"{self.dtype}.json") + suffix, self._path(f"{self.dtype}.json"))
+
+        with self._lock:
+            self._data = None
+        self.load(fingerprint)
+
+    def _scan(self, vectors: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """
+        Calcule les scores approchés de tous les vecteurs, par blocs
+        """
+        scores = np.empty(len(vectors), dtype=np.float32)
+        for start in range(0, len(vectors), SCAN_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+        if scales is not None:
+            scores *= scales
+        return scores
+
+    def _rows(self, ids: List[str], allowed_ids: Set[str]) -> np.ndarray:
+        """
+        Lignes des vecteurs candidats, dans l'ordre du fichier
+        """
+        cached = self._positions
+        if cached is None or cached[0] is not ids:
+            cached = (ids, {record_id: i for i, record_id in enumerate(ids)})
+            self._positions = cached
+        positions = cached[1]
+        return np.asarray(sorted(positions[record_id] for record_id in allowed_ids if record_id in positions), dtype=np.int64)
+
+    def search(self, query_embedding: List[float], n_results: int = 10, rescore: bool = True,
+               allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Recherche exhaustive des vecteurs les plus proches (similarité cosinus)
+
+        Args:
+            query_embedding: Embedding de la requête
+            n_results: Nombre de résultats
+            rescore: En int8, recalculer les scores des meilleurs candidats en float16
+            allowed_ids: Vecteurs candidats (tous si None) ; seules leurs lignes sont lues
+
+        Returns:
+            Liste de couples (id, score) par score décroissant
+        """
+        data = self._data
+        if not data:
+            return []
+        ids, vectors, scales, rescore_vectors, _ = data
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+
+        if allowed_ids is not None:
+            rows = self._rows(ids, allowed_ids)
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+            if scales is not None:
+                scores *= scales[rows]
+        else:
+            rows = None
+            scores = self._scan(vectors, scales, query)
+        n_results = min(n_results, len(scores))
+        if n_results == 0:
+            return []
+
+        if scales is not None and rescore:
+            n_candidates = min(n_results * self.rescore_factor, len(scores))
+            candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            # Seules les lignes candidates sont lues dans le fichier float16
+            candidates.sort()
+            if rows is not None:
+                candidates = rows[candidates]
+            scores = np.asarray(rescore_vectors[candidates], dtype=np.float32) @ query
+            order = np.argsort(-scores)[:n_results]
+            return [(ids[candidates[i]], float(scores[i])) for i in order]
+
+        top = np.argpartition(-scores, n_results - 1)[:n_results]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            return [(ids[rows[i]], float(scores[i])) for i in top]
+        return [(ids[i], float(scores[i])) for i in top]
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """
+        Retourne la taille des tableaux parcourus à chaque requête
+
+        Returns:
+            Octets des vecteurs parcourus et des vecteurs de rescoring
+        """
+        data = self._data
+        if not data:
+            return {'scan': 0, 'rescore': 0}
+        _, vectors, scales, rescore_vectors, _ = data
+        scan = vectors.nbytes + (scales.nbytes if scales is not None else 0)
+        return {'scan': int(scan), 'rescore': int(rescore_vectors.nbytes) if scales is not None else 0}
+
+def collection_fingerprint(collection) -> str:
+    """
+    Calcule l'empreinte d'une collection (nom, ids et empreintes de contenu)
+
+    Args:
+        collection: Collection ChromaDB
+
+    Returns:
+        Empreinte SHA-256
+    """
+    data = collection.get(include=['metadatas'])
+    digest = hashlib.sha256(collection.name.encode('utf-8'))
+    for record_id, metadata in sorted(zip(data['ids'], data['metadatas'])):
+        digest.update(f"\n{record_id}:{(metadata or {}).get('content_hash', '')}".encode('utf-8'))
+    return digest.hexdigest()
+
+def read_embeddings(collection, batch_size: int = 1000) -> Tuple[List[str], np.ndarray]:
+    """
+    Lit tous les embeddings d'une collection
+
+    Args:
+        collection: Collection ChromaDB
+        batch_size: Enregistrements lus par requête
+
+    Returns:
+        Couple (ids, matrice float32)
+    """
+    ids, blocks = [], []
+    for offset in range(0, collection.count(), batch_size):
+        batch = collection.get(limit=batch_size, offset=offset, include=['embeddings'])
+        ids.extend(batch['ids'])
+        # Conversion par batch : les listes de floats Python ne s'accumulent pas
+        blocks.append(np.asarray(batch['embeddings'], dtype=np.float32))
+    return ids, np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+
+def _rss_kb() -> Dict[str, int]:
+    """
+    Mémoire résidente du processus (Linux), anonyme et adossée à des fichiers
+    """
+    rss = {}
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                key = line.split(':')[0]
+                if key in ('RssAnon', 'RssFile'):
+                    rss[key] = int(line.split()[1])
+    except OSError:
+        pass
+    return rss
+
+def report(compendium_rag, n_queries: int = 200, n_results: int = 10, seed: int = 0) -> Dict[str, Any]:
+    """
+    Compare mémoire, rappel et latence du stockage compact et de ChromaDB
+
+    La référence est une recherche exhaustive en float32 ; un résultat est correct
+    si son score exact atteint celui du n-ième meilleur (les doublons sont fréquents
+    entre laboratoires). Les requêtes sont des embeddings d'analyses bruités (aucun
+    appel à l'API). La mémoire de ChromaDB est mesurée au premier accès aux vecteurs,
+    qui charge l'index HNSW : lancer le rapport dans un processus neuf.
+
+    Args:
+        compendium_rag: Système CompendiumRAG dont la collection est construite
+        n_queries: Nombre de requêtes
+        n_results: Nombre de résultats comparés (rappel@n)
+        seed: Graine du tirage des requêtes
+
+    Returns:
+        Dictionnaire des mesures par méthode
+    """
+    collection = compendium_rag.collection
+
+    before = _rss_kb()
+    ids, embeddings = read_embeddings(collection)
+    after = _rss_kb()
+    if len(ids) == 0:
+        raise ValueError("Collection vide")
+    hnsw_kb = after.get('RssAnon', 0) - before.get('RssAnon', 0) - embeddings.nbytes // 1000
+
+    exact = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    rows = {record_id: i for i, record_id in enumerate(ids)}
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(ids), size=min(n_queries, len(ids)), replace=False)
+    queries = exact[picks] + rng.standard_normal((len(picks), exact.shape[1])).astype(np.float32) * 0.02
+    exact_scores = queries @ exact.T
+    thresholds = -np.partition(-exact_scores, n_results - 1, axis=1)[:, n_results - 1]
+
+    def measure(search):
+        start = time.time()
+        found = [search(query) for query in queries]
+        latency = (time.time() - start) / len(queries) * 1000
+        recall = np.mean([
+            sum(exact_scores[q, rows[hit]] >= thresholds[q] - 1e-6 for hit in hits) / n_results
+            for q, hits in enumerate(found)
+        ])
+        return round(float(recall), 4), round(latency, 2)
+
+    results = {'vectors': len(ids), 'dimension': embeddings.shape[1], 'float32_mb': round(embeddings.nbytes / 1e6, 1)}
+    fingerprint = collection_fingerprint(collection)
+    directory = os.path.join(compendium_rag.chroma_path, 'compact')
+
+    recall, latency = measure(lambda q: collection.query(query_embeddings=[q.tolist()], n_results=n_results, include=[])['ids'][0])
+    results['chroma'] = {'recall': recall, 'latency_ms': latency, 'rss_anon_mb': round(hnsw_kb / 1e3, 1)}
+
+    for dtype in COMPACT_DTYPES:
+        store = CompactEmbeddingStore(directory, 'compendium_analyses', dtype)
+        if not store.load(fingerprint):
+            store.build(ids, embeddings, fingerprint)
+        before = _rss_kb()
+        variants = [('', True)] if dtype == 'float16' else [('', True), ('_sans_rescoring', False)]
+        for label, rescore in variants:
+            recall, latency = measure(lambda q: [i for i, _ in store.search(q, n_results, rescore=rescore)])
+            results[f"{dtype}{label}"] = {'recall': recall, 'latency_ms': latency}
+        after = _rss_kb()
+        results[dtype].update({
+            'scan_mb': round(store.memory_bytes()['scan'] / 1e6, 1),
+            'rescore_mb': round(store.memory_bytes()['rescore'] / 1e6, 1),
+            # Pages de fichiers partagées entre workers via le cache du système
+            'rss_file_mb': round((after.get('RssFile', 0) - before.get('RssFile', 0)) / 1e3, 1)
+        })
+
+    return results
+
+def main():
+    """
+    Point d'entrée en ligne de commande
+    """
+    if len(sys.argv) < 2 or sys.argv[1] != 'report':
+        print(__doc__)
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from compendium_rag import CompendiumRAG
+
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        print("❌ Erreur: OPENAI_API_KEY n'est pas défini")
+        sys.exit(1)
+
+    n_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    results = report(CompendiumRAG(openai_api_key=openai_api_key), n_queries=n_queries)
+
+    print(f"📊 {results['vectors']} vecteurs de dimension {results['dimension']} "
+          f"({results['float32_mb']} Mo en float32)")
+    for name, values in results.items():
+        if isinstance(values, dict):
+            details = ", ".join(f"{key}={value}" for key, value in values.items())
+            print(f"  {name}: {details}")
+
+if __name__ == "__main__":
+    main()
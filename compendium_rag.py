@@ -4,15 +4,44 @@ Utilise les données JSON des laboratoires belges
 """
 
 import os
+import asyncio
 import json
 import glob
-from typing import List, Dict, Any
+import hashlib
+import re
+import time
+from typing import List, Dict, Any, Optional, Iterator, Iterable
 from dataclasses import dataclass
 import numpy as np
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import chromadb
 from chromadb.config import Settings
 import tiktoken
+from embedding_cache import get_embedding_cache, get_query_memo, fetch_embeddings, fetch_embeddings_async
+from embedding_pipeline import create_embedding_pipeline
+from ingestion_queue import get_ingestion_queue, ingest_records, resume_unfinished_runs
+from build_progress import BuildProgress
+from collection_alias import CollectionAliases, open_shadow_collection, garbage_collect
+from vector_backend import open_vector_backend
+from compact_embeddings import CompactEmbeddingStore, collection_fingerprint, read_embeddings
+from analysis_cache import get_analysis_cache, iter_lab_analyses
+from lab_parser import PARSER_VERSION
+from analysis_clusters import AnalysisClusters
+from lexical_index import BM25Index, reciprocal_rank_fusion, fold_text
+from facet_index import (FacetIndex, CATEGORICAL_FACETS, NUMERIC_FACETS, combine_where, match_where,
+                         rank_by_preferences)
+
+def normalize_code(code: str) -> str:
+    """
+    Normalise un code pour la recherche exacte (casse, accents, espaces)
+    
+    Args:
+        code: Code ou requête
+        
+    Returns:
+        Code normalisé
+    """
+    return re.sub(r'\s+', '', fold_text(str(code))).strip('?!.;:')
 
 @dataclass
 class CompendiumAnalysis:
@@ -26,6 +55,35 @@ class CompendiumAnalysis:
     prelevement: str = ""
     technique: str = ""
     reference: str = ""
+    analysis_id: str = ""
+    source_file: str = ""
+    loinc: str = ""
+    inami: str = ""
+    service: str = ""
+    matrice: str = ""
+    volume_minimum: str = ""
+    delai: str = ""
+    recipient: str = ""
+    frequence: str = ""
+    stabilite: str = ""
+    mots_cles: str = ""
+    delai_heures: Optional[float] = None
+    accredite: Optional[bool] = None
+    urgence: Optional[bool] = None
+
+# Version des métadonnées et textes indexés (à incrémenter quand create_metadata ou
+# create_search_text change) : invalide les instantanés exportés auparavant
+METADATA_VERSION = 2
+
+# Champs d'une analyse présentés au modèle de génération (les champs vides sont omis)
+CONTEXT_FIELDS = (
+    ('titre', "Titre"), ('laboratoire', "Laboratoire"), ('code', "Code"), ('lien', "Lien direct"), ('mots_cles', "Mots-clés"),
+    ('service', "Service"), ('description', "Remarques"), ('indication', "Indication clinique"),
+    ('matrice', "Matrice"), ('prelevement', "Type de prélèvement"), ('recipient', "Récipient"),
+    ('volume_minimum', "Volume minimum"), ('technique', "Technique utilisée"),
+    ('delai', "Délai de rendu"), ('frequence', "Fréquence de réalisation"), ('stabilite', "Stabilité"),
+    ('reference', "Valeurs de référence"), ('accredite', "Analyse accréditée"), ('urgence', "Réalisable en urgence")
+)
 
 class CompendiumRAG:
     def __init__(self, openai_api_key: str, data_directory: str = "data/compendium_data"):
@@ -37,27 +95,88 @@ class CompendiumRAG:
             data_directory: Répertoire contenant les données JSON
         """
         self.client = OpenAI(api_key=openai_api_key)
+        # Client asynchrone pour le serveur ASGI (asgi.py)
+        self.async_client = AsyncOpenAI(api_key=openai_api_key)
         self.data_directory = data_directory
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+        self.embedding_model = "text-embedding-3-small"
+        self.embedding_cache = get_embedding_cache()
+        self.query_memo = get_query_memo()
+        self.embedding_pipeline = create_embedding_pipeline(
+            self.client, self.embedding_model, self.encoding, self.embedding_cache
+        )
+        self.ingestion_queue = get_ingestion_queue()
+        # Analyses normalisées en cache disque, parsing des fichiers modifiés en parallèle
+        self.analysis_cache = get_analysis_cache()
+        self.parse_workers = int(os.getenv('COMPENDIUM_PARSE_WORKERS', min(4, os.cpu_count() or 1)))
+        self.build_progress = BuildProgress("compendium_analyses")
+        # Analyses présentées au modèle de génération (les fiches sont complètes, peu d'analyses suffisent)
+        self.context_analyses = int(os.getenv('COMPENDIUM_CONTEXT_ANALYSES', 5))
+        
+        # Incrémentée à chaque modification de la collection (invalide les réponses en cache)
+        self.index_version = 0
         
         # Initialiser ChromaDB
         chroma_path = os.getenv('COMPENDIUM_CHROMA_PATH', './compendium_chroma_db')
         # Sur Render, utiliser un répertoire temporaire si le chemin par défaut n'est pas accessible
         if not os.access(os.path.dirname(chroma_path) or '.', os.W_OK):
             chroma_path = '/tmp/compendium_chroma_db'
+        self.chroma_path = chroma_path
         
         self.chroma_client = chromadb.PersistentClient(
             path=chroma_path,
             settings=Settings(anonymized_telemetry=False)
         )
         
-        # Créer ou récupérer la collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="compendium_analyses",
+        # Créer ou récupérer la collection en service (désignée par l'alias "compendium_analyses")
+        self.aliases = CollectionAliases(os.path.join(chroma_path, "collection_aliases.json"))
+        # Requêtes servies par le backend configuré (VECTOR_BACKEND, voir vector_backend.py)
+        self.collection = open_vector_backend(self.chroma_client.get_or_create_collection(
+            name=self.aliases.resolve("compendium_analyses"),
             metadata={"hnsw:space": "cosine"}
-        )
+        ))
+        # Collection en cours d'écriture (une nouvelle version pendant une reconstruction complète)
+        self.build_collection = self.collection
         
         print(f"Collection compendium initialisée avec {self.collection.count()} analyses")
+        
+        # Index lexical BM25 (fusionné avec la recherche vectorielle) et index exact des codes
+        self.hybrid_search = os.getenv('HYBRID_SEARCH_ENABLED', 'true').lower() == 'true'
+        self.lexical_index = BM25Index()
+        self.code_index = {}
+        # Index des facettes (laboratoire, matrice, service, urgence, délai) : présélection avant la recherche vectorielle
+        self.facet_index = FacetIndex()
+        self.facet_filters = os.getenv('FACET_FILTERS_ENABLED', 'true').lower() == 'true'
+        # Au-delà, les candidats sont cherchés par une requête élargie puis filtrée plutôt que rescorés un par un
+        self.facet_exact_limit = int(os.getenv('FACET_EXACT_LIMIT', 500))
+        self.build_search_indexes()
+        
+        # Stockage compact des embeddings en mémoire mappée (COMPACT_EMBEDDINGS=float16|int8)
+        compact_dtype = os.getenv('COMPACT_EMBEDDINGS', '').lower()
+        self.compact_store = None
+        if compact_dtype:
+            self.compact_store = CompactEmbeddingStore(
+                os.path.join(chroma_path, 'compact'), "compendium_analyses", compact_dtype,
+                rescore_factor=int(os.getenv('COMPACT_RESCORE_FACTOR', 4))
+            )
+            self.refresh_compact_store()
+        
+        # Groupes d'analyses équivalentes entre laboratoires (résultats diversifiés, voir analysis_clusters.py)
+        self.diverse_results = os.getenv('COMPENDIUM_DIVERSE_RESULTS', 'true').lower() == 'true'
+        self.clusters = None
+        if self.diverse_results:
+            self.clusters = AnalysisClusters(
+                os.path.join(chroma_path, "analysis_clusters.json"),
+                threshold=float(os.getenv('COMPENDIUM_CLUSTER_THRESHOLD', 0.9))
+            )
+            self.refresh_clusters()
+    
+    def index_format(self) -> str:
+        """
+        Identifie la façon dont les fichiers sources sont transformés en enregistrements indexés
+        (version du parseur des laboratoires et des métadonnées)
+        """
+        return f"parser-v{PARSER_VERSION}/metadata-v{METADATA_VERSION}"
     
     def load_lab_data(self, filepath: str) -> List[CompendiumAnalysis]:
         """
@@ -69,90 +188,19 @@ class CompendiumRAG:
         Returns:
             Liste des analyses
         """
-        analyses = []
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Déterminer le laboratoire depuis le nom du fichier
-            filename = os.path.basename(filepath)
-            if 'lhub' in filename.lower():
-                lab_name = "LHUB-ULB"
-            elif 'uza' in filename.lower():
-                lab_name = "UZA"
-            elif 'citadelle' in filename.lower():
-                lab_name = "CHR Citadelle"
-            elif 'chu_ulg' in filename.lower():
-                lab_name = "CHU ULG"
-            else:
-                lab_name = "Laboratoire inconnu"
-            
-            # Traiter chaque analyse
-            for item in data:
-                if isinstance(item, dict):
-                    # Extraire les informations selon la structure
-                    titre = item.get('titre', '')
-                    code = item.get('code', '')
-                    lien = item.get('lien', '')
-                    
-                    # Extraire les détails supplémentaires s'ils existent
-                    description = ""
-                    indication = ""
-                    prelevement = ""
-                    technique = ""
-                    reference = ""
-                    
-                    # Pour les données détaillées UZA
-                    if 'analyse' in item:
-                        analyse_info = item['analyse']
-                        if isinstance(analyse_info, dict):
-                            description += f"Service: {analyse_info.get('Service', '')}\n"
-                            description += f"Matrice: {analyse_info.get('Matrice', '')}\n"
-                    
-                    if 'pre_analytique' in item:
-                        pre_info = item['pre_analytique']
-                        if isinstance(pre_info, dict):
-                            prelevement = pre_info.get('type d\'échantillon approprié', '') or pre_info.get('Récipient', '')
-                    
-                    if 'analytique' in item:
-                        analytique_info = item['analytique']
-                        if isinstance(analytique_info, dict):
-                            technique = analytique_info.get('Méthode analytique', '')
-                    
-                    if 'post_analytique' in item:
-                        post_info = item['post_analytique']
-                        if isinstance(post_info, dict):
-                            reference = post_info.get('Valeurs de référence', '')
-                    
-                    # Pour les autres structures
-                    if 'description' in item:
-                        description = item['description']
-                    if 'indication' in item:
-                        indication = item['indication']
-                    if 'methode' in item:
-                        technique = item['methode']
-                    if 'types_echantillons' in item:
-                        prelevement = item['types_echantillons']
-                    
-                    if titre and lien:  # Vérifier que les champs essentiels existent
-                        analyse = CompendiumAnalysis(
-                            titre=titre,
-                            code=code,
-                            lien=lien,
-                            laboratoire=lab_name,
-                            description=description,
-                            indication=indication,
-                            prelevement=prelevement,
-                            technique=technique,
-                            reference=reference
-                        )
-                        analyses.append(analyse)
-                        
-        except Exception as e:
-            print(f"Erreur lors du chargement de {filepath}: {e}")
+        return list(self.iter_lab_data(filepath))
+    
+    def iter_lab_data(self, filepath: str) -> Iterator[CompendiumAnalysis]:
+        """
+        Lit les analyses d'un laboratoire (depuis le cache si le fichier n'a pas changé)
         
-        return analyses
+        Args:
+            filepath: Chemin vers le fichier JSON
+            
+        Yields:
+            Analyses, une par une
+        """
+        yield from self.iter_all_analyses([filepath])
     
     def load_all_analyses(self) -> List[CompendiumAnalysis]:
         """
@@ -162,18 +210,41 @@ class CompendiumRAG:
             Liste de toutes les analyses
         """
         analyses = []
+        counts = {}
         
-        # Charger tous les fichiers JSON
-        json_files = glob.glob(os.path.join(self.data_directory, "*.json"))
+        # Charger tous les fichiers JSON (parsés en parallèle ou relus depuis le cache)
+        json_files = sorted(glob.glob(os.path.join(self.data_directory, "*.json")))
+        for filepath, record in iter_lab_analyses(json_files, self.analysis_cache, self.parse_workers):
+            analyses.append(CompendiumAnalysis(**record))
+            counts[filepath] = counts.get(filepath, 0) + 1
         
         for filepath in json_files:
-            print(f"Chargement de {os.path.basename(filepath)}...")
-            lab_analyses = self.load_lab_data(filepath)
-            analyses.extend(lab_analyses)
-            print(f"  {len(lab_analyses)} analyses chargées")
+            print(f"{os.path.basename(filepath)}: {counts.get(filepath, 0)} analyses chargées")
         
         return analyses
     
+    def iter_all_analyses(self, filepaths: Optional[List[str]] = None,
+                          failed_files: Optional[List[str]] = None) -> Iterator[CompendiumAnalysis]:
+        """
+        Lit les analyses de plusieurs fichiers JSON
+        
+        Les fichiers modifiés sont parsés et normalisés (en parallèle si
+        COMPENDIUM_PARSE_WORKERS > 1), les autres sont relus depuis le cache en colonnes,
+        un fichier à la fois.
+        
+        Args:
+            filepaths: Fichiers de laboratoire (tous les fichiers JSON si None)
+            failed_files: Liste complétée par les fichiers illisibles ou tronqués (optionnel)
+            
+        Yields:
+            Analyses, une par une
+        """
+        if filepaths is None:
+            filepaths = sorted(glob.glob(os.path.join(self.data_directory, "*.json")))
+        
+        for _, record in iter_lab_analyses(filepaths, self.analysis_cache, self.parse_workers, failed_files):
+            yield CompendiumAnalysis(**record)
+    
     def create_search_text(self, analyse: CompendiumAnalysis) -> str:
         """
         Crée le texte de recherche pour une analyse
@@ -188,15 +259,218 @@ class CompendiumRAG:
             f"Titre: {analyse.titre}",
             f"Code: {analyse.code}" if analyse.code else "",
             f"Laboratoire: {analyse.laboratoire}",
+            f"Mots-clés: {analyse.mots_cles}" if analyse.mots_cles else "",
+            f"Service: {analyse.service}" if analyse.service else "",
             f"Description: {analyse.description}" if analyse.description else "",
             f"Indication: {analyse.indication}" if analyse.indication else "",
-            f"Prélèvement: {analyse.prelevement}" if analyse.prelevement else "",
+            f"Matrice: {analyse.matrice}" if analyse.matrice else "",
+            f"Prélèvement: {analyse.prelevement}" if analyse.prelevement and analyse.prelevement != analyse.matrice else "",
             f"Technique: {analyse.technique}" if analyse.technique else "",
+            f"Délai: {analyse.delai}" if analyse.delai else "",
             f"Référence: {analyse.reference}" if analyse.reference else "",
         ]
         
         return "\n".join([part for part in parts if part])
     
+    def create_metadata(self, analyse: CompendiumAnalysis) -> Dict[str, Any]:
+        """
+        Crée les métadonnées ChromaDB d'une analyse, avec son empreinte de contenu
+        
+        Args:
+            analyse: Analyse à traiter
+            
+        Returns:
+            Métadonnées de l'analyse
+        """
+        metadata = {
+            "titre": analyse.titre,
+            "code": analyse.code,
+            "lien": analyse.lien,
+            "laboratoire": analyse.laboratoire,
+            "description": analyse.description,
+            "indication": analyse.indication,
+            "prelevement": analyse.prelevement,
+            "technique": analyse.technique,
+            "reference": analyse.reference,
+            "source_file": analyse.source_file,
+            "loinc": analyse.loinc,
+            "inami": analyse.inami,
+            "service": analyse.service,
+            "matrice": analyse.matrice,
+            "volume_minimum": analyse.volume_minimum,
+            "delai": analyse.delai,
+            "recipient": analyse.recipient,
+            "frequence": analyse.frequence,
+            "stabilite": analyse.stabilite,
+            "mots_cles": analyse.mots_cles
+        }
+        # ChromaDB n'accepte pas None : les champs typés inconnus sont omis
+        for field in ("delai_heures", "accredite", "urgence"):
+            value = getattr(analyse, field)
+            if value is not None:
+                metadata[field] = value
+        
+        payload = json.dumps([self.create_search_text(analyse), metadata], sort_keys=True, ensure_ascii=False)
+        metadata["content_hash"] = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+        
+        return metadata
+    
+    def build_search_indexes(self, analyses: Optional[Iterable[CompendiumAnalysis]] = None):
+        """
+        Construit l'index exact des codes, l'index des facettes et l'index lexical BM25 à partir des fichiers JSON
+        
+        Les analyses sont parcourues une seule fois, sans être conservées en liste.
+        
+        Args:
+            analyses: Analyses déjà chargées (relues au fil des fichiers si None)
+        """
+        if analyses is None:
+            analyses = self.iter_all_analyses()
+        
+        start = time.time()
+        
+        # Code du laboratoire, code LOINC et numéros de nomenclature INAMI
+        code_index = {}
+        facets = []
+        count = 0
+        
+        def index_codes():
+            nonlocal count
+            for analyse in analyses:
+                count += 1
+                facets.append((analyse.analysis_id, {
+                    facet: getattr(analyse, facet) for facet in CATEGORICAL_FACETS + NUMERIC_FACETS
+                }))
+                record = None
+                for field, value in (('code', analyse.code), ('loinc', analyse.loinc), ('inami', analyse.inami)):
+                    keys = {normalize_code(value)}
+                    if field == 'inami':
+                        # "559436-559440" : numéros ambulant et hospitalisé
+                        keys.update(re.findall(r'\d{6}', value))
+                    for key in keys:
+                        if not key:
+                            continue
+                        if record is None:
+                            record = self._format_record(analyse)
+                        matches = code_index.setdefault(key, [])
+                        if not any(match['analysis_id'] == analyse.analysis_id for match in matches):
+                            matches.append(dict(record, match=field))
+                yield analyse
+        
+        if self.hybrid_search:
+            self.lexical_index.build(
+                (analyse.analysis_id, self.create_search_text(analyse), self.create_metadata(analyse))
+                for analyse in index_codes()
+            )
+        else:
+            for _ in index_codes():
+                pass
+        self.code_index = code_index
+        self.facet_index.build(facets)
+        
+        print(f"Index de recherche construits pour {count} analyses "
+              f"({len(code_index)} codes) en {time.time() - start:.2f}s")
+    
+    def _format_record(self, analyse: CompendiumAnalysis) -> Dict[str, Any]:
+        """
+        Prépare la fiche structurée d'une analyse pour la recherche par code
+        
+        Args:
+            analyse: Analyse à traiter
+            
+        Returns:
+            Fiche de l'analyse
+        """
+        return {
+            'analysis_id': analyse.analysis_id,
+            'titre': analyse.titre,
+            'code': analyse.code,
+            'loinc': analyse.loinc,
+            'inami': analyse.inami,
+            'lien': analyse.lien,
+            'laboratoire': analyse.laboratoire,
+            'description': analyse.description,
+            'indication': analyse.indication,
+            'prelevement': analyse.prelevement,
+            'technique': analyse.technique,
+            'reference': analyse.reference,
+            'service': analyse.service,
+            'matrice': analyse.matrice,
+            'volume_minimum': analyse.volume_minimum,
+            'delai': analyse.delai,
+            'delai_heures': analyse.delai_heures
+        }
+    
+    def lookup_code(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Recherche exacte d'un code de laboratoire, LOINC ou INAMI
+        
+        Args:
+            query: Code recherché (la requête entière)
+            
+        Returns:
+            Copies des fiches des analyses correspondantes (liste vide si ce n'est pas un code connu)
+        """
+        # L'index est partagé entre les requêtes : l'appelant peut modifier les fiches retournées
+        return [dict(record) for record in self.code_index.get(normalize_code(query), [])]
+    
+    def answer_from_code(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Répond directement à une requête qui n'est qu'un code, sans embeddings ni LLM
+        
+        Args:
+            query: Question de l'utilisateur
+            
+        Returns:
+            Réponse complète avec liens, ou None si la requête n'est pas un code connu
+        """
+        records = self.lookup_code(query)
+        if not records:
+            return None
+        
+        lines = []
+        for record in records[:10]:
+            lines.append(f"**{record['titre']}** ({record['laboratoire']})")
+            for label, key in (("Code", 'code'), ("LOINC", 'loinc'), ("INAMI", 'inami'),
+                               ("Prélèvement", 'prelevement'), ("Technique", 'technique'), ("Délai", 'delai'), ("Lien", 'lien')):
+                if record[key]:
+                    lines.append(f"- {label}: {record[key]}")
+            lines.append("")
+        if len(records) > 10:
+            lines.append(f"... et {len(records) - 10} autres analyses portent ce code.")
+        
+        return {
+            'answer': "\n".join(lines).strip(),
+            'sources': self._build_sources([dict(record, score=1.0) for record in records]),
+            'query': query,
+            'records': records
+        }
+    
+    def get_stored_hashes(self) -> Dict[str, Dict[str, str]]:
+        """
+        Récupère les identifiants et empreintes des analyses déjà indexées
+        
+        Returns:
+            Dictionnaire id -> {content_hash, source_file}
+        """
+        stored = {}
+        page_size = 5000
+        offset = 0
+        
+        while True:
+            result = self.build_collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            for analysis_id, metadata in zip(result['ids'], result['metadatas']):
+                metadata = metadata or {}
+                stored[analysis_id] = {
+                    'content_hash': metadata.get('content_hash', ''),
+                    'source_file': metadata.get('source_file', '')
+                }
+            if len(result['ids']) < page_size:
+                break
+            offset += page_size
+        
+        return stored
+    
     def get_embeddings(self, texts: List[str]) -> List[List[float]]:
         """
         Génère les embeddings pour une liste de textes
@@ -208,149 +482,553 @@ class CompendiumRAG:
             Liste des embeddings
         """
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-3-small",
-                input=texts
-            )
-            return [data.embedding for data in response.data]
+            return fetch_embeddings(self.client, texts, self.embedding_model, self.embedding_cache)
         except Exception as e:
             print(f"Erreur lors de la génération des embeddings: {e}")
             return []
     
-    def build_database(self):
+    def build_database(self, full_rebuild: bool = False):
         """
         Construit la base de données vectorielle du compendium
+        
+        Par défaut, seules les analyses nouvelles ou modifiées sont indexées
+        et les analyses disparues sont supprimées (voir sync_database).
+        
+        Args:
+            full_rebuild: Tout réindexer dans une nouvelle version de la collection,
+                mise en service une fois complète
         """
-        print("Chargement des analyses du compendium...")
-        analyses = self.load_all_analyses()
+        # Collection vide au départ : les requêtes attendent la fin de la construction
+        with self.build_progress.job(blocking=self.collection.count() == 0):
+            if full_rebuild:
+                self._rebuild_shadow()
+            else:
+                self.sync_database()
+            self.index_version += 1
+    
+    def _rebuild_shadow(self):
+        """
+        Reconstruit tout dans une nouvelle version de la collection puis bascule l'alias
         
-        if not analyses:
-            print("Aucune analyse trouvée!")
+        La collection en service continue de répondre pendant la reconstruction.
+        """
+        shadow, resumed = open_shadow_collection(
+            self.chroma_client, "compendium_analyses", self.collection.name, self.ingestion_queue
+        )
+        if resumed:
+            # Reprendre la construction interrompue au lieu de repartir de zéro
+            print(f"Construction de {shadow.name} interrompue, reprise depuis le dernier batch écrit")
+        else:
+            print(f"Reconstruction complète dans {shadow.name}")
+        
+        self.build_collection = shadow
+        try:
+            summary = self.sync_database()
+        finally:
+            self.build_collection = self.collection
+        
+        # Batches ou fichiers en échec (avec ou sans file d'ingestion) : l'alias n'est pas basculé
+        if not summary['complete'] or (self.ingestion_queue is not None and self.ingestion_queue.unfinished_runs(shadow.name)):
+            print(f"⚠️  {shadow.name} incomplète, {self.collection.name} reste en service")
+            return
+        
+        self.promote_collection(shadow)
+    
+    def promote_collection(self, shadow):
+        """
+        Met en service une nouvelle version de la collection et supprime les anciennes
+        
+        Args:
+            shadow: Collection complète à mettre en service
+        """
+        # Bascule atomique : les requêtes suivantes interrogent la nouvelle version
+        self.aliases.swap("compendium_analyses", shadow.name)
+        self.collection = self.build_collection = open_vector_backend(shadow)
+        self.index_version += 1
+        self.refresh_compact_store()
+        self.refresh_clusters()
+        print(f"Collection {shadow.name} mise en service")
+        
+        keep = int(os.getenv('COLLECTION_KEEP_VERSIONS', 1))
+        for name in garbage_collect(self.chroma_client, "compendium_analyses", shadow.name, keep=keep):
+            print(f"Ancienne version supprimée: {name}")
+    
+    def sync_database(self, filepaths: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Synchronise la collection en suivant la progression (voir _sync_database)
+        """
+        with self.build_progress.job(blocking=self.collection.count() == 0):
+            summary = self._sync_database(filepaths)
+            self.refresh_compact_store()
+            self.refresh_clusters()
+        return summary
+    
+    def refresh_compact_store(self):
+        """
+        Reconstruit le stockage compact si la collection en service a changé
+        """
+        if self.compact_store is None or self.collection.count() == 0:
             return
         
-        # Supprimer l'ancienne collection
         try:
-            self.chroma_client.delete_collection("compendium_analyses")
-        except:
-            pass
+            start = time.time()
+            fingerprint = collection_fingerprint(self.collection)
+            if not self.compact_store.load(fingerprint):
+                ids, embeddings = read_embeddings(self.collection)
+                self.compact_store.build(ids, embeddings, fingerprint)
+                print(f"Stockage compact {self.compact_store.dtype} construit pour {len(ids)} analyses "
+                      f"en {time.time() - start:.2f}s")
+        except Exception as e:
+            # La recherche repasse par ChromaDB
+            print(f"Erreur lors de la construction du stockage compact: {e}")
+    
+    def refresh_clusters(self, force: bool = False, wait: bool = False):
+        """
+        Regroupe à nouveau les analyses équivalentes si la collection en service a changé
         
-        # Créer nouvelle collection
-        self.collection = self.chroma_client.create_collection(
-            name="compendium_analyses",
-            metadata={"hnsw:space": "cosine"}
+        Le calcul s'exécute hors du chemin de synchronisation (voir AnalysisClusters.refresh).
+        
+        Args:
+            force: Recalculer les groupes même s'ils sont à jour
+            wait: Attendre la fin du calcul
+        """
+        if self.clusters is not None:
+            self.clusters.refresh(lambda: self.collection, force=force, wait=wait)
+    
+    def _sync_database(self, filepaths: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Synchronise la collection avec les fichiers JSON sans la recréer
+        
+        Compare les identifiants stables et les empreintes de contenu stockées
+        dans les métadonnées, puis n'indexe que les différences.
+        
+        Args:
+            filepaths: Fichiers de laboratoire à rafraîchir (tous si None)
+            
+        Returns:
+            Nombre d'analyses ajoutées, modifiées, supprimées et inchangées, nombre de
+            fichiers en échec, et 'complete' : toutes les analyses sont indexées
+        """
+        cache_before = self.embedding_cache.stats() if self.embedding_cache is not None else None
+        
+        scope = None if filepaths is None else {os.path.basename(filepath) for filepath in filepaths}
+        
+        # Terminer d'abord une éventuelle construction interrompue
+        complete = resume_unfinished_runs(self.ingestion_queue, self.build_collection.name, self.embedding_pipeline,
+                                          self._write_batch, progress=self.build_progress)
+        
+        stored = self.get_stored_hashes()
+        
+        # Analyses nouvelles ou modifiées, envoyées par lots au pipeline d'embeddings
+        # au fil de la lecture des fichiers : la mémoire ne dépend pas de la taille du compendium
+        chunk_size = int(os.getenv('COMPENDIUM_INGEST_CHUNK', 1000))
+        pending = []
+        current_ids = set()
+        failed_files = []
+        summary = {'added': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0, 'failed': 0, 'complete': False}
+        
+        print("Chargement des analyses du compendium...")
+        for analyse in self.iter_all_analyses(filepaths, failed_files):
+            metadata = self.create_metadata(analyse)
+            current_ids.add(analyse.analysis_id)
+            previous = stored.get(analyse.analysis_id)
+            if previous is None:
+                summary['added'] += 1
+            elif previous['content_hash'] == metadata['content_hash']:
+                summary['unchanged'] += 1
+                continue
+            else:
+                summary['updated'] += 1
+            pending.append((self.create_search_text(analyse), {'id': analyse.analysis_id, 'metadata': metadata}))
+            
+            if len(pending) >= chunk_size:
+                complete = ingest_records(self.ingestion_queue, self.build_collection.name, self.embedding_pipeline,
+                                          pending, self._write_batch, progress=self.build_progress) and complete
+                pending = []
+        
+        complete = ingest_records(self.ingestion_queue, self.build_collection.name, self.embedding_pipeline,
+                                  pending, self._write_batch, progress=self.build_progress) and complete
+        summary['failed'] = len(failed_files)
+        # Aucune analyse : une collection vide ne doit pas être mise en service
+        summary['complete'] = complete and not failed_files and bool(current_ids)
+        
+        if not current_ids and filepaths is None:
+            print("Aucune analyse trouvée!")
+            return summary
+        
+        # Analyses disparues des fichiers concernés ; celles d'un fichier illisible sont conservées
+        unreadable = {os.path.basename(filepath) for filepath in failed_files}
+        to_delete = [
+            analysis_id for analysis_id, info in stored.items()
+            if analysis_id not in current_ids and (scope is None or info['source_file'] in scope)
+            and info['source_file'] not in unreadable
+        ]
+        for i in range(0, len(to_delete), 500):
+            self.build_collection.delete(ids=to_delete[i:i + 500])
+        summary['deleted'] = len(to_delete)
+        
+        print(f"Synchronisation: {summary['added']} nouvelles, {summary['updated']} modifiées, "
+              f"{summary['deleted']} supprimées, {summary['unchanged']} inchangées, {summary['failed']} fichiers en échec")
+        
+        if summary['added'] or summary['updated'] or summary['deleted']:
+            self.index_version += 1
+        
+        self.build_search_indexes()
+        
+        print(f"Base de données compendium synchronisée avec {self.build_collection.count()} analyses")
+        if cache_before is not None:
+            stats = self.embedding_cache.stats()
+            print(f"Cache d'embeddings: {stats['hits'] - cache_before['hits']} textes réutilisés, "
+                  f"{stats['misses'] - cache_before['misses']} textes envoyés à l'API")
+        
+        return summary
+    
+    def _write_batch(self, texts: List[str], records: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """
+        Ajoute ou remplace un batch d'analyses dans ChromaDB
+        
+        Args:
+            texts: Textes de recherche
+            records: Enregistrements {id, metadata}
+            embeddings: Embeddings correspondants
+        """
+        self.build_collection.upsert(
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[record['metadata'] for record in records],
+            ids=[record['id'] for record in records]
         )
+    
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Génère l'embedding d'une requête
         
-        print(f"Traitement de {len(analyses)} analyses...")
-        
-        # Traiter par batches
-        batch_size = 50
-        for i in range(0, len(analyses), batch_size):
-            batch = analyses[i:i + batch_size]
-            
-            # Préparer les données
-            texts = [self.create_search_text(analyse) for analyse in batch]
-            embeddings = self.get_embeddings(texts)
-            
-            if embeddings:
-                # Ajouter à ChromaDB
-                self.collection.add(
-                    embeddings=embeddings,
-                    documents=texts,
-                    metadatas=[{
-                        "titre": analyse.titre,
-                        "code": analyse.code,
-                        "lien": analyse.lien,
-                        "laboratoire": analyse.laboratoire,
-                        "description": analyse.description,
-                        "indication": analyse.indication,
-                        "prelevement": analyse.prelevement,
-                        "technique": analyse.technique,
-                        "reference": analyse.reference
-                    } for analyse in batch],
-                    ids=[f"{analyse.laboratoire}_{analyse.titre}_{i+j}" for j, analyse in enumerate(batch)]
-                )
-                
-                print(f"Batch {i//batch_size + 1} ajouté")
+        Args:
+            query: Requête de recherche
+            
+        Returns:
+            Embedding de la requête, ou None en cas d'erreur
+        """
+        # Requête déjà vue par l'un des deux systèmes RAG
+        embedding = self.query_memo.get(self.embedding_model, query)
+        if embedding is not None:
+            return embedding
+        
+        embeddings = self.get_embeddings([query])
+        if not embeddings:
+            return None
         
-        print(f"Base de données compendium construite avec {self.collection.count()} analyses")
+        self.query_memo.put(self.embedding_model, query, embeddings[0])
+        return embeddings[0]
     
-    def search_analyses(self, query: str, n_results: int = 10) -> List[Dict[str, Any]]:
+    async def embed_query_async(self, query: str) -> Optional[List[float]]:
+        """
+        Variante asynchrone de embed_query
+        
+        Args:
+            query: Requête de recherche
+            
+        Returns:
+            Embedding de la requête, ou None en cas d'erreur
+        """
+        embedding = self.query_memo.get(self.embedding_model, query)
+        if embedding is not None:
+            return embedding
+        
+        try:
+            embeddings = await fetch_embeddings_async(
+                self.async_client, [query], self.embedding_model, self.embedding_cache
+            )
+        except Exception as e:
+            print(f"Erreur lors de la génération des embeddings: {e}")
+            return None
+        
+        self.query_memo.put(self.embedding_model, query, embeddings[0])
+        return embeddings[0]
+    
+    def search_analyses(self, query: str, n_results: int = 10, query_embedding: Optional[List[float]] = None,
+                        where: Optional[Dict[str, Any]] = None, diverse: Optional[bool] = None) -> List[Dict[str, Any]]:
         """
         Recherche les analyses pertinentes
         
+        Le laboratoire nommé dans la question filtre les analyses avant la recherche
+        vectorielle (filtre relâché s'il ne retient aucune analyse) ; la matrice, le
+        délai de rendu et l'urgence demandés reclassent seulement les résultats, une
+        analyse sans cette information n'étant pas pénalisée.
+        
+        En mode diversifié, les analyses équivalentes de plusieurs laboratoires ne
+        forment qu'un résultat, les autres laboratoires étant listés dans 'variants'.
+        
         Args:
             query: Requête de recherche
             n_results: Nombre de résultats
+            query_embedding: Embedding de la requête, s'il est déjà connu
+            where: Filtre sur les métadonnées (syntaxe ChromaDB), ex. {"laboratoire": "UZA"}
+            diverse: Regrouper les analyses équivalentes (COMPENDIUM_DIVERSE_RESULTS si None)
             
         Returns:
             Liste des analyses pertinentes
         """
         try:
             # Générer l'embedding de la requête
-            query_embedding = self.get_embeddings([query])[0]
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+                if query_embedding is None:
+                    return []
             
-            # Rechercher dans ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=n_results
-            )
+            use_facets = self.facet_filters and len(self.facet_index) > 0
+            conditions = self.facet_index.parse_query(query) if use_facets else []
+            preferences = self.facet_index.parse_preferences(query) if use_facets else []
+            
+            # Plus de candidats à reclasser ou en mode diversifié (équivalents regroupés ensuite)
+            diverse = self.diverse_results if diverse is None else diverse
+            use_clusters = diverse and self.clusters is not None and len(self.clusters) > 0
+            n_fetch = n_results * 2 if use_clusters or preferences else n_results
             
-            # Formater les résultats
             analyses = []
-            for i in range(len(results['documents'][0])):
-                metadata = results['metadatas'][0][i]
-                analyse = {
-                    'titre': metadata['titre'],
-                    'code': metadata['code'],
-                    'lien': metadata['lien'],
-                    'laboratoire': metadata['laboratoire'],
-                    'description': metadata['description'],
-                    'indication': metadata['indication'],
-                    'prelevement': metadata['prelevement'],
-                    'technique': metadata['technique'],
-                    'reference': metadata['reference'],
-                    'score': 1 - results['distances'][0][i]  # Convertir distance en score
-                }
-                analyses.append(analyse)
+            while conditions and not analyses:
+                analyses = self._search_filtered(query, n_fetch, query_embedding, combine_where(where, *conditions))
+                conditions = conditions[:-1]
+            if not analyses:
+                analyses = self._search_filtered(query, n_fetch, query_embedding, where)
             
-            return analyses
+            analyses = rank_by_preferences(analyses, preferences)
+            return self._diversify(analyses, n_results) if use_clusters else analyses[:n_results]
             
         except Exception as e:
             print(f"Erreur lors de la recherche: {e}")
             return []
     
-    def generate_compendium_response(self, query: str, analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _search_filtered(self, query: str, n_results: int, query_embedding: List[float],
+                         where: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        Génère une réponse basée sur les analyses trouvées
+        Recherche vectorielle et lexicale parmi les analyses satisfaisant un filtre
+        
+        Args:
+            query: Requête de recherche
+            n_results: Nombre de résultats
+            query_embedding: Embedding de la requête
+            where: Filtre sur les métadonnées (None pour toutes les analyses)
+            
+        Returns:
+            Liste des analyses pertinentes
+        """
+        # Candidats présélectionnés par l'index des facettes (None : pas de filtre, ou champ non indexé)
+        candidates = self.facet_index.filter(where) if where and len(self.facet_index) else None
+        if candidates is not None and not candidates:
+            return []
+        
+        # Élargir les candidats de chaque classement avant la fusion
+        n_candidates = n_results * 3 if self.hybrid_search else n_results
+        
+        vector_hits = {}
+        if self.compact_store is not None and len(self.compact_store) and (candidates is not None or not where):
+            # Recherche exhaustive dans le stockage compact, métadonnées lues dans ChromaDB
+            hits = self.compact_store.search(query_embedding, n_candidates, allowed_ids=candidates)
+            stored = self.collection.get(ids=[analysis_id for analysis_id, _ in hits], include=['metadatas'])
+            metadatas = dict(zip(stored['ids'], stored['metadatas']))
+            for analysis_id, score in hits:
+                if analysis_id in metadatas:
+                    vector_hits[analysis_id] = (metadatas[analysis_id], score)
+        else:
+            results = None
+            if candidates is not None and len(candidates) > self.facet_exact_limit:
+                # Beaucoup de candidats : recherche non filtrée élargie, puis filtrage
+                oversample = n_candidates * 2 * -(-len(self.facet_index) // len(candidates))
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=min(oversample, len(self.facet_index))
+                )
+                kept = [i for i, analysis_id in enumerate(results['ids'][0]) if analysis_id in candidates][:n_candidates]
+                if len(kept) < n_candidates:
+                    results = None
+                else:
+                    results = {key: [[results[key][0][i] for i in kept]] for key in ('ids', 'metadatas', 'distances')}
+            if results is None and candidates is not None:
+                # Peu de candidats : scores exacts, sans requête filtrée sur l'index HNSW
+                results = self.collection.query_subset([query_embedding], sorted(candidates), n_results=n_candidates)
+            elif results is None:
+                # Rechercher dans ChromaDB
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=n_candidates,
+                    where=where
+                )
+            
+            for i in range(len(results['ids'][0])):
+                vector_hits[results['ids'][0][i]] = (
+                    results['metadatas'][0][i],
+                    1 - results['distances'][0][i]  # Convertir distance en score
+                )
+        
+        if not self.hybrid_search or len(self.lexical_index) == 0:
+            return [self._format_analysis(metadata, score, analysis_id) for analysis_id, (metadata, score) in vector_hits.items()]
+        
+        lexical_hits = {
+            analysis_id: metadata
+            for analysis_id, _, metadata in self.lexical_index.search(query, n_candidates, allowed_ids=candidates)
+            if candidates is not None or not where or match_where(metadata, where)
+        }
+        
+        # Fusionner les deux classements (Reciprocal Rank Fusion)
+        fused = reciprocal_rank_fusion([list(vector_hits), list(lexical_hits)])
+        
+        analyses = []
+        for analysis_id, score in fused[:n_results]:
+            if analysis_id in vector_hits:
+                metadata = vector_hits[analysis_id][0]
+            else:
+                metadata = lexical_hits[analysis_id]
+            analyses.append(self._format_analysis(metadata, score, analysis_id))
+        
+        return analyses
+    
+    def _diversify(self, analyses: List[Dict[str, Any]], n_results: int) -> List[Dict[str, Any]]:
+        """
+        Ne garde que le mieux classé de chaque groupe d'analyses équivalentes
+        
+        Les autres laboratoires du groupe (retrouvés ou non par la recherche) sont
+        ajoutés à ce résultat dans 'variants'.
+        
+        Args:
+            analyses: Analyses trouvées, par pertinence décroissante
+            n_results: Nombre de résultats
+            
+        Returns:
+            Analyses de groupes distincts, avec leurs variantes
+        """
+        selected = []
+        seen = set()
+        for analyse in analyses:
+            members = self.clusters.members(analyse['analysis_id'])
+            key = members[0] if members else analyse['analysis_id']
+            if key in seen:
+                continue
+            seen.add(key)
+            selected.append((analyse, [member for member in members if member != analyse['analysis_id']]))
+            if len(selected) == n_results:
+                break
+        
+        variant_ids = [member for _, members in selected for member in members]
+        metadatas = {}
+        if variant_ids:
+            stored = self.collection.get(ids=variant_ids, include=['metadatas'])
+            metadatas = dict(zip(stored['ids'], stored['metadatas']))
+        
+        for analyse, members in selected:
+            analyse['variants'] = [
+                {key: metadatas[member].get(key, '') for key in ('laboratoire', 'titre', 'code', 'lien', 'delai')}
+                for member in members if member in metadatas
+            ]
+        return [analyse for analyse, _ in selected]
+    
+    async def search_analyses_async(self, query: str, n_results: int = 10, query_embedding: Optional[List[float]] = None,
+                                    where: Optional[Dict[str, Any]] = None, diverse: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Variante asynchrone de search_analyses
+        
+        L'embedding est obtenu sans bloquer la boucle d'événements, la requête
+        ChromaDB et la fusion lexicale s'exécutent dans un thread.
+        
+        Args:
+            query: Requête de recherche
+            n_results: Nombre de résultats
+            query_embedding: Embedding de la requête, s'il est déjà connu
+            where: Filtre sur les métadonnées (syntaxe ChromaDB)
+            diverse: Regrouper les analyses équivalentes (COMPENDIUM_DIVERSE_RESULTS si None)
+            
+        Returns:
+            Liste des analyses pertinentes
+        """
+        if query_embedding is None:
+            query_embedding = await self.embed_query_async(query)
+            if query_embedding is None:
+                return []
+        
+        return await asyncio.to_thread(self.search_analyses, query, n_results, query_embedding, where, diverse)
+    
+    def _format_analysis(self, metadata: Dict[str, Any], score: float, analysis_id: str = "") -> Dict[str, Any]:
+        """
+        Formate une analyse trouvée à partir de ses métadonnées
+        
+        Args:
+            metadata: Métadonnées de l'analyse
+            score: Score de pertinence
+            analysis_id: Identifiant de l'analyse
+            
+        Returns:
+            Analyse formatée
+        """
+        return {
+            'analysis_id': analysis_id,
+            'titre': metadata['titre'],
+            'code': metadata['code'],
+            'lien': metadata['lien'],
+            'laboratoire': metadata['laboratoire'],
+            'description': metadata['description'],
+            'indication': metadata['indication'],
+            'prelevement': metadata['prelevement'],
+            'technique': metadata['technique'],
+            'reference': metadata['reference'],
+            # Absents des métadonnées indexées avant l'ajout des champs par laboratoire
+            'service': metadata.get('service', ''),
+            'matrice': metadata.get('matrice', ''),
+            'recipient': metadata.get('recipient', ''),
+            'volume_minimum': metadata.get('volume_minimum', ''),
+            'delai': metadata.get('delai', ''),
+            'delai_heures': metadata.get('delai_heures'),
+            'frequence': metadata.get('frequence', ''),
+            'stabilite': metadata.get('stabilite', ''),
+            'mots_cles': metadata.get('mots_cles', ''),
+            'accredite': metadata.get('accredite'),
+            'urgence': metadata.get('urgence'),
+            'score': score
+        }
+    
+    def _format_context(self, analyses: List[Dict[str, Any]]) -> str:
+        """
+        Présente les analyses trouvées dans le contexte envoyé au modèle
         
         Args:
-            query: Question de l'utilisateur
             analyses: Analyses trouvées
             
         Returns:
-            Réponse avec liens
+            Texte du contexte (uniquement les champs renseignés), vide si aucune analyse
         """
-        if not analyses:
-            return {
-                'answer': "Désolé, je n'ai pas trouvé d'analyses correspondant à votre recherche dans le compendium belge.",
-                'sources': []
-            }
+        # Préparer le contexte : uniquement les champs renseignés de chaque analyse
+        entries = []
+        for i, analyse in enumerate(analyses[:self.context_analyses]):
+            lines = [f"=== ANALYSE {i+1} ==="]
+            for key, label in CONTEXT_FIELDS:
+                value = analyse.get(key)
+                if isinstance(value, bool):
+                    value = "oui" if value else "non"
+                if key == 'prelevement' and value == analyse.get('matrice'):
+                    continue
+                if value:
+                    lines.append(f"{label}: {value}")
+            if analyse.get('variants'):
+                lines.append("Équivalents dans d'autres laboratoires:")
+                for variant in analyse['variants']:
+                    details = f" ({variant['code']})" if variant['code'] else ""
+                    details += f", délai {variant['delai']}" if variant['delai'] else ""
+                    lines.append(f"- {variant['laboratoire']}: {variant['titre']}{details} — {variant['lien']}")
+            lines.append(f"Score de pertinence: {analyse['score']:.3f}")
+            entries.append("\n".join(lines))
+        return "\n\n".join(entries)
+    
+    def _build_messages(self, query: str, analyses: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Construit les messages envoyés au modèle de génération
         
-        # Préparer le contexte avec plus de détails
-        context_text = "\n\n".join([
-            f"=== ANALYSE {i+1} ===\n"
-            f"Titre: {analyse['titre']}\n"
-            f"Laboratoire: {analyse['laboratoire']}\n"
-            f"Code: {analyse['code']}\n"
-            f"Lien direct: {analyse['lien']}\n"
-            f"Description: {analyse['description']}\n"
-            f"Indication clinique: {analyse['indication']}\n"
-            f"Type de prélèvement: {analyse['prelevement']}\n"
-            f"Technique utilisée: {analyse['technique']}\n"
-            f"Valeurs de référence: {analyse['reference']}\n"
-            f"Score de pertinence: {analyse['score']:.3f}"
-            for i, analyse in enumerate(analyses[:5])  # Limiter à 5 analyses
-        ])
+        Args:
+            query: Question de l'utilisateur
+            analyses: Analyses trouvées
+            
+        Returns:
+            Messages système et utilisateur
+        """
+        context_text = self._format_context(analyses)
         
         # Prompt amélioré pour plus de contexte biologique
         prompt = f"""Vous êtes un assistant médical spécialisé dans les analyses de laboratoire belges, avec une expertise approfondie en biologie médicale.
@@ -377,41 +1055,109 @@ STRUCTURE DE RÉPONSE ATTENDUE:
 
 Répondez en français médical professionnel, adapté à un biologiste médical expérimenté."""
         
+        return [
+            {"role": "system", "content": "Vous êtes un assistant médical expert en biologie clinique, spécialisé dans les analyses de laboratoire belges. Votre expertise couvre la biochimie, la microbiologie, l'hématologie, l'immunologie et la biologie moléculaire. Répondez avec un niveau scientifique élevé adapté aux professionnels de santé."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _build_sources(self, analyses: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Prépare les liens affichés avec la réponse
+        
+        Args:
+            analyses: Analyses trouvées
+            
+        Returns:
+            Liste des sources
+        """
+        # Préparer les sources avec plus d'informations
+        sources = []
+        for i, analyse in enumerate(analyses[:5]):  # Limiter à 5 liens
+            # Créer un titre plus descriptif
+            title_with_context = f"{analyse['titre']}"
+            if analyse['code']:
+                title_with_context += f" ({analyse['code']})"
+            
+            sources.append({
+                'title': title_with_context,
+                'lab': analyse['laboratoire'],
+                'url': analyse['lien'],
+                'code': analyse['code'],
+                'description': analyse['description'][:100] + "..." if len(analyse['description']) > 100 else analyse['description'],
+                'prelevement': analyse['prelevement'][:50] + "..." if len(analyse['prelevement']) > 50 else analyse['prelevement'],
+                'technique': analyse['technique'][:50] + "..." if len(analyse['technique']) > 50 else analyse['technique'],
+                'score': round(analyse['score'], 3)
+            })
+        
+        return sources
+    
+    def generate_compendium_response(self, query: str, analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Génère une réponse basée sur les analyses trouvées
+        
+        Args:
+            query: Question de l'utilisateur
+            analyses: Analyses trouvées
+            
+        Returns:
+            Réponse avec liens
+        """
+        if not analyses:
+            return {
+                'answer': "Désolé, je n'ai pas trouvé d'analyses correspondant à votre recherche dans le compendium belge.",
+                'sources': []
+            }
+        
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Vous êtes un assistant médical expert en biologie clinique, spécialisé dans les analyses de laboratoire belges. Votre expertise couvre la biochimie, la microbiologie, l'hématologie, l'immunologie et la biologie moléculaire. Répondez avec un niveau scientifique élevé adapté aux professionnels de santé."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(query, analyses),
                 max_tokens=1200,
                 temperature=0.1
             )
             
             answer = response.choices[0].message.content
             
-            # Préparer les sources avec plus d'informations
-            sources = []
-            for i, analyse in enumerate(analyses[:5]):  # Limiter à 5 liens
-                # Créer un titre plus descriptif
-                title_with_context = f"{analyse['titre']}"
-                if analyse['code']:
-                    title_with_context += f" ({analyse['code']})"
-                
-                sources.append({
-                    'title': title_with_context,
-                    'lab': analyse['laboratoire'],
-                    'url': analyse['lien'],
-                    'code': analyse['code'],
-                    'description': analyse['description'][:100] + "..." if len(analyse['description']) > 100 else analyse['description'],
-                    'prelevement': analyse['prelevement'][:50] + "..." if len(analyse['prelevement']) > 50 else analyse['prelevement'],
-                    'technique': analyse['technique'][:50] + "..." if len(analyse['technique']) > 50 else analyse['technique'],
-                    'score': round(analyse['score'], 3)
-                })
-            
             return {
                 'answer': answer,
-                'sources': sources
+                'sources': self._build_sources(analyses)
+            }
+            
+        except Exception as e:
+            print(f"Erreur lors de la génération: {e}")
+            return {
+                'answer': f"Erreur lors de la génération de la réponse: {str(e)}",
+                'sources': []
+            }
+    
+    async def generate_compendium_response_async(self, query: str, analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Variante asynchrone de generate_compendium_response
+        
+        Args:
+            query: Question de l'utilisateur
+            analyses: Analyses trouvées
+            
+        Returns:
+            Réponse avec liens
+        """
+        if not analyses:
+            return {
+                'answer': "Désolé, je n'ai pas trouvé d'analyses correspondant à votre recherche dans le compendium belge.",
+                'sources': []
+            }
+        
+        try:
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4",
+                messages=self._build_messages(query, analyses),
+                max_tokens=1200,
+                temperature=0.1
+            )
+            
+            return {
+                'answer': response.choices[0].message.content,
+                'sources': self._build_sources(analyses)
             }
             
         except Exception as e:
@@ -421,20 +1167,79 @@ Répondez en français médical professionnel, adapté à un biologiste médical
                 'sources': []
             }
     
-    def ask_compendium(self, query: str) -> Dict[str, Any]:
+    def stream_compendium(self, query: str, query_embedding: Optional[List[float]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Interroge le compendium en diffusant la réponse au fil de sa génération
+        
+        Les liens sont émis dès la fin de la recherche, puis la réponse
+        token par token.
+        
+        Args:
+            query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
+            
+        Returns:
+            Itérateur d'événements {'event': 'sources' | 'token' | 'done' | 'error', 'data': ...}
+        """
+        print(f"Recherche compendium (streaming): {query}")
+        
+        # Requête réduite à un code connu : fiche directe
+        lookup = self.answer_from_code(query)
+        if lookup is not None:
+            yield {'event': 'sources', 'data': {'sources': lookup['sources'], 'query': query}}
+            yield {'event': 'token', 'data': {'text': lookup['answer']}}
+            yield {'event': 'done', 'data': {'query': query}}
+            return
+        
+        relevant_analyses = self.search_analyses(query, n_results=10, query_embedding=query_embedding)
+        
+        if not relevant_analyses:
+            yield {'event': 'sources', 'data': {'sources': [], 'query': query}}
+            yield {'event': 'token', 'data': {'text': "Je n'ai pas trouvé d'analyses pertinentes dans le compendium belge."}}
+            yield {'event': 'done', 'data': {'query': query}}
+            return
+        
+        yield {'event': 'sources', 'data': {'sources': self._build_sources(relevant_analyses), 'query': query}}
+        
+        try:
+            stream = self.client.chat.completions.create(
+                model="gpt-4",
+                messages=self._build_messages(query, relevant_analyses),
+                max_tokens=1200,
+                temperature=0.1,
+                stream=True
+            )
+            
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {'event': 'token', 'data': {'text': chunk.choices[0].delta.content}}
+            
+            yield {'event': 'done', 'data': {'query': query}}
+            
+        except Exception as e:
+            print(f"Erreur lors de la génération: {e}")
+            yield {'event': 'error', 'data': {'error': f"Erreur lors de la génération de la réponse: {str(e)}"}}
+    
+    def ask_compendium(self, query: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Interface principale pour interroger le compendium
         
         Args:
             query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
             
         Returns:
             Réponse complète avec liens
         """
         print(f"Recherche compendium: {query}")
         
+        # Requête réduite à un code connu : fiche directe
+        lookup = self.answer_from_code(query)
+        if lookup is not None:
+            return lookup
+        
         # Rechercher les analyses pertinentes
-        relevant_analyses = self.search_analyses(query, n_results=10)
+        relevant_analyses = self.search_analyses(query, n_results=10, query_embedding=query_embedding)
         
         if not relevant_analyses:
             return {
@@ -447,4 +1252,36 @@ Répondez en français médical professionnel, adapté à un biologiste médical
         result = self.generate_compendium_response(query, relevant_analyses)
         result['query'] = query
         
-        return result 
\ No newline at end of file
+        return result
+    
+    async def ask_compendium_async(self, query: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Variante asynchrone de ask_compendium
+        
+        Args:
+            query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
+            
+        Returns:
+            Réponse complète avec liens
+        """
+        print(f"Recherche compendium: {query}")
+        
+        # Requête réduite à un code connu : fiche directe
+        lookup = self.answer_from_code(query)
+        if lookup is not None:
+            return lookup
+        
+        relevant_analyses = await self.search_analyses_async(query, n_results=10, query_embedding=query_embedding)
+        
+        if not relevant_analyses:
+            return {
+                'answer': "Je n'ai pas trouvé d'analyses pertinentes dans le compendium belge.",
+                'sources': [],
+                'query': query
+            }
+        
+        result = await self.generate_compendium_response_async(query, relevant_analyses)
+        result['query'] = query
+        
+        return result
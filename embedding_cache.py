@@ -0,0 +1,356 @@
+"""
+Cache persistant des embeddings partagé par RAGSystem et CompendiumRAG
+Les vecteurs sont stockés sur disque (SQLite), indexés par (modèle, empreinte du texte)
+"""
+
+import os
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 20000
+# Intervalle d'écriture des dates d'utilisation des vecteurs lus (secondes)
+LAST_USED_FLUSH_INTERVAL = 60.0
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 flush_interval: float = LAST_USED_FLUSH_INTERVAL):
+        """
+        Initialise le cache d'embeddings
+
+        Args:
+            path: Chemin du fichier SQLite
+            max_entries: Nombre maximum de vecteurs conservés (éviction LRU au-delà)
+            flush_interval: Délai maximum avant d'écrire en base les dates d'utilisation
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Dates d'utilisation des vecteurs lus, écrites par lots (voir _flush_last_used) :
+        # une lecture n'écrit pas dans SQLite
+        self._last_used = {}
+        self._last_flush = time.time()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """
+        Calcule la clé d'un texte pour un modèle donné
+
+        Args:
+            model: Nom du modèle d'embeddings
+            text: Texte exact envoyé à l'API
+
+        Returns:
+            Empreinte SHA-256 hexadécimale
+        """
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Récupère les embeddings connus pour une liste de textes
+
+        Args:
+            model: Nom du modèle d'embeddings
+            texts: Liste des textes
+
+        Returns:
+            Liste alignée sur texts, None pour les textes absents du cache
+        """
+        keys = [self.make_key(model, text) for text in texts]
+        found = {}
+
+        with self._lock:
+            # SQLite limite le nombre de paramètres par requête
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                for key in found:
+                    self._last_used[key] = now
+                if now - self._last_flush >= self.flush_interval:
+                    self._flush_last_used()
+                    self._conn.commit()
+
+            results = [found.get(key) for key in keys]
+            hits = sum(1 for r in results if r is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """
+        Enregistre des embeddings dans le cache
+
+        Args:
+            model: Nom du modèle d'embeddings
+            texts: Liste des textes
+            embeddings: Embeddings correspondants
+        """
+        now = time.time()
+        rows = [
+            (self.make_key(model, text), model, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            # L'éviction doit voir les dernières lectures
+            self._flush_last_used()
+            self._evict()
+            self._conn.commit()
+
+    def _flush_last_used(self):
+        """
+        Écrit les dates d'utilisation en attente (verrou détenu, sans commit)
+        """
+        if self._last_used:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = MAX(last_used, ?) WHERE key = ?",
+                [(used, key) for key, used in self._last_used.items()]
+            )
+            self._last_used = {}
+        self._last_flush = time.time()
+
+    def _evict(self):
+        """
+        Supprime les entrées les moins récemment utilisées au-delà de max_entries
+        """
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def count(self) -> int:
+        """
+        Retourne le nombre d'entrées du cache
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne les compteurs du cache
+
+        Returns:
+            Dictionnaire avec hits, misses, taux de succès et taille
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': self.count(),
+            'max_entries': self.max_entries
+        }
+
+    def reset_stats(self):
+        """
+        Remet les compteurs à zéro
+        """
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+def fetch_embeddings(client, texts: List[str], model: str, cache: Optional[EmbeddingCache]) -> List[List[float]]:
+    """
+    Génère les embeddings en ne payant que les textes absents du cache
+
+    Args:
+        client: Client OpenAI
+        texts: Liste des textes
+        model: Nom du modèle d'embeddings
+        cache: Cache d'embeddings (None pour le désactiver)
+
+    Returns:
+        Liste des embeddings, dans l'ordre de texts
+    """
+    if cache is None:
+        response = client.embeddings.create(model=model, input=texts)
+        return [data.embedding for data in response.data]
+
+    results = cache.get_many(model, texts)
+
+    # Textes manquants, sans doublons
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, results) if embedding is None))
+    if missing:
+        response = client.embeddings.create(model=model, input=missing)
+        fresh = dict(zip(missing, [data.embedding for data in response.data]))
+        cache.put_many(model, missing, [fresh[text] for text in missing])
+        results = [embedding if embedding is not None else fresh[text] for text, embedding in zip(texts, results)]
+
+    return results
+
+async def fetch_embeddings_async(client, texts: List[str], model: str, cache: Optional[EmbeddingCache]) -> List[List[float]]:
+    """
+    Variante asynchrone de fetch_embeddings (client AsyncOpenAI)
+
+    Args:
+        client: Client AsyncOpenAI
+        texts: Liste des textes
+        model: Nom du modèle d'embeddings
+        cache: Cache d'embeddings (None pour le désactiver)
+
+    Returns:
+        Liste des embeddings, dans l'ordre de texts
+    """
+    if cache is None:
+        response = await client.embeddings.create(model=model, input=texts)
+        return [data.embedding for data in response.data]
+
+    # Accès SQLite bloquants (verrou du cache, disque) : hors de la boucle d'événements
+    results = await asyncio.to_thread(cache.get_many, model, texts)
+
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, results) if embedding is None))
+    if missing:
+        response = await client.embeddings.create(model=model, input=missing)
+        fresh = dict(zip(missing, [data.embedding for data in response.data]))
+        await asyncio.to_thread(cache.put_many, model, missing, [fresh[text] for text in missing])
+        results = [embedding if embedding is not None else fresh[text] for text, embedding in zip(texts, results)]
+
+    return results
+
+class QueryEmbeddingMemo:
+    def __init__(self, max_entries: int = 1024):
+        """
+        Initialise la mémoïsation en mémoire des embeddings de requêtes (LRU)
+
+        Args:
+            max_entries: Nombre maximum de requêtes conservées
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        """
+        Récupère l'embedding d'une requête déjà vue
+
+        Args:
+            model: Nom du modèle d'embeddings
+            query: Texte exact de la requête
+
+        Returns:
+            Embedding ou None
+        """
+        key = (model, query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model: str, query: str, embedding: List[float]):
+        """
+        Mémorise l'embedding d'une requête
+
+        Args:
+            model: Nom du modèle d'embeddings
+            query: Texte exact de la requête
+            embedding: Embedding de la requête
+        """
+        key = (model, query)
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne les compteurs de la mémoïsation
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries
+        }
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Retourne l'instance de cache partagée par les deux systèmes RAG
+
+    Returns:
+        Cache d'embeddings, ou None si désactivé (EMBEDDING_CACHE_ENABLED=false)
+    """
+    global _shared_cache
+
+    if os.getenv('EMBEDDING_CACHE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            cache_path = os.getenv('EMBEDDING_CACHE_PATH', './embedding_cache.db')
+            # Sur Render, utiliser un répertoire temporaire si le chemin par défaut n'est pas accessible
+            if not os.access(os.path.dirname(cache_path) or '.', os.W_OK):
+                cache_path = '/tmp/embedding_cache.db'
+            max_entries = int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+            _shared_cache = EmbeddingCache(cache_path, max_entries=max_entries)
+        return _shared_cache
+
+_shared_memo = None
+
+def get_query_memo() -> QueryEmbeddingMemo:
+    """
+    Retourne la mémoïsation des requêtes partagée par les deux systèmes RAG
+
+    Returns:
+        Mémoïsation des embeddings de requêtes
+    """
+    global _shared_memo
+
+    with _shared_cache_lock:
+        if _shared_memo is None:
+            _shared_memo = QueryEmbeddingMemo(max_entries=int(os.getenv('QUERY_EMBEDDING_MEMO_SIZE', 1024)))
+        return _shared_memo
@@ -0,0 +1,253 @@
+"""
+Pipeline d'embeddings concurrent pour la construction des bases vectorielles
+Regroupe les textes par budget de tokens, parallélise les appels à l'API
+et écrit chaque batch dans ChromaDB dès qu'il est prêt
+"""
+
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Any, Callable, Optional, Tuple
+import openai
+from embedding_cache import fetch_embeddings
+
+# Erreurs transitoires pour lesquelles un nouvel essai a du sens
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+class EmbeddingPipeline:
+    def __init__(self, client, model: str, encoding, cache=None,
+                 max_workers: int = 4, max_batch_tokens: int = 20000, max_batch_size: int = 256,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Initialise le pipeline d'embeddings
+
+        Args:
+            client: Client OpenAI
+            model: Nom du modèle d'embeddings
+            encoding: Encodeur tiktoken utilisé pour compter les tokens
+            cache: Cache d'embeddings partagé (optionnel)
+            max_workers: Nombre maximum de requêtes simultanées
+            max_batch_tokens: Budget de tokens par requête
+            max_batch_size: Nombre maximum de textes par requête
+            max_retries: Nombre de nouvelles tentatives par batch
+            base_delay: Délai initial du backoff exponentiel (secondes)
+            max_delay: Délai maximum entre deux tentatives (secondes)
+        """
+        self.client = client
+        self.model = model
+        self.encoding = encoding
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def pack_batches(self, items: List[Tuple[str, Any]]) -> List[List[Tuple[str, Any]]]:
+        """
+        Regroupe les textes en batches respectant le budget de tokens
+
+        Args:
+            items: Liste de couples (texte, charge utile)
+
+        Returns:
+            Liste de batches
+        """
+        batches = []
+        current = []
+        current_tokens = 0
+
+        for item in items:
+            tokens = len(self.encoding.encode(item[0]))
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+
+        return batches
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Calcule le délai avant la prochaine tentative
+
+        Args:
+            error: Erreur rencontrée
+            attempt: Numéro de la tentative (0 pour la première)
+
+        Returns:
+            Délai en secondes
+        """
+        # Respecter l'en-tête Retry-After renvoyé avec les erreurs 429
+        response = getattr(error, 'response', None)
+        if response is not None:
+            retry_after = response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.max_delay)
+                except ValueError:
+                    pass
+
+        delay = min(self.base_delay * (2 ** attempt), self.max_delay)
+        return delay * (0.5 + random.random() / 2)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Génère les embeddings d'un batch avec backoff sur les erreurs transitoires
+
+        Args:
+            texts: Textes du batch
+
+        Returns:
+            Liste des embeddings
+
+        Raises:
+            Exception: Dernière erreur si toutes les tentatives échouent
+        """
+        attempt = 0
+        while True:
+            try:
+                return fetch_embeddings(self.client, texts, self.model, self.cache)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                print(f"Erreur transitoire des embeddings ({type(e).__name__}), nouvel essai dans {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def run(self, items: List[Tuple[str, Any]],
+            writer: Callable[[List[str], List[Any], List[List[float]]], None],
+            progress=None) -> List[Tuple[str, Any]]:
+        """
+        Génère les embeddings en parallèle et les transmet au writer au fil de l'eau
+
+        Args:
+            items: Liste de couples (texte, charge utile)
+            writer: Fonction appelée avec (textes, charges utiles, embeddings) pour chaque batch
+            progress: Suivi de la construction (optionnel)
+
+        Returns:
+            Éléments des batches en échec
+        """
+        batches = self.pack_batches(items)
+        failed = []
+
+        def on_success(key, batch):
+            if progress is not None:
+                progress.advance()
+
+        def on_failure(key, batch, error):
+            failed.extend(batch)
+            if progress is not None:
+                progress.fail()
+
+        if batches:
+            print(f"{len(items)} textes répartis en {len(batches)} batches ({self.max_workers} requêtes simultanées)")
+            if progress is not None:
+                progress.add_total(len(batches))
+            self.run_batches(
+                list(enumerate(batches, 1)),
+                writer,
+                on_success=on_success,
+                on_failure=on_failure
+            )
+
+        return failed
+
+    def run_batches(self, batches: List[Tuple[Any, List[Tuple[str, Any]]]],
+                    writer: Callable[[List[str], List[Any], List[List[float]]], None],
+                    on_success: Optional[Callable[[Any, List[Tuple[str, Any]]], None]] = None,
+                    on_failure: Optional[Callable[[Any, List[Tuple[str, Any]], Exception], None]] = None):
+        """
+        Traite des batches déjà constitués
+
+        Le writer est appelé dans le thread courant pendant que les requêtes
+        suivantes sont en cours, ce qui recouvre les écritures ChromaDB
+        et les appels réseau.
+
+        Args:
+            batches: Liste de couples (clé du batch, éléments)
+            writer: Fonction appelée avec (textes, charges utiles, embeddings) pour chaque batch
+            on_success: Fonction appelée avec (clé, éléments) après l'écriture d'un batch
+            on_failure: Fonction appelée avec (clé, éléments, erreur) pour un batch en échec
+                (embeddings ou écriture)
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            queue = iter(batches)
+            in_flight = {}
+
+            def submit_next() -> bool:
+                try:
+                    key, batch = next(queue)
+                except StopIteration:
+                    return False
+                future = executor.submit(self.embed_batch, [text for text, _ in batch])
+                in_flight[future] = (key, batch)
+                return True
+
+            # Garder un batch d'avance par worker pour ne jamais laisser l'API inactive
+            for _ in range(self.max_workers * 2):
+                if not submit_next():
+                    break
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, batch = in_flight.pop(future)
+                    submit_next()
+
+                    try:
+                        embeddings = future.result()
+                    except Exception as e:
+                        print(f"Échec du batch {key}: {e}")
+                        if on_failure:
+                            on_failure(key, batch, e)
+                        continue
+
+                    # Une erreur d'écriture (ChromaDB, disque plein) ne fait échouer que ce batch :
+                    # les requêtes en cours continuent et le batch sera repris
+                    try:
+                        writer([text for text, _ in batch], [payload for _, payload in batch], embeddings)
+                        if on_success:
+                            on_success(key, batch)
+                    except Exception as e:
+                        print(f"Échec de l'écriture du batch {key}: {e}")
+                        if on_failure:
+                            on_failure(key, batch, e)
+                        continue
+                    print(f"Batch {key} ajouté")
+
+def create_embedding_pipeline(client, model: str, encoding, cache=None) -> EmbeddingPipeline:
+    """
+    Crée un pipeline configuré depuis les variables d'environnement
+
+    Args:
+        client: Client OpenAI
+        model: Nom du modèle d'embeddings
+        encoding: Encodeur tiktoken
+        cache: Cache d'embeddings partagé (optionnel)
+
+    Returns:
+        Pipeline d'embeddings
+    """
+    return EmbeddingPipeline(
+        client,
+        model,
+        encoding,
+        cache=cache,
+        max_workers=int(os.getenv('EMBEDDING_MAX_WORKERS', 4)),
+        max_batch_tokens=int(os.getenv('EMBEDDING_BATCH_TOKENS', 20000)),
+        max_retries=int(os.getenv('EMBEDDING_MAX_RETRIES', 5))
+    )
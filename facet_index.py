@@ -0,0 +1,353 @@
+"""
+Index de facettes du compendium (laboratoire, matrice, service, urgence, délai de rendu)
+Évalue en mémoire les filtres au format `where` de ChromaDB pour présélectionner
+les analyses avant la recherche vectorielle, et déduit des questions
+("analyses sur LCR à l'UZA avec rendu < 48h") un filtre sur le laboratoire et
+des préférences (matrice, délai, urgence) qui ne font que reclasser les résultats :
+ces champs ne sont pas renseignés par tous les laboratoires.
+"""
+
+import re
+import json
+import operator
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable
+import numpy as np
+from lexical_index import fold_text, STOPWORDS
+from lab_parser import parse_delai_heures
+
+# Facettes à valeurs discrètes (texte ou booléen) et facettes numériques
+CATEGORICAL_FACETS = ('laboratoire', 'matrice', 'service', 'urgence', 'accredite')
+NUMERIC_FACETS = ('delai_heures',)
+
+COMPARISONS = {
+    '$gt': operator.gt, '$gte': operator.ge, '$lt': operator.lt, '$lte': operator.le,
+    '$eq': operator.eq, '$ne': operator.ne
+}
+
+# Mots trop génériques pour désigner un laboratoire ("CHU ULG" -> "ulg")
+GENERIC_LAB_WORDS = {'chr', 'chu', 'laboratoire', 'inconnu', 'labo'}
+
+# "rendu < 48h", "en moins de 2 jours", "résultat sous 24 heures", "plus de 7 jours"
+DELAI_QUERY_PATTERN = re.compile(
+    r"(<=?|≤|>=?|≥|moins de|au plus|maximum|max|sous|en|plus de|au moins)\s*"
+    r"(\d+(?:[.,]\d+)?\s*(?:heures?|h|jours?|j|semaines?|sem|mois)\b)"
+)
+URGENCE_QUERY_PATTERN = re.compile(r"\burgen(?:ce|ces|t|ts|te|tes)\b")
+# "sur LCR", "dans le sang", "matrice urine", "échantillon de selles"
+MATRICE_QUERY_PATTERN = re.compile(r"\b(?:sur|dans|matrice|echantillons? d[e'])\s*(?:(?:le|la|les|l'|du|des|un|une)\s*)?([a-z0-9]+)")
+# Termes d'une question couvrant aussi d'autres matrices ("dans le sang" : sérum, plasma)
+# Codes, nombres et sigles d'une question ("2276-4", "48h", "CMV")
+CODE_TERM_PATTERN = re.compile(r"[A-Za-z0-9]+(?:[_\-./][A-Za-z0-9]+)*")
+
+MATRICE_SYNONYMS = {
+    'sang': ('serum', 'plasma'),
+    'sanguin': ('sang', 'serum', 'plasma'),
+    'bloed': ('sang', 'serum', 'plasma'),
+}
+
+def match_where(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """
+    Évalue un filtre `where` ChromaDB sur les métadonnées d'un document
+
+    Args:
+        metadata: Métadonnées du document
+        where: Filtre ({champ: valeur}, {champ: {"$lte": 48}}, {"$and": [...]}, {"$or": [...]})
+
+    Returns:
+        True si le document satisfait le filtre
+    """
+    for key, condition in where.items():
+        if key == '$and':
+            if not all(match_where(metadata, part) for part in condition):
+                return False
+        elif key == '$or':
+            if not any(match_where(metadata, part) for part in condition):
+                return False
+        else:
+            if key not in metadata:
+                return False
+            value = metadata[key]
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for op, operand in condition.items():
+                if op == '$in':
+                    matched = value in operand
+                elif op == '$nin':
+                    matched = value not in operand
+                elif op in COMPARISONS:
+                    matched = bool(COMPARISONS[op](value, operand))
+                else:
+                    raise ValueError(f"Opérateur de filtre inconnu: {op}")
+                if not matched:
+                    return False
+    return True
+
+def match_preference(metadata: Dict[str, Any], condition: Dict[str, Any]) -> bool:
+    """
+    Évalue une préférence déduite d'une question ({champ: condition})
+
+    Contrairement à match_where, une valeur absente ou vide (champ non renseigné
+    par le laboratoire) satisfait la préférence.
+
+    Args:
+        metadata: Métadonnées (ou analyse formatée) du document
+        condition: Condition sur un ou plusieurs champs
+
+    Returns:
+        True si le document ne contredit pas la préférence
+    """
+    for key, value_condition in condition.items():
+        value = metadata.get(key)
+        if value is None or value == '' or (isinstance(value, float) and np.isnan(value)):
+            continue
+        if not match_where({key: value}, {key: value_condition}):
+            return False
+    return True
+
+def rank_by_preferences(analyses: List[Dict[str, Any]], preferences: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Reclasse des analyses selon les préférences d'une question
+
+    Les analyses qui contredisent le moins de préférences passent en tête ; l'ordre
+    de pertinence est conservé entre analyses ex aequo et aucune n'est écartée.
+
+    Args:
+        analyses: Analyses par pertinence décroissante
+        preferences: Conditions déduites de la question (voir FacetIndex.parse_preferences)
+
+    Returns:
+        Analyses reclassées
+    """
+    if not preferences:
+        return analyses
+    return sorted(analyses, key=lambda analyse: sum(not match_preference(analyse, condition)
+                                                    for condition in preferences))
+
+class FacetIndex:
+    def __init__(self):
+        """
+        Initialise un index vide
+        """
+        self.ids = []
+        # facette -> valeur -> positions des analyses
+        self.postings = {}
+        # facette -> valeurs (NaN si inconnue)
+        self.numbers = {}
+        self.lab_aliases = {}
+        self.matrice_terms = {}
+
+    def build(self, records: Iterable[Tuple[str, Dict[str, Any]]]):
+        """
+        Construit l'index
+
+        Args:
+            records: Couples (identifiant, métadonnées ChromaDB de l'analyse)
+        """
+        ids = []
+        postings = {facet: {} for facet in CATEGORICAL_FACETS}
+        numbers = {facet: [] for facet in NUMERIC_FACETS}
+
+        for position, (analysis_id, metadata) in enumerate(records):
+            ids.append(analysis_id)
+            for facet in CATEGORICAL_FACETS:
+                value = metadata.get(facet)
+                # Comme dans ChromaDB, "" est une valeur ; None (champ typé inconnu) n'est pas stocké
+                if value is not None:
+                    postings[facet].setdefault(value, []).append(position)
+            for facet in NUMERIC_FACETS:
+                value = metadata.get(facet)
+                numbers[facet].append(np.nan if value is None else value)
+
+        self.ids = ids
+        self.postings = {
+            facet: {value: np.asarray(positions, dtype=np.int32) for value, positions in values.items()}
+            for facet, values in postings.items()
+        }
+        self.numbers = {facet: np.asarray(values, dtype=np.float64) for facet, values in numbers.items()}
+
+        # Vocabulaire des questions : mots des noms de laboratoires et des matrices
+        self.lab_aliases = {}
+        for lab in self.postings['laboratoire']:
+            for word in re.findall(r"[a-z0-9]+", fold_text(lab)):
+                if len(word) >= 3 and word not in GENERIC_LAB_WORDS:
+                    self.lab_aliases.setdefault(word, set()).add(lab)
+        self.matrice_terms = {}
+        for matrice in self.postings['matrice']:
+            for word in re.findall(r"[a-z0-9]+", fold_text(matrice)):
+                if len(word) >= 3 and word not in STOPWORDS:
+                    self.matrice_terms.setdefault(word, set()).add(matrice)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _mask(self, where: Dict[str, Any]) -> Optional[np.ndarray]:
+        """
+        Positions satisfaisant un filtre, ou None si un champ n'est pas indexé
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, condition in where.items():
+            if key in ('$and', '$or'):
+                parts = [self._mask(part) for part in condition]
+                if any(part is None for part in parts):
+                    return None
+                if key == '$and':
+                    combined = np.logical_and.reduce(parts) if parts else np.ones(len(self.ids), dtype=bool)
+                else:
+                    combined = np.logical_or.reduce(parts) if parts else np.zeros(len(self.ids), dtype=bool)
+                mask &= combined
+                continue
+
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for op, operand in condition.items():
+                field_mask = self._field_mask(key, op, operand)
+                if field_mask is None:
+                    return None
+                mask &= field_mask
+        return mask
+
+    def _field_mask(self, field: str, op: str, operand: Any) -> Optional[np.ndarray]:
+        """
+        Positions satisfaisant une condition sur une facette
+        """
+        if field in self.numbers:
+            values = self.numbers[field]
+            with np.errstate(invalid='ignore'):
+                if op in COMPARISONS:
+                    mask = COMPARISONS[op](values, operand)
+                elif op in ('$in', '$nin'):
+                    mask = np.isin(values, list(operand))
+                    if op == '$nin':
+                        mask = ~mask
+                else:
+                    raise ValueError(f"Opérateur de filtre inconnu: {op}")
+            # Comme ChromaDB : une analyse sans valeur ne satisfait aucune condition
+            return mask & ~np.isnan(values)
+
+        if field not in self.postings:
+            return None
+
+        postings = self.postings[field]
+        if op in ('$eq', '$in', '$ne', '$nin'):
+            values = [operand] if op in ('$eq', '$ne') else list(operand)
+            mask = np.zeros(len(self.ids), dtype=bool)
+            for value in values:
+                positions = postings.get(value)
+                if positions is not None:
+                    mask[positions] = True
+            if op in ('$ne', '$nin'):
+                present = np.zeros(len(self.ids), dtype=bool)
+                for positions in postings.values():
+                    present[positions] = True
+                mask = present & ~mask
+            return mask
+        if op in COMPARISONS:
+            # Comparaison d'ordre sur une facette texte : peu courant, évalué valeur par valeur
+            mask = np.zeros(len(self.ids), dtype=bool)
+            for value, positions in postings.items():
+                if COMPARISONS[op](value, operand):
+                    mask[positions] = True
+            return mask
+        raise ValueError(f"Opérateur de filtre inconnu: {op}")
+
+    def filter(self, where: Dict[str, Any]) -> Optional[Set[str]]:
+        """
+        Sélectionne les analyses satisfaisant un filtre `where` ChromaDB
+
+        Args:
+            where: Filtre sur les métadonnées
+
+        Returns:
+            Identifiants retenus, ou None si le filtre porte sur un champ non indexé
+        """
+        mask = self._mask(where)
+        if mask is None:
+            return None
+        return {self.ids[i] for i in np.flatnonzero(mask)}
+
+    def parse_query(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Déduit d'une question les filtres stricts qu'elle exprime
+
+        Seul le laboratoire, connu pour chaque analyse, est un filtre strict.
+
+        Args:
+            query: Question de l'utilisateur
+
+        Returns:
+            Conditions `where` ChromaDB ; liste vide si aucune
+        """
+        labs = set()
+        for word in re.findall(r"[a-z0-9]+", fold_text(query)):
+            labs.update(self.lab_aliases.get(word, ()))
+        return [{'laboratoire': {'$in': sorted(labs)}}] if labs else []
+
+    def parse_preferences(self, query: str) -> List[Dict[str, Any]]:
+        """
+        Déduit d'une question les préférences de matrice, de délai de rendu et d'urgence
+
+        Ces champs manquent pour une partie des laboratoires (délai, urgence) ou sont
+        libellés différemment (sang, sérum, plasma) : ils servent à reclasser les
+        résultats (voir rank_by_preferences), pas à les filtrer.
+
+        Args:
+            query: Question de l'utilisateur
+
+        Returns:
+            Conditions (matrice, délai de rendu, urgence) ; liste vide si aucune
+        """
+        text = fold_text(query)
+        preferences = []
+
+        matrices = set()
+        for term in MATRICE_QUERY_PATTERN.findall(text):
+            term = term if term in self.matrice_terms or term in MATRICE_SYNONYMS else term.rstrip('s')
+            for word in (term,) + MATRICE_SYNONYMS.get(term, ()):
+                matrices.update(self.matrice_terms.get(word, ()))
+        if matrices:
+            preferences.append({'matrice': {'$in': sorted(matrices)}})
+
+        for op, delai in DELAI_QUERY_PATTERN.findall(text):
+            hours = parse_delai_heures(delai, 'h')
+            if hours is None:
+                continue
+            if op.startswith(('>', '≥', 'plus', 'au moins')):
+                preferences.append({'delai_heures': {'$gte': hours}})
+            else:
+                preferences.append({'delai_heures': {'$lte': hours}})
+            break
+
+        if URGENCE_QUERY_PATTERN.search(text):
+            preferences.append({'urgence': True})
+
+        return preferences
+
+    def query_signature(self, query: str) -> Tuple[str, Tuple[str, ...]]:
+        """
+        Résume ce qui, dans une question, change la réponse sans beaucoup changer son
+        embedding : laboratoires, préférences (matrice, délai, urgence), codes, nombres
+        et sigles. "délai CMV à l'UZA" et "délai CMV au LHUB" ont des signatures différentes.
+
+        Args:
+            query: Question de l'utilisateur
+
+        Returns:
+            Signature comparable et hashable
+        """
+        facets = self.parse_query(query) + self.parse_preferences(query)
+        terms = {
+            fold_text(term) for term in CODE_TERM_PATTERN.findall(query)
+            if any(char.isdigit() for char in term) or (len(term) > 1 and term.isupper())
+        }
+        # Les noms de laboratoire sont déjà dans les facettes, quelle que soit leur casse
+        terms.difference_update(self.lab_aliases)
+        return json.dumps(facets, sort_keys=True), tuple(sorted(terms))
+
+def combine_where(*filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Combine plusieurs filtres `where` (None ignorés) en un seul
+    """
+    filters = [where for where in filters if where]
+    if not filters:
+        return None
+    return filters[0] if len(filters) == 1 else {'$and': filters}
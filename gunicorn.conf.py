@@ -0,0 +1,27 @@
+"""
+Configuration Gunicorn pour la production
+Lancement : gunicorn app:app -c gunicorn.conf.py
+
+Les requêtes passent l'essentiel de leur temps à attendre l'API OpenAI :
+des workers à threads (gthread) permettent de traiter ces attentes en parallèle,
+y compris les réponses diffusées en SSE qui occupent un thread jusqu'à la fin.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', os.getenv('FLASK_PORT', 5000))}"
+
+# Un seul processus par défaut : les caches en mémoire, l'index lexical
+# et les versions des collections restent cohérents entre les requêtes
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+
+# Une génération GPT-4 diffusée peut durer plus d'une minute
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 180))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
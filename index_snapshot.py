@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Instantané des bases vectorielles (embeddings, documents, métadonnées, manifeste)
+Un fichier zip compressé et versionné, chargé au démarrage sans appeler l'API d'embeddings
+
+Usage :
+    python index_snapshot.py export [chemin]
+    python index_snapshot.py verify [chemin]
+    python index_snapshot.py import [chemin]
+"""
+
+import os
+import io
+import sys
+import glob
+import json
+import time
+import zipfile
+import hashlib
+from typing import Dict, Any, Optional
+import numpy as np
+from collection_alias import open_shadow_collection
+
+SNAPSHOT_FORMAT = 2
+
+# Fichiers sources de chaque collection (relatifs au data_directory du système)
+SOURCE_PATTERNS = {
+    "medical_documents": "*.md",
+    "compendium_analyses": "*.json"
+}
+
+EXPORT_BATCH_SIZE = 1000
+IMPORT_BATCH_SIZE = 1000
+
+def get_snapshot_path() -> str:
+    """
+    Retourne le chemin de l'instantané (INDEX_SNAPSHOT_PATH, data/index_snapshot.zip par défaut)
+    """
+    return os.getenv('INDEX_SNAPSHOT_PATH', os.path.join('data', 'index_snapshot.zip'))
+
+def source_checksum(system, alias: str) -> str:
+    """
+    Calcule l'empreinte des fichiers sources d'une collection
+
+    Le format de l'instantané et la version du parseur et des métadonnées du système
+    en font partie : un instantané exporté par une version antérieure n'est pas importé.
+
+    Args:
+        system: Système RAG (fournit data_directory et index_format)
+        alias: Nom logique de la collection
+
+    Returns:
+        Empreinte SHA-256 des versions, puis des noms et contenus des fichiers
+    """
+    digest = hashlib.sha256(f"snapshot-v{SNAPSHOT_FORMAT}/{system.index_format()}\n".encode('utf-8'))
+    for filepath in sorted(glob.glob(os.path.join(system.data_directory, SOURCE_PATTERNS[alias]))):
+        with open(filepath, 'rb') as f:
+            file_hash = hashlib.sha256(f.read()).hexdigest()
+        digest.update(f"{os.path.basename(filepath)}:{file_hash}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def export_snapshot(path: str, systems: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Exporte les collections en service dans un instantané
+
+    Args:
+        path: Chemin du fichier zip à écrire
+        systems: Dictionnaire alias -> système RAG
+
+    Returns:
+        En-tête de l'instantané
+    """
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'collections': {}
+    }
+
+    tmp_path = path + ".tmp"
+    with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for alias, system in systems.items():
+            collection = system.collection
+            count = collection.count()
+
+            ids, records, embeddings = [], [], []
+            for offset in range(0, count, EXPORT_BATCH_SIZE):
+                batch = collection.get(
+                    limit=EXPORT_BATCH_SIZE,
+                    offset=offset,
+                    include=['embeddings', 'documents', 'metadatas']
+                )
+                for record_id, document, metadata, embedding in zip(
+                    batch['ids'], batch['documents'], batch['metadatas'], batch['embeddings']
+                ):
+                    ids.append(record_id)
+                    records.append({'id': record_id, 'document': document, 'metadata': metadata})
+                    embeddings.append(embedding)
+
+            members = {}
+
+            records_data = "\n".join(json.dumps(record, ensure_ascii=False) for record in records).encode('utf-8')
+            members[f"{alias}/records.jsonl"] = records_data
+
+            buffer = io.BytesIO()
+            np.save(buffer, np.asarray(embeddings, dtype=np.float32) if embeddings else np.zeros((0, 0), dtype=np.float32))
+            members[f"{alias}/embeddings.npy"] = buffer.getvalue()
+
+            if hasattr(system, '_load_manifest'):
+                # Manifeste des fichiers markdown : la synchronisation suivante n'a rien à refaire
+                members[f"{alias}/manifest.json"] = json.dumps(
+                    system._load_manifest(), ensure_ascii=False, indent=2
+                ).encode('utf-8')
+
+            for name, data in members.items():
+                archive.writestr(name, data)
+
+            header['collections'][alias] = {
+                'count': len(ids),
+                'dimension': len(embeddings[0]) if embeddings else 0,
+                'embedding_model': system.embedding_model,
+                'index_format': system.index_format(),
+                'source_checksum': source_checksum(system, alias),
+                'files': {name: _sha256(data) for name, data in members.items()}
+            }
+            print(f"📦 {alias}: {len(ids)} enregistrements exportés depuis {collection.name}")
+
+        # Version de l'instantané : empreinte de l'ensemble des sources
+        header['version'] = _sha256("".join(
+            info['source_checksum'] for _, info in sorted(header['collections'].items())
+        ).encode('utf-8'))[:12]
+        archive.writestr("snapshot.json", json.dumps(header, indent=2))
+
+    os.replace(tmp_path, path)
+    return header
+
+def read_header(path: str) -> Dict[str, Any]:
+    """
+    Lit l'en-tête d'un instantané
+
+    Args:
+        path: Chemin du fichier zip
+
+    Returns:
+        En-tête (format, version, collections)
+    """
+    with zipfile.ZipFile(path, 'r') as archive:
+        return json.loads(archive.read("snapshot.json"))
+
+def verify_snapshot(path: str, systems: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """
+    Vérifie un instantané : intégrité des fichiers et correspondance avec les sources actuelles
+
+    Args:
+        path: Chemin du fichier zip
+        systems: Dictionnaire alias -> système RAG
+
+    Returns:
+        Dictionnaire alias -> None si la collection est utilisable, sinon la raison du refus
+    """
+    header = read_header(path)
+    if header.get('format') != SNAPSHOT_FORMAT:
+        return {alias: f"format {header.get('format')} non supporté" for alias in systems}
+
+    problems = {}
+    with zipfile.ZipFile(path, 'r') as archive:
+        for alias, system in systems.items():
+            info = header['collections'].get(alias)
+            if info is None:
+                problems[alias] = "collection absente de l'instantané"
+            elif info['embedding_model'] != system.embedding_model:
+                problems[alias] = f"modèle d'embeddings différent ({info['embedding_model']})"
+            elif info.get('index_format') != system.index_format():
+                problems[alias] = f"parseur ou métadonnées d'une autre version ({info.get('index_format')})"
+            elif info['source_checksum'] != source_checksum(system, alias):
+                problems[alias] = "fichiers sources modifiés depuis l'export"
+            else:
+                corrupted = [name for name, checksum in info['files'].items() if _sha256(archive.read(name)) != checksum]
+                problems[alias] = f"fichiers corrompus: {', '.join(corrupted)}" if corrupted else None
+    return problems
+
+def import_snapshot(path: str, systems: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Charge les collections vérifiées d'un instantané
+
+    Chaque collection est écrite dans une nouvelle version puis mise en service
+    (voir collection_alias) ; les collections refusées par verify_snapshot sont ignorées
+    et seront construites normalement.
+
+    Args:
+        path: Chemin du fichier zip
+        systems: Dictionnaire alias -> système RAG
+
+    Returns:
+        Dictionnaire alias -> nombre d'enregistrements chargés
+    """
+    header = read_header(path)
+    problems = verify_snapshot(path, systems)
+    loaded = {}
+
+    with zipfile.ZipFile(path, 'r') as archive:
+        for alias, system in systems.items():
+            if problems[alias]:
+                print(f"⚠️  Instantané ignoré pour {alias}: {problems[alias]}")
+                continue
+
+            records = [json.loads(line) for line in archive.read(f"{alias}/records.jsonl").decode('utf-8').splitlines() if line]
+            embeddings = np.load(io.BytesIO(archive.read(f"{alias}/embeddings.npy")))
+
+            with system.build_progress.job(blocking=system.collection.count() == 0):
+                system.build_progress.add_total((len(records) + IMPORT_BATCH_SIZE - 1) // IMPORT_BATCH_SIZE)
+
+                shadow, _ = open_shadow_collection(system.chroma_client, alias, system.collection.name)
+                for start in range(0, len(records), IMPORT_BATCH_SIZE):
+                    batch = records[start:start + IMPORT_BATCH_SIZE]
+                    shadow.add(
+                        ids=[record['id'] for record in batch],
+                        documents=[record['document'] for record in batch],
+                        metadatas=[record['metadata'] for record in batch],
+                        embeddings=embeddings[start:start + IMPORT_BATCH_SIZE].tolist()
+                    )
+                    system.build_progress.advance()
+
+                if f"{alias}/manifest.json" in header['collections'][alias]['files']:
+                    system.build_collection = shadow
+                    try:
+                        system._save_manifest(json.loads(archive.read(f"{alias}/manifest.json")))
+                    finally:
+                        system.build_collection = system.collection
+
+                system.promote_collection(shadow)
+
+            loaded[alias] = len(records)
+            print(f"✅ {alias}: {len(records)} enregistrements chargés depuis l'instantané {header['version']}")
+
+    return loaded
+
+def restore_if_available(systems: Dict[str, Any], path: Optional[str] = None) -> Dict[str, int]:
+    """
+    Charge l'instantané dans les collections encore vides, s'il existe
+
+    Args:
+        systems: Dictionnaire alias -> système RAG
+        path: Chemin du fichier zip (get_snapshot_path() par défaut)
+
+    Returns:
+        Dictionnaire alias -> nombre d'enregistrements chargés
+    """
+    path = path or get_snapshot_path()
+    empty = {alias: system for alias, system in systems.items() if system.collection.count() == 0}
+    if not empty or not os.path.exists(path):
+        return {}
+
+    try:
+        return import_snapshot(path, empty)
+    except Exception as e:
+        print(f"❌ Erreur lors du chargement de l'instantané {path}: {e}")
+        return {}
+
+def main():
+    """
+    Point d'entrée en ligne de commande
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in ('export', 'verify', 'import'):
+        print(__doc__)
+        sys.exit(1)
+
+    from dotenv import load_dotenv
+    from rag_system import RAGSystem
+    from compendium_rag import CompendiumRAG
+
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        print("❌ Erreur: OPENAI_API_KEY n'est pas défini")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    path = sys.argv[2] if len(sys.argv) > 2 else get_snapshot_path()
+    systems = {
+        "medical_documents": RAGSystem(openai_api_key=openai_api_key),
+        "compendium_analyses": CompendiumRAG(openai_api_key=openai_api_key)
+    }
+
+    if command == 'export':
+        header = export_snapshot(path, systems)
+        print(f"✅ Instantané {header['version']} écrit dans {path} ({os.path.getsize(path) / 1e6:.1f} Mo)")
+
+    elif command == 'verify':
+        problems = verify_snapshot(path, systems)
+        for alias, problem in problems.items():
+            print(f"{'❌' if problem else '✅'} {alias}: {problem or 'conforme aux sources'}")
+        sys.exit(1 if any(problems.values()) else 0)
+
+    else:
+        loaded = import_snapshot(path, systems)
+        sys.exit(0 if len(loaded) == len(systems) else 1)
+
+if __name__ == "__main__":
+    main()
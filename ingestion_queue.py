@@ -0,0 +1,318 @@
+"""
+File d'attente persistante pour l'ingestion dans les bases vectorielles
+Chaque construction est enregistrée batch par batch (SQLite) : les batches en échec
+sont réessayés avec backoff et une construction interrompue reprend là où elle s'est arrêtée
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+class IngestionQueue:
+    def __init__(self, path: str):
+        """
+        Initialise la file d'ingestion
+
+        Args:
+            path: Chemin du fichier SQLite
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                collection TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total_batches INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS batches (
+                run_id INTEGER NOT NULL,
+                batch_no INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                PRIMARY KEY (run_id, batch_no)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_collection ON runs(collection, status)")
+        self._conn.commit()
+
+    def start_run(self, collection: str, batches: List[List[Tuple[str, Dict[str, Any]]]]) -> int:
+        """
+        Enregistre une nouvelle construction et tous ses batches
+
+        Args:
+            collection: Nom de la collection cible
+            batches: Batches de couples (texte, enregistrement sérialisable en JSON)
+
+        Returns:
+            Identifiant de la construction
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO runs (collection, status, total_batches, created_at, updated_at) VALUES (?, 'running', ?, ?, ?)",
+                (collection, len(batches), now, now)
+            )
+            run_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO batches (run_id, batch_no, payload, status) VALUES (?, ?, ?, 'pending')",
+                [(run_id, batch_no, json.dumps(batch, ensure_ascii=False)) for batch_no, batch in enumerate(batches, 1)]
+            )
+            self._conn.commit()
+        return run_id
+
+    def unfinished_runs(self, collection: str) -> List[int]:
+        """
+        Retourne les constructions non terminées d'une collection
+
+        Args:
+            collection: Nom de la collection
+
+        Returns:
+            Identifiants des constructions à reprendre, de la plus ancienne à la plus récente
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id FROM runs WHERE collection = ? AND status != 'completed' ORDER BY run_id",
+                (collection,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def pending_batches(self, run_id: int) -> List[Tuple[int, List[Tuple[str, Dict[str, Any]]]]]:
+        """
+        Retourne les batches pas encore écrits d'une construction
+
+        Args:
+            run_id: Identifiant de la construction
+
+        Returns:
+            Liste de couples (numéro du batch, éléments)
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT batch_no, payload FROM batches WHERE run_id = ? AND status != 'done' ORDER BY batch_no",
+                (run_id,)
+            ).fetchall()
+        return [(batch_no, [tuple(item) for item in json.loads(payload)]) for batch_no, payload in rows]
+
+    def mark_done(self, run_id: int, batch_no: int):
+        """
+        Marque un batch comme écrit dans la collection
+        """
+        with self._lock:
+            # La charge utile n'est plus nécessaire une fois le batch écrit
+            self._conn.execute(
+                "UPDATE batches SET status = 'done', payload = '[]', last_error = NULL WHERE run_id = ? AND batch_no = ?",
+                (run_id, batch_no)
+            )
+            self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def mark_failed(self, run_id: int, batch_no: int, error: Exception):
+        """
+        Enregistre l'échec d'un batch
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE batches SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE run_id = ? AND batch_no = ?",
+                (str(error)[:500], run_id, batch_no)
+            )
+            self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def finish_run(self, run_id: int) -> bool:
+        """
+        Clôture une construction si tous ses batches sont écrits
+
+        Args:
+            run_id: Identifiant de la construction
+
+        Returns:
+            True si la construction est complète
+        """
+        with self._lock:
+            remaining = self._conn.execute(
+                "SELECT COUNT(*) FROM batches WHERE run_id = ? AND status != 'done'",
+                (run_id,)
+            ).fetchone()[0]
+            status = 'completed' if remaining == 0 else 'incomplete'
+            self._conn.execute("UPDATE runs SET status = ?, updated_at = ? WHERE run_id = ?", (status, time.time(), run_id))
+            if status == 'completed':
+                self._conn.execute("DELETE FROM batches WHERE run_id = ?", (run_id,))
+            self._conn.commit()
+        return remaining == 0
+
+    def stats(self, collection: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Résume l'état des constructions non terminées
+
+        Args:
+            collection: Limiter à une collection (toutes si None)
+
+        Returns:
+            Nombre de batches en attente ou en échec
+        """
+        query = """
+            SELECT b.status, COUNT(*), MAX(b.attempts) FROM batches b JOIN runs r ON r.run_id = b.run_id
+            WHERE r.status != 'completed' {}
+            GROUP BY b.status
+        """.format("AND r.collection = ?" if collection else "")
+        with self._lock:
+            rows = self._conn.execute(query, (collection,) if collection else ()).fetchall()
+        counts = {status: count for status, count, _ in rows}
+        return {
+            'pending_batches': counts.get('pending', 0),
+            'failed_batches': counts.get('failed', 0),
+            'max_attempts': max([attempts or 0 for _, _, attempts in rows], default=0)
+        }
+
+def process_run(queue: IngestionQueue, run_id: int, pipeline,
+                writer: Callable[[List[str], List[Dict[str, Any]], List[List[float]]], None],
+                max_rounds: int = 3, base_delay: float = 5.0, progress=None) -> bool:
+    """
+    Traite les batches en attente d'une construction, en réessayant les échecs
+
+    Args:
+        queue: File d'ingestion
+        run_id: Identifiant de la construction
+        pipeline: Pipeline d'embeddings
+        writer: Fonction d'écriture dans la collection
+        max_rounds: Nombre de passes sur les batches restants
+        base_delay: Délai avant la deuxième passe (doublé à chaque passe)
+        progress: Suivi de la construction (optionnel)
+
+    Returns:
+        True si tous les batches ont été écrits
+    """
+    for round_no in range(max_rounds):
+        batches = queue.pending_batches(run_id)
+        if not batches:
+            break
+        
+        if round_no == 0 and progress is not None:
+            progress.add_total(len(batches))
+
+        if round_no > 0:
+            delay = base_delay * (2 ** (round_no - 1))
+            print(f"{len(batches)} batches en échec, nouvelle passe dans {delay:.0f}s")
+            time.sleep(delay)
+
+        pipeline.run_batches(
+            batches,
+            writer,
+            on_success=lambda batch_no, batch: _mark_done(queue, run_id, batch_no, progress),
+            on_failure=lambda batch_no, batch, error: queue.mark_failed(run_id, batch_no, error)
+        )
+
+    if progress is not None:
+        progress.fail(len(queue.pending_batches(run_id)))
+    
+    complete = queue.finish_run(run_id)
+    if not complete:
+        print(f"⚠️  Construction {run_id} incomplète, elle sera reprise à la prochaine synchronisation")
+    return complete
+
+def _mark_done(queue: IngestionQueue, run_id: int, batch_no: int, progress):
+    queue.mark_done(run_id, batch_no)
+    if progress is not None:
+        progress.advance()
+
+def resume_unfinished_runs(queue: Optional[IngestionQueue], collection: str, pipeline,
+                           writer: Callable[[List[str], List[Dict[str, Any]], List[List[float]]], None],
+                           progress=None) -> bool:
+    """
+    Reprend les constructions interrompues ou incomplètes d'une collection
+
+    Args:
+        queue: File d'ingestion (None si désactivée)
+        collection: Nom de la collection cible
+        pipeline: Pipeline d'embeddings
+        writer: Fonction d'écriture dans la collection
+        progress: Suivi de la construction (optionnel)
+
+    Returns:
+        True si plus aucun batch n'est en attente
+    """
+    if queue is None:
+        return True
+
+    complete = True
+    for run_id in queue.unfinished_runs(collection):
+        print(f"Reprise de la construction {run_id} ({len(queue.pending_batches(run_id))} batches restants)")
+        max_rounds = int(os.getenv('INGESTION_MAX_ROUNDS', 3))
+        complete = process_run(queue, run_id, pipeline, writer, max_rounds=max_rounds, progress=progress) and complete
+
+    return complete
+
+def ingest_records(queue: Optional[IngestionQueue], collection: str, pipeline,
+                   records: List[Tuple[str, Dict[str, Any]]],
+                   writer: Callable[[List[str], List[Dict[str, Any]], List[List[float]]], None],
+                   progress=None) -> bool:
+    """
+    Ingère des enregistrements via une construction persistante
+
+    Args:
+        queue: File d'ingestion (None pour un traitement sans persistance)
+        collection: Nom de la collection cible
+        pipeline: Pipeline d'embeddings
+        records: Couples (texte, enregistrement {id, metadata})
+        writer: Fonction d'écriture dans la collection
+        progress: Suivi de la construction (optionnel)
+
+    Returns:
+        True si tout a été écrit
+    """
+    if not records:
+        return True
+
+    if queue is None:
+        failed = pipeline.run(records, writer, progress=progress)
+        if failed:
+            print(f"⚠️  {len(failed)} textes non indexés, ils seront repris à la prochaine synchronisation")
+        return not failed
+
+    batches = pipeline.pack_batches(records)
+    run_id = queue.start_run(collection, batches)
+    print(f"{len(records)} textes répartis en {len(batches)} batches ({pipeline.max_workers} requêtes simultanées)")
+    max_rounds = int(os.getenv('INGESTION_MAX_ROUNDS', 3))
+    return process_run(queue, run_id, pipeline, writer, max_rounds=max_rounds, progress=progress)
+
+_shared_queue = None
+_shared_queue_lock = threading.Lock()
+
+def get_ingestion_queue() -> Optional[IngestionQueue]:
+    """
+    Retourne la file d'ingestion partagée par les deux systèmes RAG
+
+    Returns:
+        File d'ingestion, ou None si désactivée (INGESTION_QUEUE_ENABLED=false)
+    """
+    global _shared_queue
+
+    if os.getenv('INGESTION_QUEUE_ENABLED', 'true').lower() != 'true':
+        return None
+
+    with _shared_queue_lock:
+        if _shared_queue is None:
+            queue_path = os.getenv('INGESTION_QUEUE_PATH', './ingestion_queue.db')
+            # Sur Render, utiliser un répertoire temporaire si le chemin par défaut n'est pas accessible
+            if not os.access(os.path.dirname(queue_path) or '.', os.W_OK):
+                queue_path = '/tmp/ingestion_queue.db'
+            _shared_queue = IngestionQueue(queue_path)
+        return _shared_queue
@@ -2,6 +2,8 @@
 """
 Script d'initialisation de base de données pour Render
 Gère ChromaDB et PostgreSQL selon l'environnement
+Les bases sont chargées depuis l'instantané (index_snapshot.py) ; une base sans instantané
+à jour est construite en arrière-plan au démarrage de l'application, jamais pendant le build.
 """
 
 import os
@@ -11,6 +13,7 @@ from dotenv import load_dotenv
 from database_config import get_database_config, create_chroma_client, init_postgres_tables
 from rag_system import RAGSystem
 from compendium_rag import CompendiumRAG
+from index_snapshot import restore_if_available
 
 def check_environment():
     """
@@ -69,82 +72,59 @@ def init_postgres_if_available():
     
     return False
 
-def build_main_database(env_config):
+def restore_main_database(env_config):
     """
-    Construit la base de données principale (documents médicaux)
+    Charge la base de données principale (documents médicaux) depuis l'instantané
+    
+    Aucune construction ici : une base vide est construite en arrière-plan au démarrage
+    de l'application (voir app.initialize_components), qui répond pendant ce temps.
     """
-    print("🏗️  Construction de la base de données principale...")
+    print("📦 Chargement de la base de données principale...")
     
     try:
         # Créer le système RAG
         rag_system = RAGSystem(openai_api_key=env_config['openai_api_key'])
         
-        # Vérifier si la base existe déjà
+        # Charger l'instantané s'il correspond aux fichiers sources
+        restore_if_available({"medical_documents": rag_system})
+        
         doc_count = rag_system.collection.count()
         if doc_count > 0:
-            print(f"✅ Base de données principale déjà construite ({doc_count} documents)")
-            return True
-        
-        # Vérifier les données source
-        if not os.path.exists("data"):
-            print("❌ Erreur: Le dossier 'data' n'existe pas")
-            return False
-        
-        md_files = [f for f in os.listdir("data") if f.endswith(".md")]
-        if not md_files:
-            print("❌ Erreur: Aucun fichier .md trouvé dans le dossier 'data'")
-            return False
-        
-        print(f"📁 Fichiers trouvés: {', '.join(md_files)}")
-        
-        # Construire la base de données
-        rag_system.build_database()
-        
-        final_count = rag_system.collection.count()
-        print(f"✅ Base de données principale construite ({final_count} documents)")
+            print(f"✅ Base de données principale prête ({doc_count} documents)")
+        else:
+            print("ℹ️  Pas d'instantané à jour : base principale construite en arrière-plan au démarrage "
+                  "(progression : /api/build/progress)")
         return True
         
     except Exception as e:
-        print(f"❌ Erreur construction base principale: {e}")
+        print(f"❌ Erreur chargement base principale: {e}")
         return False
 
-def build_compendium_database(env_config):
+def restore_compendium_database(env_config):
     """
-    Construit la base de données du compendium belge
+    Charge la base de données du compendium belge depuis l'instantané
+    
+    Comme pour la base principale, une base vide est construite en arrière-plan au démarrage.
     """
-    print("🏗️  Construction de la base de données compendium...")
+    print("📦 Chargement de la base de données compendium...")
     
     try:
         # Créer le système Compendium RAG
         compendium_rag = CompendiumRAG(openai_api_key=env_config['openai_api_key'])
         
-        # Vérifier si la base existe déjà
+        # Charger l'instantané s'il correspond aux fichiers sources
+        restore_if_available({"compendium_analyses": compendium_rag})
+        
         analysis_count = compendium_rag.collection.count()
         if analysis_count > 0:
-            print(f"✅ Base de données compendium déjà construite ({analysis_count} analyses)")
-            return True
-        
-        # Vérifier les données source
-        if not os.path.exists("data/compendium_data"):
-            print("❌ Erreur: Le dossier 'data/compendium_data' n'existe pas")
-            return False
-        
-        json_files = [f for f in os.listdir("data/compendium_data") if f.endswith(".json")]
-        if not json_files:
-            print("❌ Erreur: Aucun fichier .json trouvé dans le dossier 'data/compendium_data'")
-            return False
-        
-        print(f"📁 Fichiers compendium trouvés: {', '.join(json_files)}")
-        
-        # Construire la base de données
-        compendium_rag.build_database()
-        
-        final_count = compendium_rag.collection.count()
-        print(f"✅ Base de données compendium construite ({final_count} analyses)")
+            print(f"✅ Base de données compendium prête ({analysis_count} analyses)")
+        else:
+            print("ℹ️  Pas d'instantané à jour : compendium construit en arrière-plan au démarrage "
+                  "(progression : /api/build/progress)")
         return True
         
     except Exception as e:
-        print(f"❌ Erreur construction base compendium: {e}")
+        print(f"❌ Erreur chargement base compendium: {e}")
         return False
 
 def main():
@@ -163,9 +143,9 @@ def main():
     if not init_postgres_if_available():
         print("⚠️  Continuer sans PostgreSQL...")
     
-    # Construire les bases de données
-    success_main = build_main_database(env_config)
-    success_compendium = build_compendium_database(env_config)
+    # Charger les instantanés (les bases vides sont construites au démarrage, en arrière-plan)
+    success_main = restore_main_database(env_config)
+    success_compendium = restore_compendium_database(env_config)
     
     if success_main and success_compendium:
         print("\n✅ Toutes les bases de données ont été initialisées avec succès!")
@@ -0,0 +1,397 @@
+"""
+Lecture et normalisation des fichiers JSON des laboratoires
+Module sans dépendance lourde : il est importé par les processus de parsing (voir analysis_cache)
+"""
+
+import os
+import re
+import json
+import hashlib
+from typing import List, Dict, Any, Iterator, Optional
+
+# À incrémenter à chaque changement de l'extraction (invalide le cache des analyses)
+PARSER_VERSION = 3
+
+# Champs d'une analyse normalisée et leur type (voir compendium_rag.CompendiumAnalysis)
+# Les champs typés valent None quand l'information est absente ou inexploitable
+ANALYSIS_FIELDS = {
+    'titre': str, 'code': str, 'lien': str, 'laboratoire': str, 'description': str,
+    'indication': str, 'prelevement': str, 'technique': str, 'reference': str,
+    'analysis_id': str, 'source_file': str, 'loinc': str, 'inami': str,
+    'service': str, 'matrice': str, 'volume_minimum': str, 'delai': str,
+    'recipient': str, 'frequence': str, 'stabilite': str, 'mots_cles': str,
+    'delai_heures': float, 'accredite': bool, 'urgence': bool
+}
+
+def iter_json_array(filepath: str, chunk_size: int = 65536) -> Iterator[Any]:
+    """
+    Parcourt les éléments d'un tableau JSON sans charger tout le fichier
+
+    Args:
+        filepath: Chemin du fichier JSON (un tableau au premier niveau)
+        chunk_size: Nombre de caractères lus à la fois
+
+    Yields:
+        Éléments du tableau, un par un
+    """
+    decoder = json.JSONDecoder()
+    with open(filepath, 'r', encoding='utf-8') as f:
+        buffer, pos, eof, started = '', 0, False, False
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+
+            complete = False
+            if pos < len(buffer):
+                if not started:
+                    if buffer[pos] != '[':
+                        raise ValueError(f"{filepath} ne contient pas un tableau JSON")
+                    started = True
+                    pos += 1
+                    continue
+                if buffer[pos] == ']':
+                    return
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    # Un nombre coupé par la fin du buffer se décode partiellement ("1." -> 1)
+                    complete = eof or isinstance(item, (dict, list)) or (end < len(buffer) and buffer[end] in ' \t\r\n,]')
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+            elif eof:
+                raise ValueError(f"Tableau JSON incomplet dans {filepath}")
+
+            if not complete:
+                # Élément incomplet : lire la suite (au moins autant que le buffer, pour
+                # ne pas redécoder un long élément à chaque petite lecture)
+                chunk = f.read(max(chunk_size, len(buffer) - pos))
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+
+            yield item
+            pos = end
+
+def _split_keywords(record: Dict[str, Any]):
+    """
+    Sépare les mots-clés préfixés au service ("Mots-clés : \nAAN, FAN\n\n\nAuto-immunité - ...")
+    """
+    match = re.match(r'Mots-clés\s*:\s*(.*?)\n\s*\n\s*(.*)$', record['service'], re.DOTALL)
+    if match:
+        record['mots_cles'] = match.group(1).strip()
+        record['service'] = match.group(2).strip()
+
+# Registre des laboratoires : motif du nom de fichier, nom affiché, unité d'un délai
+# sans unité, traitement final optionnel et, pour chaque champ normalisé, les chemins
+# sources ("section.clé" ou "clé") essayés dans l'ordre.
+# Les clés sont comparées sans casse ni espaces invisibles (certaines clés UZA commencent par \u200b).
+LAB_SCHEMAS = [
+    {
+        'pattern': 'lhub',
+        'name': "LHUB-ULB",
+        'delai_unit': 'j',
+        'fields': {
+            'service': ('analyse.Service', 'analyse.Secteur'),
+            'loinc': ('analyse.Code LOINC',),
+            'inami': ('analyse.Tarification (INAMI)',),
+            'matrice': ('pre_analytique.Echantillon',),
+            'prelevement': ('pre_analytique.Echantillon',),
+            'recipient': ('pre_analytique.Matériel',),
+            'technique': ('analytique.Méthode',),
+            'volume_minimum': ('analytique.Volume minimum',),
+            'frequence': ('analytique.Fréquence de réalisation',),
+            'accredite': ('analytique.Analyse accréditée',),
+            'delai': ('post_analytique.Délai de rendu de résultat',),
+            'stabilite': ('post_analytique.Stabilité',),
+            'reference': ('post_analytique.Valeurs de référence',),
+            'description': ('pre_analytique.Recommandations particulières', 'post_analytique.Remarque',
+                            'collecte_conservation_transport.Conditions particulières'),
+        }
+    },
+    {
+        'pattern': 'uza',
+        'name': "UZA",
+        'delai_unit': 'j',
+        'fields': {
+            'service': ('analyse.Service',),
+            'matrice': ('analyse.Matrice',),
+            'inami': ('analyse.Nomenclature INAMI',),
+            'prelevement': ("pre_analytique.type d'échantillon approprié", 'pre_analytique.Geschikt staaltype voor analyse',
+                            'pre_analytique.Geschikt staaltype', 'pre_analytique.Staaltype', 'pre_analytique.Récipient'),
+            'recipient': ('pre_analytique.Récipient',),
+            'volume_minimum': ('pre_analytique.volume minimum', 'pre_analytique.Minimum staalvolume',
+                               'pre_analytique.geschikt staalvolume voor analyse'),
+            'technique': ('analytique.Méthode analytique',),
+            'frequence': ("analytique.Fréquence d'exécution",),
+            'urgence': ('analytique.Exécution en urgence',),
+            'reference': ('post_analytique.Valeurs de référence',),
+            'description': ('post_analytique.Remarque',),
+        }
+    },
+    {
+        'pattern': 'citadelle',
+        'name': "CHR Citadelle",
+        # Délai en jours (nombre seul)
+        'delai_unit': 'j',
+        'postprocess': _split_keywords,
+        'fields': {
+            'service': ('service',),
+            'matrice': ('matrice',),
+            'prelevement': ('matrice',),
+            'technique': ('methode_analytique',),
+            'volume_minimum': ('volume_minimum',),
+            'delai': ('delai',),
+            'inami': ('code_inami',),
+            'reference': ('valeurs_reference',),
+        }
+    },
+    {
+        'pattern': 'chu_ulg',
+        'name': "CHU ULG",
+        'delai_unit': 'j',
+        'fields': {
+            'matrice': ('types_echantillons',),
+            'prelevement': ('types_echantillons',),
+            'technique': ('methode',),
+        }
+    },
+]
+
+# Structure générique pour les fichiers d'un laboratoire non enregistré
+DEFAULT_SCHEMA = {
+    'pattern': '',
+    'name': "Laboratoire inconnu",
+    'delai_unit': 'j',
+    'fields': {
+        'description': ('description',),
+        'indication': ('indication',),
+        'service': ('analyse.Service', 'service'),
+        'matrice': ('analyse.Matrice', 'matrice'),
+        'loinc': ('analyse.Code LOINC',),
+        'inami': ('analyse.Tarification (INAMI)', 'analyse.Nomenclature INAMI', 'code_inami'),
+        'prelevement': ('types_echantillons', "pre_analytique.type d'échantillon approprié", 'pre_analytique.Récipient'),
+        'technique': ('methode', 'analytique.Méthode analytique', 'analytique.Méthode', 'methode_analytique'),
+        'reference': ('post_analytique.Valeurs de référence', 'valeurs_reference'),
+    }
+}
+
+# Champs communs à tous les laboratoires
+COMMON_FIELDS = {'titre': ('titre',), 'code': ('code',), 'lien': ('lien',)}
+
+# Champs dont toutes les valeurs trouvées sont conservées (remarques), les autres prennent la première non vide
+JOINED_FIELDS = {'description'}
+
+# "S" est la notation LHUB de la semaine ("1S"), les secondes s'écrivent "sec"
+_DELAI_UNITS_HOURS = {'sec': 1 / 3600, 's': 168, 'min': 1 / 60, 'h': 1, 'j': 24, 'jour': 24,
+                      'jours': 24, 'sem': 168, 'semaine': 168, 'semaines': 168, 'mois': 720, 'm': 720}
+_DELAI_PATTERN = re.compile(r'(\d+(?:[.,]\d+)?)\s*(min|mois|semaines?|sem|sec|jours?|[hjsm])?(?![a-zà-ÿ])', re.IGNORECASE)
+
+def normalize_key(key: str) -> str:
+    """
+    Normalise une clé JSON pour la comparaison (casse, espaces invisibles)
+    """
+    return key.replace('\u200b', '').strip().casefold()
+
+def _text(value: Any) -> str:
+    """
+    Convertit une valeur JSON en texte
+    """
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ", ".join(_text(v) for v in value if _text(v))
+    return str(value).strip()
+
+def parse_delai_heures(delai: str, default_unit: str = 'j') -> Optional[float]:
+    """
+    Convertit un délai de rendu en heures ("7J", "2H", "1 semaine", "45 sec - 1 min", "1M")
+
+    Args:
+        delai: Délai tel qu'écrit par le laboratoire
+        default_unit: Unité d'un nombre seul
+
+    Returns:
+        Délai en heures (borne haute d'un intervalle), ou None s'il n'est pas interprétable
+    """
+    hours = [
+        float(number.replace(',', '.')) * _DELAI_UNITS_HOURS[(unit or default_unit).lower()]
+        for number, unit in _DELAI_PATTERN.findall(delai)
+    ]
+    return max(hours) if hours else None
+
+def parse_accreditation(value: str) -> Optional[bool]:
+    """
+    Interprète la mention d'accréditation ("Analyse accréditée", "Analyse non accréditée", "Oui"...)
+
+    Returns:
+        True/False, ou None si la mention est partielle ou ne concerne pas l'accréditation
+    """
+    text = value.casefold()
+    if text in ('oui', 'ja'):
+        return True
+    if text in ('non', 'neen'):
+        return False
+    accredited = text.count('accréditée')
+    not_accredited = text.count('non accréditée')
+    if accredited and accredited == not_accredited:
+        return False
+    if accredited and not not_accredited:
+        return True
+    return None
+
+def parse_yes_no(value: str) -> Optional[bool]:
+    """
+    Interprète une réponse oui/non (français ou néerlandais)
+    """
+    text = value.casefold()
+    if text in ('oui', 'ja', 'yes'):
+        return True
+    if text in ('non', 'neen', 'nee', 'no'):
+        return False
+    return None
+
+# Conversion des champs typés lus dans le fichier source
+TYPED_PARSERS = {'accredite': parse_accreditation, 'urgence': parse_yes_no}
+
+def _compile_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Prépare un schéma pour l'extraction : chemins découpés et clés normalisées
+    """
+    fields = dict(COMMON_FIELDS, **schema['fields'])
+    return {
+        'pattern': schema['pattern'],
+        'name': schema['name'],
+        'delai_unit': schema['delai_unit'],
+        'postprocess': schema.get('postprocess'),
+        'fields': [
+            (field, tuple(tuple(normalize_key(part) for part in path.split('.', 1)) for path in paths),
+             field in JOINED_FIELDS, TYPED_PARSERS.get(field))
+            for field, paths in fields.items()
+        ]
+    }
+
+# Schémas compilés une fois au chargement du module
+_COMPILED_SCHEMAS = [_compile_schema(schema) for schema in LAB_SCHEMAS]
+_COMPILED_DEFAULT = _compile_schema(DEFAULT_SCHEMA)
+
+def schema_for(filename: str) -> Dict[str, Any]:
+    """
+    Retourne le schéma compilé du laboratoire d'un fichier
+    """
+    filename = filename.lower()
+    for schema in _COMPILED_SCHEMAS:
+        if schema['pattern'] in filename:
+            return schema
+    return _COMPILED_DEFAULT
+
+def lab_name_for(filename: str) -> str:
+    """
+    Détermine le laboratoire depuis le nom du fichier
+    """
+    return schema_for(filename)['name']
+
+def make_analysis_id(record: Dict[str, str], source_id: str, seen_ids: set) -> str:
+    """
+    Calcule un identifiant stable pour une analyse
+
+    Args:
+        record: Analyse normalisée (code, lien, titre, laboratoire)
+        source_id: Identifiant fourni par le laboratoire (peut être vide)
+        seen_ids: Identifiants déjà attribués dans le même fichier
+
+    Returns:
+        Identifiant unique, indépendant de la position dans le fichier
+    """
+    if not source_id:
+        key = f"{record['code']}|{record['lien']}|{record['titre']}"
+        source_id = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    base_id = f"{record['laboratoire']}_{source_id}"
+    analysis_id = base_id
+
+    # Certains fichiers contiennent des doublons exacts
+    suffix = 2
+    while analysis_id in seen_ids:
+        analysis_id = f"{base_id}~{suffix}"
+        suffix += 1
+    seen_ids.add(analysis_id)
+
+    return analysis_id
+
+def extract_record(item: Dict[str, Any], schema: Dict[str, Any], filename: str) -> Dict[str, Any]:
+    """
+    Extrait les champs d'une analyse selon le schéma de son laboratoire
+
+    Args:
+        item: Élément du tableau JSON
+        schema: Schéma compilé (voir schema_for)
+        filename: Nom du fichier source
+
+    Returns:
+        Analyse normalisée (sans analysis_id) : textes vides et champs typés à None si absents
+    """
+    # Vue de l'élément aux clés normalisées, sections comprises
+    view = {}
+    for key, value in item.items():
+        if isinstance(value, dict):
+            value = {normalize_key(k): v for k, v in value.items()}
+        view[normalize_key(key)] = value
+
+    record = {field: (None if field_type is not str else "") for field, field_type in ANALYSIS_FIELDS.items()}
+    for field, paths, joined, parser in schema['fields']:
+        values = []
+        for path in paths:
+            value = view.get(path[0])
+            if len(path) == 2:
+                value = value.get(path[1]) if isinstance(value, dict) else None
+            value = _text(value) if not isinstance(value, dict) else ""
+            if value and value not in values:
+                values.append(value)
+                if not joined:
+                    break
+        text = "\n".join(values)
+        record[field] = parser(text) if parser else text
+
+    if schema['postprocess']:
+        schema['postprocess'](record)
+
+    record['delai_heures'] = parse_delai_heures(record['delai'], schema['delai_unit'])
+    # Un nombre seul est ambigu une fois affiché : préciser l'unité du laboratoire
+    if re.fullmatch(r'\d+(?:[.,]\d+)?', record['delai']):
+        record['delai'] = f"{record['delai']} {schema['delai_unit']}"
+    record['laboratoire'] = schema['name']
+    record['source_file'] = filename
+    return record
+
+def iter_lab_records(filepath: str) -> Iterator[Dict[str, Any]]:
+    """
+    Lit les analyses normalisées d'un laboratoire au fil du fichier JSON
+
+    Args:
+        filepath: Chemin vers le fichier JSON
+
+    Yields:
+        Analyses normalisées (dictionnaires des champs ANALYSIS_FIELDS)
+    """
+    filename = os.path.basename(filepath)
+    schema = schema_for(filename)
+    seen_ids = set()
+
+    # Traiter chaque analyse
+    for item in iter_json_array(filepath):
+        if isinstance(item, dict):
+            record = extract_record(item, schema, filename)
+            if record['titre'] and record['lien']:  # Vérifier que les champs essentiels existent
+                record['analysis_id'] = make_analysis_id(record, item.get('id', ''), seen_ids)
+                yield record
+
+def parse_lab_file(filepath: str) -> List[Dict[str, Any]]:
+    """
+    Lit toutes les analyses d'un laboratoire
+
+    Args:
+        filepath: Chemin vers le fichier JSON
+
+    Returns:
+        Analyses normalisées
+    """
+    return list(iter_lab_records(filepath))
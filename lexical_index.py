@@ -0,0 +1,171 @@
+"""
+Index lexical BM25 en mémoire pour la recherche hybride dans le compendium
+Complète la recherche vectorielle sur les codes de laboratoire, LOINC et INAMI,
+que les embeddings représentent mal
+"""
+
+import re
+import math
+import unicodedata
+from collections import defaultdict
+from typing import List, Dict, Any, Tuple, Iterable, Optional, Set
+import numpy as np
+
+# Mots vides français et néerlandais, sans accents
+STOPWORDS = {
+    'le', 'la', 'les', 'un', 'une', 'des', 'du', 'de', 'd', 'l', 'et', 'ou', 'en', 'au', 'aux',
+    'a', 'pour', 'par', 'sur', 'dans', 'avec', 'est', 'quel', 'quelle', 'quels', 'quelles',
+    'het', 'een', 'van', 'voor', 'op', 'in', 'met', 'bij', 'is', 'te',
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[_\-./][a-z0-9]+)*")
+SEPARATOR_PATTERN = re.compile(r"[_\-./]")
+COMBINING_PATTERN = re.compile(r"[\u0300-\u036f]")
+
+def fold_text(text: str) -> str:
+    """
+    Supprime les accents et passe en minuscules (é → e, ë → e, ç → c)
+
+    Args:
+        text: Texte à normaliser
+
+    Returns:
+        Texte normalisé
+    """
+    return COMBINING_PATTERN.sub("", unicodedata.normalize('NFKD', text.lower()))
+
+def tokenize(text: str) -> List[str]:
+    """
+    Découpe un texte en termes pour l'index
+
+    Les codes composés (GEN_CY_CGH, 2345-7, 540013) sont conservés entiers
+    et également découpés en leurs parties.
+
+    Args:
+        text: Texte à découper
+
+    Returns:
+        Liste des termes
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(fold_text(text)):
+        if SEPARATOR_PATTERN.search(token):
+            tokens.append(token)
+            tokens.extend(part for part in SEPARATOR_PATTERN.split(token) if part not in STOPWORDS)
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Initialise un index BM25 vide
+
+        Args:
+            k1: Saturation de la fréquence des termes
+            b: Normalisation par la longueur des documents
+        """
+        self.k1 = k1
+        self.b = b
+        self.doc_ids = []
+        self.documents = []
+        self.postings = {}
+        self.idf = {}
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+
+    def build(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]]):
+        """
+        Construit l'index
+
+        Args:
+            documents: Triplets (identifiant, texte, données associées)
+        """
+        postings = defaultdict(lambda: ([], []))
+        doc_ids = []
+        payloads = []
+        lengths = []
+
+        for doc_index, (doc_id, text, payload) in enumerate(documents):
+            tokens = tokenize(text)
+            counts = defaultdict(int)
+            for token in tokens:
+                counts[token] += 1
+            for token, count in counts.items():
+                postings[token][0].append(doc_index)
+                postings[token][1].append(count)
+            doc_ids.append(doc_id)
+            payloads.append(payload)
+            lengths.append(len(tokens))
+
+        n_docs = len(doc_ids)
+        self.doc_ids = doc_ids
+        self.documents = payloads
+        self.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        self.postings = {
+            token: (np.asarray(indices, dtype=np.int32), np.asarray(counts, dtype=np.float32))
+            for token, (indices, counts) in postings.items()
+        }
+        self.idf = {
+            token: math.log(1 + (n_docs - len(indices) + 0.5) / (len(indices) + 0.5))
+            for token, (indices, _) in self.postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, n_results: int = 10,
+               allowed_ids: Optional[Set[str]] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Recherche les documents les plus pertinents
+
+        Args:
+            query: Requête de recherche
+            n_results: Nombre de résultats
+            allowed_ids: Documents candidats (tous si None)
+
+        Returns:
+            Triplets (identifiant, score BM25, données associées), par score décroissant
+        """
+        if not self.doc_ids:
+            return []
+
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        average_length = float(self.doc_lengths.mean()) or 1.0
+
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if posting is None:
+                continue
+            indices, counts = posting
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[indices] / average_length)
+            scores[indices] += self.idf[token] * counts * (self.k1 + 1) / (counts + norm)
+
+        matched = np.flatnonzero(scores)
+        if allowed_ids is not None:
+            matched = np.asarray([i for i in matched if self.doc_ids[i] in allowed_ids], dtype=np.int64)
+        if len(matched) == 0:
+            return []
+
+        top = matched[np.argsort(-scores[matched])[:n_results]]
+        return [(self.doc_ids[i], float(scores[i]), self.documents[i]) for i in top]
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fusionne plusieurs classements par Reciprocal Rank Fusion
+
+    Args:
+        rankings: Listes d'identifiants, chacune triée par pertinence
+        k: Constante d'amortissement des rangs
+
+    Returns:
+        Couples (identifiant, score RRF normalisé entre 0 et 1), par score décroissant
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+
+    # Un document classé premier partout obtient 1
+    best_possible = len(rankings) / (k + 1) if rankings else 1.0
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(doc_id, score / best_possible) for doc_id, score in fused]
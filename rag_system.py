@@ -4,15 +4,27 @@ Utilise OpenAI pour les embeddings et la génération de réponses
 """
 
 import os
+import asyncio
 import glob
 import json
-from typing import List, Dict, Any
+import hashlib
+from typing import List, Dict, Any, Optional, Iterator
 from dataclasses import dataclass
 import numpy as np
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import chromadb
 from chromadb.config import Settings
 import tiktoken
+from embedding_cache import get_embedding_cache, get_query_memo, fetch_embeddings, fetch_embeddings_async
+from embedding_pipeline import create_embedding_pipeline
+from ingestion_queue import get_ingestion_queue, ingest_records, resume_unfinished_runs
+from build_progress import BuildProgress
+from collection_alias import CollectionAliases, open_shadow_collection, garbage_collect
+from vector_backend import open_vector_backend
+
+# Version du découpage et des métadonnées des chunks (à incrémenter quand chunk_document
+# change) : invalide les instantanés exportés auparavant
+METADATA_VERSION = 1
 
 @dataclass
 class Document:
@@ -32,27 +44,51 @@ class RAGSystem:
             data_directory: Répertoire contenant les documents
         """
         self.client = OpenAI(api_key=openai_api_key)
+        # Client asynchrone pour le serveur ASGI (asgi.py)
+        self.async_client = AsyncOpenAI(api_key=openai_api_key)
         self.data_directory = data_directory
         self.encoding = tiktoken.encoding_for_model("gpt-3.5-turbo")
+        self.embedding_model = "text-embedding-3-small"
+        self.embedding_cache = get_embedding_cache()
+        self.query_memo = get_query_memo()
+        self.embedding_pipeline = create_embedding_pipeline(
+            self.client, self.embedding_model, self.encoding, self.embedding_cache
+        )
+        self.ingestion_queue = get_ingestion_queue()
+        self.build_progress = BuildProgress("medical_documents")
+        
+        # Incrémentée à chaque modification de la collection (invalide les réponses en cache)
+        self.index_version = 0
         
         # Initialiser ChromaDB
         chroma_path = os.getenv('CHROMA_DB_PATH', './chroma_db')
         # Sur Render, utiliser un répertoire temporaire si le chemin par défaut n'est pas accessible
         if not os.access(os.path.dirname(chroma_path) or '.', os.W_OK):
             chroma_path = '/tmp/chroma_db'
+        self.chroma_path = chroma_path
         self.chroma_client = chromadb.PersistentClient(
             path=chroma_path,
             settings=Settings(anonymized_telemetry=False)
         )
         
-        # Créer ou récupérer la collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="medical_documents",
+        # Créer ou récupérer la collection en service (désignée par l'alias "medical_documents")
+        self.aliases = CollectionAliases(os.path.join(chroma_path, "collection_aliases.json"))
+        # Requêtes servies par le backend configuré (VECTOR_BACKEND, voir vector_backend.py)
+        self.collection = open_vector_backend(self.chroma_client.get_or_create_collection(
+            name=self.aliases.resolve("medical_documents"),
             metadata={"hnsw:space": "cosine"}
-        )
+        ))
+        # Collection en cours d'écriture (une nouvelle version pendant une reconstruction complète)
+        self.build_collection = self.collection
         
         print(f"Collection initialisée avec {self.collection.count()} documents")
     
+    def index_format(self) -> str:
+        """
+        Identifie la façon dont les fichiers sources sont transformés en chunks indexés
+        """
+        return f"metadata-v{METADATA_VERSION}"
+    
     def chunk_text(self, text: str, max_tokens: int = 500, overlap: int = 50) -> List[str]:
         """
         Découpe le texte en chunks avec overlap
@@ -92,26 +128,39 @@ class RAGSystem:
                 with open(filepath, 'r', encoding='utf-8') as f:
                     content = f.read()
                 
-                filename = os.path.basename(filepath)
-                title = self._extract_title(content)
-                
-                # Découper en chunks
-                chunks = self.chunk_text(content)
-                
-                for i, chunk in enumerate(chunks):
-                    doc = Document(
-                        content=chunk,
-                        filename=filename,
-                        title=title,
-                        chunk_id=f"{filename}_{i}"
-                    )
-                    documents.append(doc)
+                documents.extend(self.chunk_document(os.path.basename(filepath), content))
                     
             except Exception as e:
                 print(f"Erreur lors du chargement de {filepath}: {e}")
         
         return documents
     
+    def chunk_document(self, filename: str, content: str) -> List[Document]:
+        """
+        Découpe le contenu d'un fichier markdown en documents
+        
+        Args:
+            filename: Nom du fichier
+            content: Contenu du fichier
+            
+        Returns:
+            Liste des chunks du fichier
+        """
+        title = self._extract_title(content)
+        
+        # Découper en chunks
+        chunks = self.chunk_text(content)
+        
+        return [
+            Document(
+                content=chunk,
+                filename=filename,
+                title=title,
+                chunk_id=f"{filename}_{i}"
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+    
     def _extract_title(self, content: str) -> str:
         """
         Extrait le titre depuis le contenu markdown
@@ -139,80 +188,344 @@ class RAGSystem:
             Liste des embeddings
         """
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-3-small",
-                input=texts
-            )
-            return [data.embedding for data in response.data]
+            return fetch_embeddings(self.client, texts, self.embedding_model, self.embedding_cache)
         except Exception as e:
             print(f"Erreur lors de la génération des embeddings: {e}")
             return []
     
-    def build_database(self):
+    def _manifest_path(self, collection_name: Optional[str] = None) -> str:
+        """
+        Retourne le chemin du manifeste d'une collection (par défaut celle en cours d'écriture)
+        
+        Args:
+            collection_name: Nom de la collection physique
+            
+        Returns:
+            Chemin du fichier JSON
+        """
+        name = collection_name or self.build_collection.name
+        if name == "medical_documents":
+            # Manifeste de la collection d'origine, non versionnée
+            return os.path.join(self.chroma_path, "documents_manifest.json")
+        return os.path.join(self.chroma_path, f"{name}_manifest.json")
+    
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Charge le manifeste des fichiers indexés
+        
+        Returns:
+            Dictionnaire filename -> {mtime, size, content_hash, chunk_ids}
+        """
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _save_manifest(self, manifest: Dict[str, Dict[str, Any]]):
+        """
+        Enregistre le manifeste de manière atomique
+        
+        Args:
+            manifest: Manifeste à enregistrer
+        """
+        manifest_path = self._manifest_path()
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+    
+    def build_database(self, full_rebuild: bool = False):
         """
         Construit la base de données vectorielle
+        
+        Par défaut, seuls les fichiers ajoutés, modifiés ou supprimés
+        sont traités (voir sync_database).
+        
+        Args:
+            full_rebuild: Tout réindexer dans une nouvelle version de la collection,
+                mise en service une fois complète
+        """
+        # Collection vide au départ : les requêtes attendent la fin de la construction
+        with self.build_progress.job(blocking=self.collection.count() == 0):
+            if full_rebuild:
+                self._rebuild_shadow()
+            else:
+                self.sync_database()
+            self.index_version += 1
+    
+    def _rebuild_shadow(self):
         """
-        print("Chargement des documents...")
-        documents = self.load_documents()
+        Reconstruit tout dans une nouvelle version de la collection puis bascule l'alias
         
-        if not documents:
-            print("Aucun document trouvé!")
-            return
+        La collection en service continue de répondre pendant la reconstruction.
+        """
+        shadow, resumed = open_shadow_collection(
+            self.chroma_client, "medical_documents", self.collection.name, self.ingestion_queue
+        )
+        if resumed:
+            # Reprendre la construction interrompue au lieu de repartir de zéro
+            print(f"Construction de {shadow.name} interrompue, reprise depuis le dernier batch écrit")
+        else:
+            print(f"Reconstruction complète dans {shadow.name}")
         
-        # Supprimer l'ancienne collection
+        self.build_collection = shadow
         try:
-            self.chroma_client.delete_collection("medical_documents")
-        except:
-            pass
+            summary = self.sync_database()
+        finally:
+            self.build_collection = self.collection
         
-        # Créer nouvelle collection
-        self.collection = self.chroma_client.create_collection(
-            name="medical_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
+        # Batches ou fichiers en échec (avec ou sans file d'ingestion) : l'alias n'est pas basculé
+        if not summary['complete'] or (self.ingestion_queue is not None and self.ingestion_queue.unfinished_runs(shadow.name)):
+            print(f"⚠️  {shadow.name} incomplète, {self.collection.name} reste en service")
+            return
+        
+        self.promote_collection(shadow)
+    
+    def promote_collection(self, shadow):
+        """
+        Met en service une nouvelle version de la collection et supprime les anciennes
+        
+        Args:
+            shadow: Collection complète à mettre en service
+        """
+        # Bascule atomique : les requêtes suivantes interrogent la nouvelle version
+        self.aliases.swap("medical_documents", shadow.name)
+        self.collection = self.build_collection = open_vector_backend(shadow)
+        self.index_version += 1
+        print(f"Collection {shadow.name} mise en service")
+        
+        keep = int(os.getenv('COLLECTION_KEEP_VERSIONS', 1))
+        for name in garbage_collect(self.chroma_client, "medical_documents", shadow.name, keep=keep):
+            print(f"Ancienne version supprimée: {name}")
+            manifest_path = self._manifest_path(name)
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+    
+    def sync_database(self) -> Dict[str, Any]:
+        """
+        Synchronise la collection en suivant la progression (voir _sync_database)
+        """
+        with self.build_progress.job(blocking=self.collection.count() == 0):
+            return self._sync_database()
+    
+    def _sync_database(self) -> Dict[str, Any]:
+        """
+        Synchronise la collection avec les fichiers markdown du répertoire data
+        
+        Un manifeste par fichier (mtime, taille, empreinte, ids des chunks)
+        permet de ne redécouper et réindexer que les fichiers modifiés.
+        
+        Returns:
+            Nombre de fichiers ajoutés, modifiés, supprimés, inchangés et en échec,
+            et 'complete' : tous les fichiers sont indexés
+        """
+        cache_before = self.embedding_cache.stats() if self.embedding_cache is not None else None
+        
+        # Terminer d'abord une éventuelle construction interrompue
+        resumed = resume_unfinished_runs(self.ingestion_queue, self.build_collection.name, self.embedding_pipeline, self._write_batch,
+                               progress=self.build_progress)
+        
+        # Un manifeste sans collection correspondante n'est pas fiable
+        manifest = self._load_manifest() if self.build_collection.count() > 0 else {}
         
-        print(f"Traitement de {len(documents)} chunks...")
-        
-        # Traiter par batches
-        batch_size = 10
-        for i in range(0, len(documents), batch_size):
-            batch = documents[i:i + batch_size]
-            
-            # Préparer les données
-            texts = [doc.content for doc in batch]
-            embeddings = self.get_embeddings(texts)
-            
-            if embeddings:
-                # Ajouter à ChromaDB
-                self.collection.add(
-                    embeddings=embeddings,
-                    documents=texts,
-                    metadatas=[{
-                        "filename": doc.filename,
-                        "title": doc.title,
-                        "chunk_id": doc.chunk_id
-                    } for doc in batch],
-                    ids=[doc.chunk_id for doc in batch]
-                )
+        md_files = glob.glob(os.path.join(self.data_directory, "*.md"))
+        current_files = {os.path.basename(filepath) for filepath in md_files}
+        summary = {'added': 0, 'modified': 0, 'deleted': 0, 'unchanged': 0, 'failed': 0}
+        changed = []
+        
+        # Fichiers supprimés
+        for filename in [name for name in manifest if name not in current_files]:
+            chunk_ids = manifest.pop(filename).get('chunk_ids', [])
+            if chunk_ids:
+                self.build_collection.delete(ids=chunk_ids)
+            summary['deleted'] += 1
+            print(f"Fichier supprimé: {filename}")
+        
+        for filepath in md_files:
+            filename = os.path.basename(filepath)
+            entry = manifest.get(filename)
+            
+            try:
+                stat = os.stat(filepath)
+                if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                    summary['unchanged'] += 1
+                    continue
                 
-                print(f"Batch {i//batch_size + 1} ajouté")
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except Exception as e:
+                print(f"Erreur lors du chargement de {filepath}: {e}")
+                summary['failed'] += 1
+                continue
+            
+            content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+            if entry and entry['content_hash'] == content_hash:
+                # Fichier touché mais contenu identique
+                entry['mtime'] = stat.st_mtime
+                entry['size'] = stat.st_size
+                summary['unchanged'] += 1
+                continue
+            
+            documents = self.chunk_document(filename, content)
+            print(f"Fichier à indexer: {filename} ({len(documents)} chunks)")
+            changed.append((filename, documents, {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'content_hash': content_hash,
+                'chunk_ids': [doc.chunk_id for doc in documents]
+            }))
+        
+        # Indexer tous les fichiers modifiés en une seule passe concurrente
+        failed_files = self._index_documents([doc for _, documents, _ in changed for doc in documents])
+        
+        for filename, documents, new_entry in changed:
+            if filename in failed_files:
+                # Le manifeste garde l'ancienne entrée: le fichier sera retraité
+                print(f"Indexation incomplète de {filename}")
+                summary['failed'] += 1
+                continue
+            
+            # Supprimer les chunks obsolètes (fichier raccourci)
+            entry = manifest.get(filename)
+            stale_ids = [chunk_id for chunk_id in (entry or {}).get('chunk_ids', []) if chunk_id not in new_entry['chunk_ids']]
+            if stale_ids:
+                self.build_collection.delete(ids=stale_ids)
+            
+            summary['modified' if entry else 'added'] += 1
+            manifest[filename] = new_entry
+        
+        self._save_manifest(manifest)
+        # Aucun fichier : une collection vide ne doit pas être mise en service
+        summary['complete'] = resumed and not summary['failed'] and bool(md_files)
+        if summary['added'] or summary['modified'] or summary['deleted']:
+            self.index_version += 1
         
-        print(f"Base de données construite avec {self.collection.count()} documents")
+        print(f"Synchronisation: {summary['added']} ajoutés, {summary['modified']} modifiés, "
+              f"{summary['deleted']} supprimés, {summary['unchanged']} inchangés, {summary['failed']} en échec")
+        print(f"Base de données construite avec {self.build_collection.count()} documents")
+        if cache_before is not None:
+            stats = self.embedding_cache.stats()
+            print(f"Cache d'embeddings: {stats['hits'] - cache_before['hits']} textes réutilisés, "
+                  f"{stats['misses'] - cache_before['misses']} textes envoyés à l'API")
+        
+        return summary
     
-    def search_documents(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
+    def _index_documents(self, documents: List[Document]) -> set:
+        """
+        Génère les embeddings des documents et les enregistre dans ChromaDB
+        
+        Args:
+            documents: Documents à indexer
+            
+        Returns:
+            Noms des fichiers dont au moins un chunk n'a pas pu être indexé
+        """
+        written = set()
+        
+        def write_batch(texts, records, embeddings):
+            self._write_batch(texts, records, embeddings)
+            written.update(record['id'] for record in records)
+        
+        ingest_records(
+            self.ingestion_queue,
+            self.build_collection.name,
+            self.embedding_pipeline,
+            [(doc.content, {
+                'id': doc.chunk_id,
+                'metadata': {
+                    "filename": doc.filename,
+                    "title": doc.title,
+                    "chunk_id": doc.chunk_id
+                }
+            }) for doc in documents],
+            write_batch,
+            progress=self.build_progress
+        )
+        
+        return {doc.filename for doc in documents if doc.chunk_id not in written}
+    
+    def _write_batch(self, texts: List[str], records: List[Dict[str, Any]], embeddings: List[List[float]]):
+        """
+        Ajoute ou remplace un batch de chunks dans ChromaDB
+        
+        Args:
+            texts: Contenus des chunks
+            records: Enregistrements {id, metadata}
+            embeddings: Embeddings correspondants
+        """
+        self.build_collection.upsert(
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=[record['metadata'] for record in records],
+            ids=[record['id'] for record in records]
+        )
+    
+    def embed_query(self, query: str) -> Optional[List[float]]:
+        """
+        Génère l'embedding d'une requête
+        
+        Args:
+            query: Requête de recherche
+            
+        Returns:
+            Embedding de la requête, ou None en cas d'erreur
+        """
+        # Requête déjà vue par l'un des deux systèmes RAG
+        embedding = self.query_memo.get(self.embedding_model, query)
+        if embedding is not None:
+            return embedding
+        
+        embeddings = self.get_embeddings([query])
+        if not embeddings:
+            return None
+        
+        self.query_memo.put(self.embedding_model, query, embeddings[0])
+        return embeddings[0]
+    
+    async def embed_query_async(self, query: str) -> Optional[List[float]]:
+        """
+        Variante asynchrone de embed_query
+        
+        Args:
+            query: Requête de recherche
+            
+        Returns:
+            Embedding de la requête, ou None en cas d'erreur
+        """
+        embedding = self.query_memo.get(self.embedding_model, query)
+        if embedding is not None:
+            return embedding
+        
+        try:
+            embeddings = await fetch_embeddings_async(
+                self.async_client, [query], self.embedding_model, self.embedding_cache
+            )
+        except Exception as e:
+            print(f"Erreur lors de la génération des embeddings: {e}")
+            return None
+        
+        self.query_memo.put(self.embedding_model, query, embeddings[0])
+        return embeddings[0]
+    
+    def search_documents(self, query: str, n_results: int = 5, query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
         """
         Recherche les documents pertinents
         
         Args:
             query: Requête de recherche
             n_results: Nombre de résultats
+            query_embedding: Embedding de la requête, s'il est déjà connu
             
         Returns:
             Liste des documents pertinents
         """
         try:
             # Générer l'embedding de la requête
-            query_embedding = self.get_embeddings([query])[0]
+            if query_embedding is None:
+                query_embedding = self.embed_query(query)
+                if query_embedding is None:
+                    return []
             
             # Rechercher dans ChromaDB
             results = self.collection.query(
@@ -237,23 +550,85 @@ class RAGSystem:
             print(f"Erreur lors de la recherche: {e}")
             return []
     
-    def generate_answer(self, query: str, context_documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def search_documents_batch(self, queries: List[str], n_results: int = 5) -> List[List[Dict[str, Any]]]:
         """
-        Génère une réponse basée sur les documents de contexte
+        Recherche les documents pertinents pour plusieurs requêtes
+        
+        Les embeddings manquants sont demandés en un seul appel et toutes
+        les requêtes sont envoyées au backend vectoriel en une fois.
+        
+        Args:
+            queries: Requêtes de recherche
+            n_results: Nombre de résultats par requête
+            
+        Returns:
+            Liste des documents pertinents pour chaque requête
+        """
+        try:
+            embeddings = {query: self.query_memo.get(self.embedding_model, query) for query in queries}
+            missing = [query for query, embedding in embeddings.items() if embedding is None]
+            if missing:
+                for query, embedding in zip(missing, self.get_embeddings(missing)):
+                    self.query_memo.put(self.embedding_model, query, embedding)
+                    embeddings[query] = embedding
+            if not queries or any(embeddings[query] is None for query in queries):
+                return [[] for _ in queries]
+            
+            results = self.collection.query(
+                query_embeddings=[embeddings[query] for query in queries],
+                n_results=n_results
+            )
+            
+            return [
+                [
+                    {
+                        'content': document,
+                        'filename': metadata['filename'],
+                        'title': metadata['title'],
+                        'score': 1 - distance
+                    }
+                    for document, metadata, distance in zip(documents, metadatas, distances)
+                ]
+                for documents, metadatas, distances in zip(results['documents'], results['metadatas'], results['distances'])
+            ]
+            
+        except Exception as e:
+            print(f"Erreur lors de la recherche: {e}")
+            return [[] for _ in queries]
+    
+    async def search_documents_async(self, query: str, n_results: int = 5, query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Variante asynchrone de search_documents
+        
+        L'embedding est obtenu sans bloquer la boucle d'événements, la requête
+        ChromaDB (locale et rapide) s'exécute dans un thread.
+        
+        Args:
+            query: Requête de recherche
+            n_results: Nombre de résultats
+            query_embedding: Embedding de la requête, s'il est déjà connu
+            
+        Returns:
+            Liste des documents pertinents
+        """
+        if query_embedding is None:
+            query_embedding = await self.embed_query_async(query)
+            if query_embedding is None:
+                return []
+        
+        return await asyncio.to_thread(self.search_documents, query, n_results, query_embedding)
+    
+    def _build_messages(self, query: str, context_documents: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """
+        Construit les messages envoyés au modèle de génération
         
         Args:
             query: Question de l'utilisateur
             context_documents: Documents de contexte
             
         Returns:
-            Réponse avec sources
+            Messages système et utilisateur
         """
-        if not context_documents:
-            return {
-                'answer': "Désolé, je n'ai pas trouvé d'informations pertinentes dans la base de données.",
-                'sources': []
-            }
-        
         # Préparer le contexte
         context_text = "\n\n".join([
             f"Document: {doc['title']}\n{doc['content']}"
@@ -279,31 +654,97 @@ Instructions:
 
 Réponse:"""
         
+        return [
+            {"role": "system", "content": "Vous êtes un assistant médical français spécialisé en biologie clinique. Répondez uniquement en français et basez-vous uniquement sur les documents fournis."},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _build_sources(self, context_documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Prépare la liste des sources affichées avec la réponse
+        
+        Args:
+            context_documents: Documents de contexte
+            
+        Returns:
+            Liste des sources
+        """
+        sources = []
+        for doc in context_documents:
+            sources.append({
+                'title': doc['title'],
+                'filename': doc['filename'],
+                'score': round(doc['score'], 3)
+            })
+        return sources
+    
+    def generate_answer(self, query: str, context_documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Génère une réponse basée sur les documents de contexte
+        
+        Args:
+            query: Question de l'utilisateur
+            context_documents: Documents de contexte
+            
+        Returns:
+            Réponse avec sources
+        """
+        if not context_documents:
+            return {
+                'answer': "Désolé, je n'ai pas trouvé d'informations pertinentes dans la base de données.",
+                'sources': []
+            }
+        
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "Vous êtes un assistant médical français spécialisé en biologie clinique. Répondez uniquement en français et basez-vous uniquement sur les documents fournis."},
-                    {"role": "user", "content": prompt}
-                ],
+                messages=self._build_messages(query, context_documents),
                 max_tokens=1000,
                 temperature=0.1
             )
             
             answer = response.choices[0].message.content
             
-            # Préparer les sources
-            sources = []
-            for doc in context_documents:
-                sources.append({
-                    'title': doc['title'],
-                    'filename': doc['filename'],
-                    'score': round(doc['score'], 3)
-                })
-            
             return {
                 'answer': answer,
-                'sources': sources
+                'sources': self._build_sources(context_documents)
+            }
+            
+        except Exception as e:
+            print(f"Erreur lors de la génération: {e}")
+            return {
+                'answer': f"Erreur lors de la génération de la réponse: {str(e)}",
+                'sources': []
+            }
+    
+    async def generate_answer_async(self, query: str, context_documents: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Variante asynchrone de generate_answer
+        
+        Args:
+            query: Question de l'utilisateur
+            context_documents: Documents de contexte
+            
+        Returns:
+            Réponse avec sources
+        """
+        if not context_documents:
+            return {
+                'answer': "Désolé, je n'ai pas trouvé d'informations pertinentes dans la base de données.",
+                'sources': []
+            }
+        
+        try:
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4",
+                messages=self._build_messages(query, context_documents),
+                max_tokens=1000,
+                temperature=0.1
+            )
+            
+            return {
+                'answer': response.choices[0].message.content,
+                'sources': self._build_sources(context_documents)
             }
             
         except Exception as e:
@@ -313,12 +754,58 @@ Réponse:"""
                 'sources': []
             }
     
-    def ask_question(self, query: str) -> Dict[str, Any]:
+    def stream_question(self, query: str, query_embedding: Optional[List[float]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Pose une question en diffusant la réponse au fil de sa génération
+        
+        Les sources sont émises dès la fin de la recherche, puis la réponse
+        token par token.
+        
+        Args:
+            query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
+            
+        Returns:
+            Itérateur d'événements {'event': 'sources' | 'token' | 'done' | 'error', 'data': ...}
+        """
+        print(f"Question (streaming): {query}")
+        
+        relevant_docs = self.search_documents(query, n_results=5, query_embedding=query_embedding)
+        
+        if not relevant_docs:
+            yield {'event': 'sources', 'data': {'sources': [], 'query': query}}
+            yield {'event': 'token', 'data': {'text': "Je n'ai pas trouvé d'informations pertinentes dans la base de données."}}
+            yield {'event': 'done', 'data': {'query': query}}
+            return
+        
+        yield {'event': 'sources', 'data': {'sources': self._build_sources(relevant_docs), 'query': query}}
+        
+        try:
+            stream = self.client.chat.completions.create(
+                model="gpt-4",
+                messages=self._build_messages(query, relevant_docs),
+                max_tokens=1000,
+                temperature=0.1,
+                stream=True
+            )
+            
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {'event': 'token', 'data': {'text': chunk.choices[0].delta.content}}
+            
+            yield {'event': 'done', 'data': {'query': query}}
+            
+        except Exception as e:
+            print(f"Erreur lors de la génération: {e}")
+            yield {'event': 'error', 'data': {'error': f"Erreur lors de la génération de la réponse: {str(e)}"}}
+    
+    def ask_question(self, query: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
         """
         Interface principale pour poser une question
         
         Args:
             query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
             
         Returns:
             Réponse complète avec sources
@@ -326,7 +813,7 @@ Réponse:"""
         print(f"Question: {query}")
         
         # Rechercher les documents pertinents
-        relevant_docs = self.search_documents(query, n_results=5)
+        relevant_docs = self.search_documents(query, n_results=5, query_embedding=query_embedding)
         
         if not relevant_docs:
             return {
@@ -339,4 +826,31 @@ Réponse:"""
         result = self.generate_answer(query, relevant_docs)
         result['query'] = query
         
-        return result 
\ No newline at end of file
+        return result
+    
+    async def ask_question_async(self, query: str, query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Variante asynchrone de ask_question
+        
+        Args:
+            query: Question de l'utilisateur
+            query_embedding: Embedding de la question, s'il est déjà connu
+            
+        Returns:
+            Réponse complète avec sources
+        """
+        print(f"Question: {query}")
+        
+        relevant_docs = await self.search_documents_async(query, n_results=5, query_embedding=query_embedding)
+        
+        if not relevant_docs:
+            return {
+                'answer': "Je n'ai pas trouvé d'informations pertinentes dans la base de données.",
+                'sources': [],
+                'query': query
+            }
+        
+        result = await self.generate_answer_async(query, relevant_docs)
+        result['query'] = query
+        
+        return result
@@ -0,0 +1,234 @@
+"""
+Caches des réponses pour les questions répétées
+ResponseCache : correspondance exacte (endpoint, question normalisée, version de la collection)
+SemanticCache : questions reformulées, par similarité des embeddings, à signature
+égale (laboratoire, codes, délais : voir FacetIndex.query_signature)
+"""
+
+import re
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+
+def normalize_question(question: str) -> str:
+    """
+    Normalise une question pour la comparaison exacte
+
+    Args:
+        question: Question de l'utilisateur
+
+    Returns:
+        Question en minuscules, espaces réduits, sans ponctuation finale
+    """
+    text = unicodedata.normalize('NFC', question).lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' ?!.;:')
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 3600):
+        """
+        Initialise le cache des réponses (LRU avec expiration)
+
+        Args:
+            max_entries: Nombre maximum de réponses conservées
+            ttl_seconds: Durée de validité d'une réponse
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, endpoint: str, question: str, version: Any) -> Tuple[str, str, Any]:
+        return (endpoint, normalize_question(question), version)
+
+    def get(self, endpoint: str, question: str, version: Any) -> Optional[Dict[str, Any]]:
+        """
+        Récupère une réponse en cache
+
+        Args:
+            endpoint: Nom de l'endpoint ('ask', 'compendium', ...)
+            question: Question de l'utilisateur
+            version: Version de la collection interrogée
+
+        Returns:
+            Réponse en cache ou None
+        """
+        key = self._key(endpoint, question, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, endpoint: str, question: str, version: Any, response: Dict[str, Any]):
+        """
+        Enregistre une réponse
+
+        Args:
+            endpoint: Nom de l'endpoint
+            question: Question de l'utilisateur
+            version: Version de la collection interrogée
+            response: Réponse à conserver
+        """
+        key = self._key(endpoint, question, version)
+        with self._lock:
+            self._entries[key] = (time.time(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, endpoint: Optional[str] = None):
+        """
+        Supprime les réponses d'un endpoint (toutes si None)
+        """
+        with self._lock:
+            if endpoint is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == endpoint]:
+                    del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne les compteurs du cache
+
+        Returns:
+            Dictionnaire avec hits, misses, taux de succès et taille
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds
+        }
+
+class SemanticCache:
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl_seconds: float = 3600):
+        """
+        Initialise le cache sémantique (similarité cosinus entre embeddings de questions)
+
+        Args:
+            threshold: Similarité minimale pour réutiliser une réponse
+            max_entries: Nombre maximum de questions conservées (éviction LRU)
+            ttl_seconds: Durée de validité d'une réponse
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._entries = [None] * max_entries
+        self._last_used = np.zeros(max_entries)
+        self._valid = np.zeros(max_entries, dtype=bool)
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str, embedding: List[float], version: Any, signature: Any) -> Optional[Dict[str, Any]]:
+        """
+        Cherche une question suffisamment proche déjà traitée
+
+        Des questions presque identiques peuvent appeler des réponses différentes
+        ("délai CMV à l'UZA" / "au LHUB") : seule une question de même signature est réutilisée.
+
+        Args:
+            endpoint: Nom de l'endpoint
+            embedding: Embedding de la question
+            version: Version de la collection interrogée
+            signature: Laboratoires, préférences et codes de la question
+
+        Returns:
+            Réponse en cache (avec la similarité obtenue) ou None
+        """
+        with self._lock:
+            if self._vectors is None or not self._valid.any():
+                self.misses += 1
+                return None
+
+            query = np.asarray(embedding, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+
+            now = time.time()
+            candidates = np.flatnonzero(self._valid)
+            # Ignorer les entrées d'un autre endpoint, d'une autre version, d'une autre signature ou expirées
+            candidates = candidates[[
+                self._entries[i][0] == endpoint and self._entries[i][1] == version
+                and self._entries[i][4] == signature
+                and now - self._entries[i][2] <= self.ttl_seconds
+                for i in candidates
+            ]]
+            if len(candidates) == 0:
+                self.misses += 1
+                return None
+
+            similarities = self._vectors[candidates] @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            slot = candidates[best]
+            self._last_used[slot] = now
+            self.hits += 1
+            return dict(self._entries[slot][3], similarity=round(float(similarities[best]), 3))
+
+    def put(self, endpoint: str, embedding: List[float], version: Any, signature: Any, response: Dict[str, Any]):
+        """
+        Enregistre la réponse d'une question
+
+        Args:
+            endpoint: Nom de l'endpoint
+            embedding: Embedding de la question
+            version: Version de la collection interrogée
+            signature: Laboratoires, préférences et codes de la question
+            response: Réponse à conserver
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._valid[:] = False
+
+            free = np.flatnonzero(~self._valid)
+            # Emplacement libre, sinon la question la moins récemment utilisée
+            slot = int(free[0]) if len(free) else int(np.argmin(self._last_used))
+
+            now = time.time()
+            self._vectors[slot] = vector
+            self._entries[slot] = (endpoint, version, now, response, signature)
+            self._last_used[slot] = now
+            self._valid[slot] = True
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Retourne les compteurs du cache
+
+        Returns:
+            Dictionnaire avec hits, misses, taux de succès, taille et seuil
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+            'entries': int(self._valid.sum()),
+            'max_entries': self.max_entries,
+            'threshold': self.threshold
+        }
@@ -0,0 +1,8 @@
+"""
+Configuration des tests : modules du dépôt importables depuis tests/
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+"""
+Tests du cache en colonnes des analyses normalisées
+"""
+
+import json
+import pytest
+from lab_parser import iter_lab_records, iter_json_array
+from analysis_cache import AnalysisCache, LabColumns, iter_lab_analyses, file_digest
+
+SOURCES = ("examen_uza_detailed.json", "examen_lhub_detailed.json", "examen_chu_ulg.json")
+
+@pytest.fixture
+def lab_files(tmp_path):
+    """Extraits des fichiers de laboratoire réels"""
+    directory = tmp_path / "data"
+    directory.mkdir()
+    filepaths = []
+    for name in SOURCES:
+        items = []
+        for item in iter_json_array(f"data/compendium_data/{name}"):
+            items.append(item)
+            if len(items) == 15:
+                break
+        (directory / name).write_text(json.dumps(items, ensure_ascii=False), encoding='utf-8')
+        filepaths.append(str(directory / name))
+    return filepaths
+
+def expected(filepaths):
+    return [(filepath, record) for filepath in filepaths for record in iter_lab_records(filepath)]
+
+def test_columns_round_trip(lab_files):
+    """Les colonnes restituent les analyses à l'identique, valeurs absentes comprises"""
+    records = list(iter_lab_records(lab_files[0]))
+    records[0].update(delai_heures=None, urgence=None, accredite=True, description="Sérum, 5 µl")
+    assert list(LabColumns.from_records(records)) == records
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_cold_then_warm_cache(tmp_path, lab_files, max_workers):
+    """Un cache froid parse les fichiers et les enregistre, un cache chaud les relit à l'identique"""
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    assert list(iter_lab_analyses(lab_files, cache, max_workers)) == expected(lab_files)
+    assert cache.stats() == {'hits': 0, 'misses': 3}
+    assert list(iter_lab_analyses(lab_files, cache, max_workers)) == expected(lab_files)
+    assert cache.stats() == {'hits': 3, 'misses': 3}
+
+def test_truncated_file_is_reported_and_not_cached(tmp_path, lab_files):
+    """Un fichier tronqué est signalé, ses analyses lisibles sont transmises, il n'est pas mis en cache"""
+    truncated = lab_files[1]
+    with open(truncated, encoding='utf-8') as f:
+        content = f.read()
+    with open(truncated, 'w', encoding='utf-8') as f:
+        f.write(content[:len(content) // 2])
+
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    failed = []
+    files = [filepath for filepath, _ in iter_lab_analyses(lab_files, cache, failed_files=failed)]
+    assert failed == [truncated]
+    assert truncated in files
+    assert [cache.contains(filepath, file_digest(filepath)) for filepath in lab_files] == [True, False, True]
+
+def test_streams_one_file_at_a_time(tmp_path, lab_files):
+    """Les analyses du premier fichier sont transmises avant la lecture du suivant"""
+    cache = AnalysisCache(str(tmp_path / "cache"))
+    stream = iter_lab_analyses(lab_files, cache)
+    filepath, _ = next(stream)
+    assert filepath == lab_files[0]
+    stream.close()
+    # Lecture interrompue : rien n'est mis en cache
+    assert list((tmp_path / "cache").iterdir()) == []
@@ -0,0 +1,75 @@
+"""
+Tests du regroupement des analyses équivalentes entre laboratoires
+"""
+
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from analysis_clusters import cluster_analyses, AnalysisClusters
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_one_analysis_per_laboratory():
+    """Deux analyses quasi identiques d'un même laboratoire ne sont jamais réunies"""
+    embeddings = np.stack([unit(1, 0), unit(1, 0.01), unit(1, 0.02)])
+    metadatas = [{'laboratoire': 'A'}, {'laboratoire': 'A'}, {'laboratoire': 'B'}]
+    clusters = cluster_analyses(['a1', 'a2', 'b'], embeddings, metadatas, threshold=0.9)
+    assert len(clusters) == 1
+    assert sorted(clusters[0]) in (['a1', 'b'], ['a2', 'b'])
+
+def test_no_chaining_below_threshold():
+    """Une analyse proche d'un seul membre du groupe n'y entre pas (A~B, B~C, A≁C)"""
+    embeddings = np.stack([unit(1, 0, 0), unit(0.93, 0.37, 0), unit(0.72, 0.69, 0)])
+    metadatas = [{'laboratoire': 'A'}, {'laboratoire': 'B'}, {'laboratoire': 'C'}]
+    clusters = cluster_analyses(['a', 'b', 'c'], embeddings, metadatas, threshold=0.9)
+    assert [sorted(cluster) for cluster in clusters] == [['a', 'b']]
+
+def test_shared_loinc_takes_priority():
+    """Un code LOINC commun réunit deux laboratoires ; les codes de remplacement sont ignorés"""
+    embeddings = np.stack([unit(1, 0), unit(0, 1), unit(1, 0.05), unit(0.05, 1)])
+    metadatas = [
+        {'laboratoire': 'A', 'loinc': '2276-4'},
+        {'laboratoire': 'B', 'loinc': '2276-4'},
+        {'laboratoire': 'C', 'loinc': '-'},
+        {'laboratoire': 'D', 'loinc': '-'},
+    ]
+    clusters = cluster_analyses(['a', 'b', 'c', 'd'], embeddings, metadatas, threshold=0.9)
+    # c ressemble à a mais pas à b : le groupe LOINC reste fermé à c, et '-' ne relie pas c à d
+    assert [sorted(cluster) for cluster in clusters] == [['a', 'b']]
+
+def test_canonical_analysis_first():
+    """L'analyse la plus proche des autres variantes est l'entrée canonique"""
+    embeddings = np.stack([unit(1, 0.2), unit(1, 0), unit(1, -0.2)])
+    metadatas = [{'laboratoire': 'A'}, {'laboratoire': 'B'}, {'laboratoire': 'C'}]
+    clusters = cluster_analyses(['a', 'b', 'c'], embeddings, metadatas, threshold=0.9)
+    assert clusters == [['b', 'a', 'c']]
+
+def test_refresh_builds_and_reloads(tmp_path):
+    """Les groupes sont calculés pour la collection en service puis relus tant qu'elle ne change pas"""
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"), settings=Settings(anonymized_telemetry=False))
+    collection = client.create_collection("compendium_analyses", metadata={"hnsw:space": "cosine"})
+    collection.add(
+        ids=['a', 'b', 'c'],
+        documents=['Ferritine', 'Ferritine', 'TSH'],
+        metadatas=[{'laboratoire': 'A', 'content_hash': '1'}, {'laboratoire': 'B', 'content_hash': '2'},
+                   {'laboratoire': 'C', 'content_hash': '3'}],
+        embeddings=[unit(1, 0).tolist(), unit(1, 0.05).tolist(), unit(0, 1).tolist()]
+    )
+
+    path = str(tmp_path / "analysis_clusters.json")
+    clusters = AnalysisClusters(path, threshold=0.9)
+    clusters.refresh(lambda: collection, wait=True)
+    assert len(clusters) == 1
+    assert sorted(clusters.members('a')) == ['a', 'b']
+    assert clusters.members('c') == []
+
+    reloaded = AnalysisClusters(path, threshold=0.9)
+    reloaded.refresh(lambda: collection, wait=True)
+    assert sorted(reloaded.members('b')) == ['a', 'b']
+
+    # Un autre seuil ne réutilise pas les groupes enregistrés
+    stricter = AnalysisClusters(path, threshold=0.9999)
+    stricter.refresh(lambda: collection, wait=True)
+    assert len(stricter) == 0
@@ -0,0 +1,62 @@
+"""
+Tests du suivi et de l'exclusion mutuelle des constructions
+"""
+
+import threading
+import pytest
+from build_progress import BuildProgress, BuildInProgress
+
+def run_in_thread(target):
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(timeout=5)
+    return errors
+
+def test_nested_jobs_share_progress():
+    """build_database → sync_database : un seul suivi, terminé par l'appel extérieur"""
+    progress = BuildProgress('collection')
+    with progress.job(blocking=True):
+        progress.add_total(2)
+        with progress.job():
+            progress.advance()
+        assert progress.snapshot()['status'] == 'running'
+        assert progress.is_blocking
+    snapshot = progress.snapshot()
+    assert snapshot['status'] == 'completed'
+    assert (snapshot['done_batches'], snapshot['total_batches']) == (1, 2)
+
+def test_concurrent_build_is_refused():
+    """Une construction demandée depuis un autre thread sans attendre lève BuildInProgress"""
+    progress = BuildProgress('collection')
+
+    def try_build():
+        with progress.exclusive(wait=False):
+            pass
+
+    with progress.job():
+        progress.add_total(3)
+        errors = run_in_thread(try_build)
+        assert len(errors) == 1 and isinstance(errors[0], BuildInProgress)
+        assert errors[0].progress['status'] == 'running'
+        assert errors[0].progress['total_batches'] == 3
+
+    assert run_in_thread(try_build) == []
+
+def test_failed_job_reports_error():
+    """Une exception termine le suivi en échec et libère la collection"""
+    progress = BuildProgress('collection')
+    with pytest.raises(ValueError):
+        with progress.job():
+            raise ValueError("boom")
+    assert progress.snapshot()['status'] == 'failed'
+    assert progress.snapshot()['error'] == "boom"
+    with progress.exclusive(wait=False):
+        pass
@@ -0,0 +1,32 @@
+"""
+Tests de la réponse directe aux requêtes qui ne sont qu'un code
+"""
+
+from compendium_rag import CompendiumRAG
+
+RECORD = {
+    'analysis_id': 'lhub-1', 'titre': 'Ferritine', 'code': 'FERR', 'loinc': '2276-4', 'inami': '',
+    'lien': 'https://example.org/ferritine', 'laboratoire': 'LHUB-ULB', 'description': '', 'indication': '',
+    'prelevement': 'Sérum', 'technique': '', 'reference': '', 'service': '', 'matrice': 'Sérum',
+    'volume_minimum': '', 'delai': '24h', 'delai_heures': 24.0, 'match': 'code'
+}
+
+def make_rag():
+    rag = CompendiumRAG.__new__(CompendiumRAG)
+    rag.code_index = {'ferr': [dict(RECORD)]}
+    return rag
+
+def test_returned_records_are_copies():
+    """Modifier la réponse ne modifie pas l'index partagé entre les requêtes"""
+    rag = make_rag()
+    result = rag.answer_from_code('FERR')
+    assert result['records'][0]['titre'] == 'Ferritine'
+    result['records'][0]['titre'] = 'modifié'
+    result['records'].clear()
+    rag.lookup_code('ferr')[0]['score'] = 0.5
+    assert rag.code_index['ferr'] == [RECORD]
+    assert rag.answer_from_code('FERR')['records'] == [RECORD]
+
+def test_unknown_code():
+    """Une requête qui n'est pas un code connu passe à la recherche sémantique"""
+    assert make_rag().answer_from_code('ferritine basse') is None
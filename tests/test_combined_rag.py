@@ -0,0 +1,40 @@
+"""
+Tests du dimensionnement de la recherche conjointe
+"""
+
+import sys
+import pytest
+from combined_rag import server_threads
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.delenv('GUNICORN_THREADS', raising=False)
+    monkeypatch.delenv('WSGI_THREADS', raising=False)
+    for name in ('gunicorn', 'uvicorn'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    def run_under(name):
+        monkeypatch.setitem(sys.modules, name, object())
+    return run_under
+
+def test_uses_the_active_server_variable(server, monkeypatch):
+    """Le pool suit la variable du serveur en cours d'exécution, même plus petite que 32"""
+    monkeypatch.setenv('GUNICORN_THREADS', '8')
+    monkeypatch.setenv('WSGI_THREADS', '64')
+    server('gunicorn')
+    assert server_threads() == 8
+
+def test_uvicorn_uses_wsgi_threads(server, monkeypatch):
+    """Sous uvicorn, les routes Flask sont servies par WSGI_THREADS threads"""
+    monkeypatch.setenv('GUNICORN_THREADS', '8')
+    monkeypatch.setenv('WSGI_THREADS', '16')
+    server('uvicorn')
+    assert server_threads() == 16
+
+def test_defaults(server, monkeypatch):
+    """32 seulement si aucune variable n'est définie"""
+    assert server_threads() == 32
+    monkeypatch.setenv('GUNICORN_THREADS', '4')
+    assert server_threads() == 4
+    server('uvicorn')
+    assert server_threads() == 32
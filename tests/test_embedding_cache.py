@@ -0,0 +1,63 @@
+"""
+Tests du cache persistant des embeddings
+"""
+
+import types
+import asyncio
+import threading
+from embedding_cache import EmbeddingCache, fetch_embeddings_async
+
+def test_hits_do_not_write_to_sqlite(tmp_path):
+    """Une lecture en cache ne déclenche aucune écriture SQLite avant l'intervalle d'écriture"""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10, flush_interval=3600)
+    cache.put_many('model', ['a', 'b'], [[1.0, 0.0], [0.0, 1.0]])
+    changes = cache._conn.total_changes
+    for _ in range(5):
+        assert cache.get_many('model', ['a', 'b', 'c']) == [[1.0, 0.0], [0.0, 1.0], None]
+    assert cache._conn.total_changes == changes
+    assert cache.stats()['hits'] == 10
+
+def test_pending_reads_are_flushed_before_eviction(tmp_path):
+    """Les lectures non encore écrites protègent leurs vecteurs de l'éviction LRU"""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=2, flush_interval=3600)
+    cache.put_many('model', ['ancien'], [[1.0]])
+    cache.put_many('model', ['recent'], [[2.0]])
+    assert cache.get_many('model', ['ancien']) == [[1.0]]
+
+    cache.put_many('model', ['nouveau'], [[3.0]])
+    assert cache.get_many('model', ['ancien', 'recent', 'nouveau']) == [[1.0], None, [3.0]]
+
+def test_reads_are_flushed_periodically(tmp_path):
+    """Les dates d'utilisation sont écrites par lots une fois l'intervalle écoulé"""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10, flush_interval=0)
+    cache.put_many('model', ['a'], [[1.0]])
+    before = cache._conn.execute("SELECT last_used FROM embeddings").fetchone()[0]
+    cache.get_many('model', ['a'])
+    assert cache._last_used == {}
+    assert cache._conn.execute("SELECT last_used FROM embeddings").fetchone()[0] >= before
+
+def test_async_fetch_runs_sqlite_off_the_event_loop(tmp_path):
+    """La variante asynchrone lit et écrit le cache dans un thread, pas sur la boucle d'événements"""
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=10)
+    threads = []
+    for name in ('get_many', 'put_many'):
+        method = getattr(cache, name)
+
+        def recorded(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+        setattr(cache, name, recorded)
+
+    async def create(model, input):
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[float(len(text))]) for text in input])
+    client = types.SimpleNamespace(embeddings=types.SimpleNamespace(create=create))
+
+    async def run():
+        loop_thread = threading.get_ident()
+        first = await fetch_embeddings_async(client, ['ab', 'c'], 'model', cache)
+        second = await fetch_embeddings_async(client, ['ab'], 'model', cache)
+        return loop_thread, first, second
+
+    loop_thread, first, second = asyncio.run(run())
+    assert first == [[2.0], [1.0]] and second == [[2.0]]
+    assert len(threads) == 3 and loop_thread not in threads
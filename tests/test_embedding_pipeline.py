@@ -0,0 +1,167 @@
+"""
+Tests du pipeline d'embeddings et de la file d'ingestion contre un faux serveur d'embeddings
+"""
+
+import types
+import threading
+import openai
+import pytest
+import embedding_pipeline
+from embedding_pipeline import EmbeddingPipeline
+from ingestion_queue import IngestionQueue, ingest_records, resume_unfinished_runs
+
+class FakeEncoding:
+    """Un token par mot"""
+
+    def encode(self, text):
+        return text.split()
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.request = None
+
+class FakeEmbeddings:
+    """Faux serveur d'embeddings : erreurs programmées, puis un vecteur par texte"""
+
+    def __init__(self):
+        self.calls = []
+        self.errors = []
+        self.poison = set()
+        self._lock = threading.Lock()
+
+    def create(self, model, input):
+        with self._lock:
+            self.calls.append(list(input))
+            if self.errors:
+                raise self.errors.pop(0)
+        if self.poison.intersection(input):
+            raise ValueError("texte refusé")
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[float(len(text)), 1.0]) for text in input])
+
+def rate_limit_error(retry_after=None):
+    headers = {'retry-after': retry_after} if retry_after is not None else {}
+    return openai.RateLimitError("429", response=FakeResponse(429, headers), body=None)
+
+@pytest.fixture
+def client():
+    return types.SimpleNamespace(embeddings=FakeEmbeddings())
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    # Même module time pour le pipeline et la file d'ingestion
+    monkeypatch.setattr(embedding_pipeline.time, 'sleep', delays.append)
+    return delays
+
+def make_pipeline(client, **kwargs):
+    options = dict(max_workers=2, max_batch_tokens=10, max_batch_size=3)
+    options.update(kwargs)
+    return EmbeddingPipeline(client, 'fake-model', FakeEncoding(), **options)
+
+def test_pack_batches_respects_token_budget_and_size(client):
+    """Les batches respectent le budget de tokens et le nombre maximum de textes"""
+    pipeline = make_pipeline(client)
+    items = [("un deux trois quatre", 1), ("cinq six", 2), ("sept huit neuf", 3), ("dix", 4),
+             ("onze", 5), ("douze", 6), ("treize", 7)]
+    batches = pipeline.pack_batches(items)
+    assert [[payload for _, payload in batch] for batch in batches] == [[1, 2, 3], [4, 5, 6], [7]]
+    for batch in batches:
+        assert sum(len(text.split()) for text, _ in batch) <= 10
+
+def test_pack_batches_keeps_oversized_text_alone(client):
+    """Un texte plus long que le budget forme son propre batch"""
+    pipeline = make_pipeline(client, max_batch_tokens=3)
+    batches = pipeline.pack_batches([("a", 1), ("b c d e f", 2), ("g", 3)])
+    assert [[payload for _, payload in batch] for batch in batches] == [[1], [2], [3]]
+
+def test_retry_honours_retry_after(client, sleeps):
+    """Les erreurs 429 sont réessayées après le délai Retry-After, plafonné à max_delay"""
+    client.embeddings.errors = [rate_limit_error('2'), rate_limit_error('120')]
+    pipeline = make_pipeline(client, max_delay=30.0)
+    assert pipeline.embed_batch(["abc"]) == [[3.0, 1.0]]
+    assert sleeps == [2.0, 30.0]
+    assert len(client.embeddings.calls) == 3
+
+def test_retry_backoff_without_retry_after(client, sleeps):
+    """Sans Retry-After, le délai suit un backoff exponentiel avec gigue"""
+    client.embeddings.errors = [rate_limit_error(), rate_limit_error(), rate_limit_error()]
+    pipeline = make_pipeline(client, base_delay=1.0)
+    pipeline.embed_batch(["abc"])
+    assert len(sleeps) == 3
+    for attempt, delay in enumerate(sleeps):
+        assert 0.5 * 2 ** attempt <= delay <= 2 ** attempt
+
+def test_retry_gives_up_after_max_retries(client, sleeps):
+    """La dernière erreur est levée une fois les tentatives épuisées"""
+    client.embeddings.errors = [rate_limit_error('1')] * 3
+    pipeline = make_pipeline(client, max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        pipeline.embed_batch(["abc"])
+    assert sleeps == [1.0, 1.0]
+
+def test_run_reports_failed_items(client, sleeps):
+    """Sans file d'ingestion, les éléments des batches en échec sont retournés"""
+    client.embeddings.poison = {"poison"}
+    pipeline = make_pipeline(client, max_batch_size=2)
+    written = []
+    failed = pipeline.run([("a", 1), ("poison", 2), ("c", 3)], lambda texts, payloads, embeddings: written.extend(payloads))
+    assert written == [3]
+    assert failed == [("a", 1), ("poison", 2)]
+
+def test_ingest_records_resumes_only_pending_batches(client, sleeps, tmp_path, monkeypatch):
+    """Une construction incomplète reprend sans réécrire ni réembarquer les batches déjà écrits"""
+    monkeypatch.setenv('INGESTION_MAX_ROUNDS', '2')
+    queue = IngestionQueue(str(tmp_path / 'queue.db'))
+    pipeline = make_pipeline(client, max_batch_size=2)
+    records = [(f"texte {i}", {'id': f"id-{i}"}) for i in range(5)]
+    written = []
+
+    def writer(texts, payloads, embeddings):
+        written.extend(payload['id'] for payload in payloads)
+
+    client.embeddings.poison = {"texte 2"}
+    assert not ingest_records(queue, 'collection', pipeline, records, writer)
+    assert sorted(written) == ['id-0', 'id-1', 'id-4']
+    assert len(queue.unfinished_runs('collection')) == 1
+    assert queue.stats('collection')['failed_batches'] == 1
+    assert queue.stats('collection')['max_attempts'] == 2
+
+    client.embeddings.poison = set()
+    client.embeddings.calls = []
+    assert resume_unfinished_runs(queue, 'collection', pipeline, writer)
+    assert client.embeddings.calls == [["texte 2", "texte 3"]]
+    assert sorted(written) == ['id-0', 'id-1', 'id-2', 'id-3', 'id-4']
+    assert queue.unfinished_runs('collection') == []
+
+def test_ingest_records_without_queue(client, sleeps):
+    """Sans file d'ingestion, un échec est signalé et rien n'est persisté"""
+    client.embeddings.poison = {"texte 1"}
+    pipeline = make_pipeline(client)
+    written = []
+    records = [(f"texte {i}", {'id': f"id-{i}"}) for i in range(2)]
+    assert not ingest_records(None, 'collection', pipeline, records,
+                              lambda texts, payloads, embeddings: written.extend(payloads))
+    assert written == []
+    assert resume_unfinished_runs(None, 'collection', pipeline, None)
+
+def test_writer_errors_fail_only_their_batch(client, sleeps, tmp_path, monkeypatch):
+    """Une erreur d'écriture est signalée comme un échec du batch, les autres batches sont écrits"""
+    monkeypatch.setenv('INGESTION_MAX_ROUNDS', '1')
+    queue = IngestionQueue(str(tmp_path / 'queue.db'))
+    pipeline = make_pipeline(client, max_batch_size=1)
+    written = []
+
+    def writer(texts, payloads, embeddings):
+        if texts == ["disque plein"]:
+            raise OSError("No space left on device")
+        written.extend(payloads)
+
+    records = [("a", {'id': 'a'}), ("disque plein", {'id': 'b'}), ("c", {'id': 'c'})]
+    assert not ingest_records(queue, 'collection', pipeline, records, writer)
+    assert sorted(payload['id'] for payload in written) == ['a', 'c']
+    assert queue.stats('collection')['failed_batches'] == 1
+
+    failed = pipeline.run([("a", 1), ("disque plein", 2)], writer)
+    assert failed == [("disque plein", 2)]
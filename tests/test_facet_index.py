@@ -0,0 +1,73 @@
+"""
+Tests de l'index des facettes et des préférences déduites des questions
+"""
+
+from facet_index import FacetIndex, match_where, match_preference, rank_by_preferences, combine_where
+
+RECORDS = [
+    ('lhub-1', {'laboratoire': 'LHUB-ULB', 'matrice': 'Sérum', 'service': 'Chimie', 'delai_heures': 24.0}),
+    ('lhub-2', {'laboratoire': 'LHUB-ULB', 'matrice': 'Plasma', 'service': 'Chimie', 'delai_heures': 96.0}),
+    ('lhub-3', {'laboratoire': 'LHUB-ULB', 'matrice': 'Urines', 'service': 'Chimie', 'delai_heures': 24.0}),
+    ('cit-1', {'laboratoire': 'CHR Citadelle', 'matrice': 'Sang total', 'service': '', 'delai_heures': 4.0}),
+    ('uza-1', {'laboratoire': 'UZA', 'matrice': 'LCR', 'service': '', 'urgence': True}),
+    ('uza-2', {'laboratoire': 'UZA', 'matrice': 'Serum', 'service': '', 'urgence': False}),
+    ('chu-1', {'laboratoire': 'CHU ULG', 'matrice': '', 'service': 'Immunologie'}),
+]
+
+def build_index():
+    index = FacetIndex()
+    index.build(RECORDS)
+    return index
+
+def test_filter_matches_match_where():
+    """L'index évalue les filtres comme match_where (donc comme ChromaDB)"""
+    index = build_index()
+    filters = [
+        {'laboratoire': 'UZA'},
+        {'laboratoire': {'$in': ['UZA', 'CHU ULG']}},
+        {'delai_heures': {'$lte': 24}},
+        {'urgence': True},
+        {'service': {'$ne': ''}},
+        {'$or': [{'matrice': 'LCR'}, {'delai_heures': {'$gt': 48}}]},
+        combine_where({'laboratoire': 'LHUB-ULB'}, {'matrice': {'$nin': ['Urines']}}),
+    ]
+    for where in filters:
+        expected = {analysis_id for analysis_id, metadata in RECORDS if match_where(metadata, where)}
+        assert index.filter(where) == expected, where
+
+def test_filter_unindexed_field():
+    """Un filtre sur un champ non indexé n'est pas évalué par l'index"""
+    assert build_index().filter({'titre': 'Ferritine'}) is None
+
+def test_laboratory_is_the_only_strict_filter():
+    """Matrice, délai et urgence ne sont pas des filtres stricts"""
+    index = build_index()
+    assert index.parse_query("Quelle est la valeur normale de la créatinine dans le sang ?") == []
+    assert index.parse_query("Analyses en urgence en moins de 2 jours") == []
+    assert index.parse_query("Ferritine à l'UZA") == [{'laboratoire': {'$in': ['UZA']}}]
+
+def test_blood_preference_covers_serum_and_plasma():
+    """"dans le sang" ne défavorise ni le sérum ni le plasma, ni une matrice inconnue"""
+    index = build_index()
+    preferences = index.parse_preferences("Quelle est la valeur normale de la créatinine dans le sang ?")
+    assert len(preferences) == 1
+    passing = {analysis_id for analysis_id, metadata in RECORDS if match_preference(metadata, preferences[0])}
+    assert passing == {'lhub-1', 'lhub-2', 'cit-1', 'uza-2', 'chu-1'}
+
+def test_urgence_and_delai_preferences_ignore_missing_values():
+    """Les laboratoires sans urgence ni délai renseignés ne sont pas pénalisés"""
+    index = build_index()
+    urgence = index.parse_preferences("Quelles analyses sont disponibles en urgence ?")
+    assert urgence == [{'urgence': True}]
+    assert {analysis_id for analysis_id, metadata in RECORDS if not match_preference(metadata, urgence[0])} == {'uza-2'}
+
+    delai = index.parse_preferences("Sérologie rendue en moins de 2 jours")
+    assert delai == [{'delai_heures': {'$lte': 48.0}}]
+    assert {analysis_id for analysis_id, metadata in RECORDS if not match_preference(metadata, delai[0])} == {'lhub-2'}
+
+def test_rank_by_preferences_keeps_every_analysis():
+    """Les préférences reclassent sans écarter, en conservant l'ordre entre ex aequo"""
+    analyses = [dict(metadata, analysis_id=analysis_id) for analysis_id, metadata in RECORDS]
+    preferences = build_index().parse_preferences("Créatinine dans le sang en moins de 2 jours")
+    ranked = [analyse['analysis_id'] for analyse in rank_by_preferences(analyses, preferences)]
+    assert ranked == ['lhub-1', 'cit-1', 'uza-2', 'chu-1', 'lhub-2', 'lhub-3', 'uza-1']
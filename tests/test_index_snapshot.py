@@ -0,0 +1,97 @@
+"""
+Tests de l'export, de la vérification et de l'import des instantanés
+"""
+
+import numpy as np
+import pytest
+import chromadb
+from chromadb.config import Settings
+from build_progress import BuildProgress
+from index_snapshot import export_snapshot, verify_snapshot, import_snapshot, restore_if_available
+
+ALIAS = "compendium_analyses"
+
+class FakeSystem:
+    """Système RAG minimal : collection ChromaDB, répertoire source et version d'indexation"""
+
+    embedding_model = 'fake-model'
+
+    def __init__(self, chroma_path, data_directory, index_format="parser-v3/metadata-v2"):
+        self.chroma_client = chromadb.PersistentClient(path=str(chroma_path),
+                                                       settings=Settings(anonymized_telemetry=False))
+        self.data_directory = str(data_directory)
+        self.collection = self.build_collection = self.chroma_client.get_or_create_collection(
+            ALIAS, metadata={"hnsw:space": "cosine"}
+        )
+        self.build_progress = BuildProgress(ALIAS)
+        self._index_format = index_format
+        self.promoted = []
+
+    def index_format(self):
+        return self._index_format
+
+    def promote_collection(self, shadow):
+        self.promoted.append(shadow.name)
+        self.collection = self.build_collection = shadow
+
+@pytest.fixture
+def data_directory(tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    (directory / "examen_lab.json").write_text('[{"titre": "Ferritine"}]', encoding='utf-8')
+    return directory
+
+@pytest.fixture
+def snapshot(tmp_path, data_directory):
+    source = FakeSystem(tmp_path / "source", data_directory)
+    embeddings = np.random.default_rng(0).standard_normal((3, 8)).astype(np.float32)
+    source.collection.add(
+        ids=["a", "b", "c"],
+        documents=["Ferritine", "CRP", "TSH"],
+        metadatas=[{"titre": "Ferritine", "delai_heures": 24.0}, {"titre": "CRP", "urgence": True}, {"titre": "TSH"}],
+        embeddings=embeddings.tolist()
+    )
+    path = str(tmp_path / "snapshot.zip")
+    header = export_snapshot(path, {ALIAS: source})
+    return path, header, embeddings
+
+def test_export_then_import_restores_collection(tmp_path, data_directory, snapshot):
+    """Un instantané vérifié est chargé dans une nouvelle version puis mis en service"""
+    path, header, embeddings = snapshot
+    assert header['collections'][ALIAS]['count'] == 3
+
+    target = FakeSystem(tmp_path / "target", data_directory)
+    assert verify_snapshot(path, {ALIAS: target}) == {ALIAS: None}
+    assert import_snapshot(path, {ALIAS: target}) == {ALIAS: 3}
+
+    assert target.promoted == [f"{ALIAS}_v1"]
+    stored = target.collection.get(ids=["a", "b", "c"], include=['embeddings', 'metadatas'])
+    assert stored['metadatas'][0] == {"titre": "Ferritine", "delai_heures": 24.0}
+    assert stored['metadatas'][1] == {"titre": "CRP", "urgence": True}
+    assert np.allclose(np.asarray(stored['embeddings']), embeddings)
+
+def test_modified_sources_are_refused(tmp_path, data_directory, snapshot):
+    """Un fichier source modifié depuis l'export invalide la collection"""
+    path, _, _ = snapshot
+    (data_directory / "examen_lab.json").write_text('[{"titre": "Ferritine sérique"}]', encoding='utf-8')
+    target = FakeSystem(tmp_path / "target", data_directory)
+    assert verify_snapshot(path, {ALIAS: target}) == {ALIAS: "fichiers sources modifiés depuis l'export"}
+    assert import_snapshot(path, {ALIAS: target}) == {}
+    assert target.collection.count() == 0
+
+def test_other_parser_version_is_refused(tmp_path, data_directory, snapshot):
+    """Un instantané d'une autre version du parseur ou des métadonnées n'est pas importé"""
+    path, _, _ = snapshot
+    target = FakeSystem(tmp_path / "target", data_directory, index_format="parser-v4/metadata-v2")
+    problem = verify_snapshot(path, {ALIAS: target})[ALIAS]
+    assert problem is not None and "parser-v3/metadata-v2" in problem
+    assert restore_if_available({ALIAS: target}, path) == {}
+    assert target.promoted == []
+
+def test_restore_skips_populated_collections(tmp_path, data_directory, snapshot):
+    """Seules les collections vides sont chargées au démarrage"""
+    path, _, _ = snapshot
+    target = FakeSystem(tmp_path / "target", data_directory)
+    target.collection.add(ids=["x"], documents=["x"], metadatas=[{"titre": "x"}], embeddings=[[0.0] * 8])
+    assert restore_if_available({ALIAS: target}, path) == {}
+    assert target.promoted == []
@@ -0,0 +1,55 @@
+"""
+Tests de l'index BM25 et de la fusion des classements
+"""
+
+import pytest
+from lexical_index import BM25Index, tokenize, reciprocal_rank_fusion
+
+DOCUMENTS = [
+    ('lhub-1', "Ferritine sérique - code FERR - LOINC 2276-4", {'laboratoire': 'LHUB-ULB'}),
+    ('uza-1', "Ferritine in serum", {'laboratoire': 'UZA'}),
+    ('chu-1', "Caryotype constitutionnel GEN_CY_CGH", {'laboratoire': 'CHU'}),
+    ('cit-1', "Protéine C réactive (CRP) dans le sérum", {'laboratoire': 'CIT'}),
+]
+
+@pytest.fixture
+def index():
+    index = BM25Index()
+    index.build(DOCUMENTS)
+    return index
+
+def test_tokenize_keeps_codes_and_folds_accents():
+    """Les codes composés sont gardés entiers et découpés ; accents et mots vides disparaissent"""
+    assert tokenize("Protéine dans le GEN_CY_CGH") == ['proteine', 'gen_cy_cgh', 'gen', 'cy', 'cgh']
+    assert tokenize("LOINC 2276-4") == ['loinc', '2276-4', '2276', '4']
+
+def test_search_finds_exact_codes(index):
+    """Un code de laboratoire ou LOINC retrouve son analyse en tête"""
+    assert index.search("GEN_CY_CGH")[0][0] == 'chu-1'
+    results = index.search("2276-4")
+    assert [doc_id for doc_id, _, _ in results] == ['lhub-1']
+    assert results[0][2] == {'laboratoire': 'LHUB-ULB'}
+
+def test_search_ranks_by_score(index):
+    """Les résultats sont triés par score décroissant et limités à n_results"""
+    results = index.search("ferritine serum", n_results=2)
+    assert len(results) == 2
+    # Les deux termes dans un document court
+    assert results[0][0] == 'uza-1'
+    assert results[0][1] >= results[1][1] > 0
+    assert index.search("troponine") == []
+
+def test_search_restricted_to_allowed_ids(index):
+    """Seuls les documents candidats sont retournés"""
+    results = index.search("serum", allowed_ids={'cit-1', 'chu-1'})
+    assert [doc_id for doc_id, _, _ in results] == ['cit-1']
+    assert index.search("ferritine", allowed_ids=set()) == []
+    assert BM25Index().search("ferritine") == []
+
+def test_reciprocal_rank_fusion():
+    """Un document bien classé dans les deux listes passe devant ; premier partout vaut 1"""
+    fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd', 'a']])
+    assert [doc_id for doc_id, _ in fused] == ['b', 'a', 'd', 'c']
+    assert reciprocal_rank_fusion([['a'], ['a']]) == [('a', pytest.approx(1.0))]
+    assert all(0 < score <= 1 for _, score in fused)
+    assert reciprocal_rank_fusion([]) == []
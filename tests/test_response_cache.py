@@ -0,0 +1,38 @@
+"""
+Tests du cache sémantique des réponses
+"""
+
+from facet_index import FacetIndex
+from response_cache import SemanticCache
+
+def build_index():
+    index = FacetIndex()
+    index.build([
+        ('lhub-1', {'laboratoire': 'LHUB-ULB', 'matrice': 'Sérum', 'delai_heures': 24.0}),
+        ('uza-1', {'laboratoire': 'UZA', 'matrice': 'LCR', 'urgence': True}),
+    ])
+    return index
+
+def test_lab_paraphrases_do_not_share_an_answer():
+    """Deux questions presque identiques sur deux laboratoires n'échangent pas leurs réponses"""
+    index = build_index()
+    cache = SemanticCache(threshold=0.95, max_entries=10)
+    embedding = [1.0, 0.0, 0.0]
+    uza = "délai CMV à l'UZA"
+    cache.put('compendium', embedding, 1, index.query_signature(uza), {'answer': 'UZA : 48h', 'sources': [1]})
+
+    # Même embedding (similarité 1), autre laboratoire
+    assert cache.get('compendium', embedding, 1, index.query_signature("délai CMV au LHUB")) is None
+    result = cache.get('compendium', [0.99, 0.05, 0.0], 1, index.query_signature("Quel délai pour le CMV à l'UZA ?"))
+    assert result['answer'] == 'UZA : 48h'
+
+def test_signature_includes_codes_numbers_and_preferences():
+    """Codes, nombres, sigles et préférences distinguent les questions ; la casse des mots non"""
+    index = build_index()
+    signature = index.query_signature
+    assert signature("délai CMV à l'UZA") != signature("délai HSV à l'UZA")
+    assert signature("code LOINC 2276-4") != signature("code LOINC 2276-5")
+    assert signature("ferritine rendu en moins de 24h") != signature("ferritine rendu en moins de 48h")
+    assert signature("ferritine en urgence") != signature("ferritine")
+    assert signature("ferritine sur sérum") != signature("ferritine")
+    assert signature("Ferritine au LHUB") == signature("ferritine au lhub")
@@ -0,0 +1,67 @@
+"""
+Tests du backend de recherche exacte en mémoire contre une collection ChromaDB
+"""
+
+import numpy as np
+import pytest
+import chromadb
+from chromadb.config import Settings
+from vector_backend import NumpyBackend, open_vector_backend
+
+@pytest.fixture
+def collection(tmp_path):
+    client = chromadb.PersistentClient(path=str(tmp_path / "chroma"), settings=Settings(anonymized_telemetry=False))
+    return client.create_collection("compendium_analyses", metadata={"hnsw:space": "cosine"})
+
+def add_rows(backend, start, count):
+    ids = [f"id-{i}" for i in range(start, start + count)]
+    angles = np.linspace(0, np.pi / 2, 40)[start:start + count]
+    backend.add(ids=ids, embeddings=[[float(np.cos(a)), float(np.sin(a))] for a in angles],
+                documents=[f"doc {i}" for i in range(start, start + count)],
+                metadatas=[{'laboratoire': 'A' if i % 2 else 'B', 'rang': i} for i in range(start, start + count)])
+
+def test_batched_build_matches_chroma(collection):
+    """Une collection construite par batches répond comme ChromaDB, sans reconstruction par batch"""
+    backend = open_vector_backend(collection, 'numpy')
+    assert isinstance(backend, NumpyBackend)
+    for start in range(0, 40, 8):
+        add_rows(backend, start, 8)
+    assert len(backend._pending) == 40
+
+    query = [[1.0, 0.05]]
+    result = backend.query(query, n_results=5)
+    assert backend._pending == {}
+    assert result['ids'] == collection.query(query_embeddings=query, n_results=5)['ids']
+    assert result['ids'][0][0] == 'id-1'
+    assert result['distances'][0] == sorted(result['distances'][0])
+
+def test_upsert_and_delete(collection):
+    """Une ligne remplacée garde sa position ; une ligne supprimée disparaît des résultats"""
+    backend = NumpyBackend(collection)
+    add_rows(backend, 0, 10)
+    backend.upsert(ids=['id-9'], embeddings=[[1.0, 0.0]], documents=['nouveau'], metadatas=[{'laboratoire': 'C'}])
+    backend.upsert(ids=['id-10'], embeddings=[[0.0, 1.0]], documents=['ajout'], metadatas=[{'laboratoire': 'C'}])
+    backend.delete(ids=['id-0'])
+
+    result = backend.query([[1.0, 0.0]], n_results=2, include=['documents', 'metadatas'])
+    assert result['ids'] == [['id-9', 'id-1']]
+    assert result['documents'] == [['nouveau', 'doc 1']]
+    ids, matrix, _, _ = backend._snapshot()
+    assert ids == [f"id-{i}" for i in range(1, 11)]
+    assert matrix.shape == (10, 2)
+
+    # Rechargée depuis ChromaDB, la matrice contient les mêmes lignes
+    reloaded = NumpyBackend(collection)
+    assert sorted(reloaded._snapshot()[0]) == sorted(ids)
+
+def test_where_and_subset(collection):
+    """Les filtres et les sous-ensembles de candidats ne retournent que les lignes retenues"""
+    backend = NumpyBackend(collection)
+    add_rows(backend, 0, 10)
+    result = backend.query([[1.0, 0.0]], n_results=3, where={'laboratoire': 'A'}, include=['metadatas'])
+    assert result['ids'] == [['id-1', 'id-3', 'id-5']]
+    assert all(metadata['laboratoire'] == 'A' for metadata in result['metadatas'][0])
+
+    result = backend.query_subset([[0.0, 1.0]], ['id-2', 'id-7', 'inconnu'], n_results=5)
+    assert result['ids'] == [['id-7', 'id-2']]
+    assert backend.query([[1.0, 0.0]], n_results=3, where={'laboratoire': 'Z'})['ids'] == [[]]
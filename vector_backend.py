@@ -0,0 +1,279 @@
+"""
+Backends de recherche vectorielle derrière RAGSystem.collection et CompendiumRAG.collection
+ChromaDB reste le stockage de référence (persistance, documents, métadonnées) ;
+le backend choisi (VECTOR_BACKEND=chroma|numpy) répond aux requêtes query().
+"""
+
+import os
+import threading
+from typing import List, Dict, Any, Optional
+import numpy as np
+from compact_embeddings import read_embeddings
+from facet_index import match_where
+
+VECTOR_BACKENDS = ('chroma', 'numpy')
+
+class VectorBackend:
+    """
+    Interface commune : mêmes méthodes et mêmes formats de résultat qu'une collection ChromaDB
+
+    L'implémentation de base délègue tout à la collection ChromaDB.
+    """
+
+    def __init__(self, collection):
+        """
+        Initialise le backend
+
+        Args:
+            collection: Collection ChromaDB (stockage de référence)
+        """
+        self.chroma_collection = collection
+
+    @property
+    def name(self) -> str:
+        return self.chroma_collection.name
+
+    def count(self) -> int:
+        return self.chroma_collection.count()
+
+    def get(self, *args, **kwargs) -> Dict[str, Any]:
+        return self.chroma_collection.get(*args, **kwargs)
+
+    def add(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
+        self.chroma_collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict[str, Any]]):
+        self.chroma_collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        self.chroma_collection.delete(ids=ids)
+
+    def query(self, query_embeddings: List[List[float]], n_results: int = 10,
+              where: Optional[Dict[str, Any]] = None, include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Recherche les plus proches voisins de plusieurs requêtes en un appel
+
+        Args:
+            query_embeddings: Embeddings des requêtes
+            n_results: Nombre de résultats par requête
+            where: Filtre sur les métadonnées (syntaxe ChromaDB)
+            include: Champs retournés ('documents', 'metadatas', 'distances', 'embeddings')
+
+        Returns:
+            Dictionnaire au format ChromaDB : une liste de résultats par requête
+        """
+        kwargs = {'query_embeddings': query_embeddings, 'n_results': n_results}
+        if where is not None:
+            kwargs['where'] = where
+        if include is not None:
+            kwargs['include'] = include
+        return self.chroma_collection.query(**kwargs)
+
+    def query_subset(self, query_embeddings: List[List[float]], ids: List[str], n_results: int = 10,
+                     include: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Recherche exacte limitée à des documents candidats (présélectionnés par l'index de facettes)
+
+        Évite les requêtes filtrées de l'index HNSW, lentes et en erreur quand peu de
+        documents satisfont le filtre.
+
+        Args:
+            query_embeddings: Embeddings des requêtes
+            ids: Identifiants des documents candidats
+            n_results: Nombre de résultats par requête
+            include: Champs retournés ('documents', 'metadatas', 'distances', 'embeddings')
+
+        Returns:
+            Dictionnaire au format ChromaDB : une liste de résultats par requête
+        """
+        include = include if include is not None else ['documents', 'metadatas', 'distances']
+        found_ids, vectors, documents, metadatas = [], [], [], []
+        for start in range(0, len(ids), 1000):
+            stored = self.chroma_collection.get(ids=ids[start:start + 1000], include=['embeddings', 'documents', 'metadatas'])
+            found_ids.extend(stored['ids'])
+            vectors.extend(stored['embeddings'])
+            documents.extend(stored['documents'])
+            metadatas.extend(stored['metadatas'])
+
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return _rank(query_embeddings, matrix, found_ids, documents, metadatas, n_results, include)
+
+class NumpyBackend(VectorBackend):
+    """
+    Recherche exacte sur une matrice normalisée en mémoire (un produit matriciel par batch de requêtes)
+
+    Adapté aux petites collections (dizaines de chunks, quelques milliers d'analyses) :
+    pas d'index HNSW ni de couche client ChromaDB sur le chemin des requêtes.
+    Les écritures sont appliquées à ChromaDB puis mises en attente ; la matrice n'est
+    reconstruite qu'une fois, à la requête ou à la suppression suivante, pour que la
+    construction d'une collection par batches reste linéaire.
+    """
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self._lock = threading.Lock()
+        # (ids, matrice normalisée, documents, métadonnées) remplacé d'un bloc à chaque reconstruction
+        self._data = ([], np.zeros((0, 0), dtype=np.float32), [], [])
+        # Lignes écrites depuis la dernière reconstruction : id -> (vecteur normalisé, document, métadonnées)
+        self._pending = {}
+        self.load()
+
+    def load(self):
+        """
+        Charge tous les vecteurs, documents et métadonnées depuis ChromaDB
+        """
+        ids, embeddings = read_embeddings(self.chroma_collection)
+        documents, metadatas = [], []
+        for start in range(0, len(ids), 1000):
+            stored = self.chroma_collection.get(ids=ids[start:start + 1000], include=['documents', 'metadatas'])
+            rows = dict(zip(stored['ids'], zip(stored['documents'], stored['metadatas'])))
+            for record_id in ids[start:start + 1000]:
+                document, metadata = rows[record_id]
+                documents.append(document)
+                metadatas.append(metadata)
+
+        with self._lock:
+            self._data = (ids, _normalize(embeddings), documents, metadatas)
+            self._pending = {}
+
+    def _write(self, ids, embeddings, documents, metadatas):
+        """
+        Met en attente des lignes à remplacer ou à ajouter
+        """
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            for record_id, vector, document, metadata in zip(ids, vectors, documents, metadatas):
+                self._pending[record_id] = (vector, document, metadata)
+
+    def _materialize(self):
+        """
+        Applique les lignes en attente à la matrice en une seule copie (verrou détenu)
+        """
+        if not self._pending:
+            return
+        current_ids, matrix, current_documents, current_metadatas = self._data
+        positions = {record_id: i for i, record_id in enumerate(current_ids)}
+
+        # Nouvelles listes et nouvelle matrice : les requêtes en cours gardent l'ancienne version
+        matrix = matrix.copy() if len(matrix) else matrix
+        current_ids, current_documents, current_metadatas = list(current_ids), list(current_documents), list(current_metadatas)
+        new_rows = []
+        for record_id, (vector, document, metadata) in self._pending.items():
+            if record_id in positions:
+                i = positions[record_id]
+                matrix[i] = vector
+                current_documents[i] = document
+                current_metadatas[i] = metadata
+            else:
+                current_ids.append(record_id)
+                current_documents.append(document)
+                current_metadatas.append(metadata)
+                new_rows.append(vector)
+
+        if new_rows:
+            new_rows = np.asarray(new_rows, dtype=np.float32)
+            matrix = np.vstack([matrix, new_rows]) if len(matrix) else new_rows
+        self._data = (current_ids, matrix, current_documents, current_metadatas)
+        self._pending = {}
+
+    def _snapshot(self):
+        """
+        Retourne (ids, matrice, documents, métadonnées) à jour des écritures
+        """
+        if self._pending:
+            with self._lock:
+                self._materialize()
+        return self._data
+
+    def add(self, ids, embeddings, documents, metadatas):
+        super().add(ids, embeddings, documents, metadatas)
+        self._write(ids, embeddings, documents, metadatas)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        super().upsert(ids, embeddings, documents, metadatas)
+        self._write(ids, embeddings, documents, metadatas)
+
+    def delete(self, ids):
+        super().delete(ids)
+        removed = set(ids)
+        with self._lock:
+            self._materialize()
+            current_ids, matrix, documents, metadatas = self._data
+            keep = [i for i, record_id in enumerate(current_ids) if record_id not in removed]
+            self._data = (
+                [current_ids[i] for i in keep],
+                matrix[keep] if len(matrix) else matrix,
+                [documents[i] for i in keep],
+                [metadatas[i] for i in keep]
+            )
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        include = include if include is not None else ['documents', 'metadatas', 'distances']
+        ids, matrix, documents, metadatas = self._snapshot()
+        if where is not None:
+            # Filtre évalué sur les métadonnées en mémoire, avant le produit matriciel
+            rows = [i for i, metadata in enumerate(metadatas) if match_where(metadata or {}, where)]
+            return _rank(query_embeddings, matrix[rows] if len(matrix) else matrix, [ids[i] for i in rows],
+                         [documents[i] for i in rows], [metadatas[i] for i in rows], n_results, include)
+        return _rank(query_embeddings, matrix, ids, documents, metadatas, n_results, include)
+
+    def query_subset(self, query_embeddings, ids, n_results=10, include=None):
+        include = include if include is not None else ['documents', 'metadatas', 'distances']
+        current_ids, matrix, documents, metadatas = self._snapshot()
+        positions = {record_id: i for i, record_id in enumerate(current_ids)}
+        rows = [positions[record_id] for record_id in ids if record_id in positions]
+        return _rank(query_embeddings, matrix[rows] if len(matrix) else matrix, [current_ids[i] for i in rows],
+                     [documents[i] for i in rows], [metadatas[i] for i in rows], n_results, include)
+
+def _rank(query_embeddings, matrix: np.ndarray, ids: List[str], documents: List[str],
+          metadatas: List[Dict[str, Any]], n_results: int, include: List[str]) -> Dict[str, Any]:
+    """
+    Classe les lignes d'une matrice normalisée pour chaque requête (résultat au format ChromaDB)
+    """
+    queries = _normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+
+    results = {'ids': []}
+    for field in include:
+        results[field] = []
+
+    n_results = min(n_results, len(ids))
+    scores = queries @ matrix.T if n_results else np.zeros((len(queries), 0), dtype=np.float32)
+    for row in scores:
+        top = np.argpartition(-row, n_results - 1)[:n_results] if n_results else np.array([], dtype=int)
+        top = top[np.argsort(-row[top])]
+        results['ids'].append([ids[i] for i in top])
+        if 'distances' in results:
+            # Distance cosinus, comme une collection ChromaDB "hnsw:space": "cosine"
+            results['distances'].append([float(1 - row[i]) for i in top])
+        if 'documents' in results:
+            results['documents'].append([documents[i] for i in top])
+        if 'metadatas' in results:
+            results['metadatas'].append([metadatas[i] for i in top])
+        if 'embeddings' in results:
+            results['embeddings'].append([matrix[i].tolist() for i in top])
+    return results
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True) if len(vectors) else 1
+    return vectors / np.where(norms == 0, 1, norms)
+
+def open_vector_backend(collection, backend: Optional[str] = None) -> VectorBackend:
+    """
+    Enveloppe une collection ChromaDB dans le backend configuré
+
+    Args:
+        collection: Collection ChromaDB
+        backend: 'chroma' ou 'numpy' (VECTOR_BACKEND, 'chroma' par défaut)
+
+    Returns:
+        Backend exposant l'interface d'une collection
+    """
+    backend = (backend or os.getenv('VECTOR_BACKEND', 'chroma')).lower()
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Backend vectoriel inconnu: {backend} (attendu: {', '.join(VECTOR_BACKENDS)})")
+
+    if isinstance(collection, VectorBackend):
+        collection = collection.chroma_collection
+    if backend == 'numpy':
+        return NumpyBackend(collection)
+    return VectorBackend(collection)